@@ -0,0 +1,235 @@
+"""
+Background Analysis Loop
+One thread keeps analyzing the newest camera frame and publishes the
+latest result together with its frame sequence number. Requests read that
+result instead of running capture + inference themselves, so their latency
+no longer depends on model latency. Frames that arrive while an analysis
+is running are dropped, never queued - the next analysis always starts on
+the freshest frame.
+
+Callers name the attribute actions they need; the loop runs the union of
+the actions asked for recently (plus those of open streams), so a display
+polling only for emotion never pays for the age and gender models.
+
+The loop stops after ANALYSIS_IDLE_SECONDS without readers and restarts on
+the next request.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_IDLE_SECONDS = float(os.environ.get('ANALYSIS_IDLE_SECONDS', '30.0'))
+
+
+class AnalysisResult:
+    """Analysis of one frame"""
+
+    __slots__ = ('seq', 'analysis', 'actions', 'frame_timestamp', 'timestamp')
+
+    def __init__(self, seq, analysis, actions, frame_timestamp, timestamp):
+        self.seq = seq
+        self.analysis = analysis
+        self.actions = frozenset(actions)
+        self.frame_timestamp = frame_timestamp
+        self.timestamp = timestamp
+
+    def age_ms(self, now=None):
+        """Milliseconds since the analyzed frame was captured"""
+        now = time.monotonic() if now is None else now
+        return int((now - self.frame_timestamp) * 1000)
+
+
+class AnalysisLoop:
+    """Continuously analyze the freshest frame and publish the latest result"""
+
+    def __init__(self, get_frame, analyze, default_actions, idle_timeout=ANALYSIS_IDLE_SECONDS,
+                 name='analysis-loop'):
+        """
+        Initialize the loop
+
+        Args:
+            get_frame: Callable(after_seq, timeout) returning the newest
+                grabber Frame newer than after_seq, or None
+            analyze: Callable(frame, actions) returning the analysis dict
+            default_actions: Actions of readers that do not name any
+            idle_timeout: Seconds without readers before the loop stops
+                (also how long a reader's actions stay in the union)
+            name: Name of the analysis thread
+        """
+        self._get_frame = get_frame
+        self._analyze = analyze
+        self.default_actions = tuple(default_actions)
+        self.idle_timeout = idle_timeout
+        self._name = name
+        self._requested = {}
+        self._subscribers = Counter()
+
+        self._condition = threading.Condition()
+        self._latest = None
+        self._thread = None
+        self._running = False
+        self._last_access = time.monotonic()
+
+        self.analyzed = 0
+        self.dropped = 0
+        self._analyze_seconds = 0.0
+
+    def _ensure_running(self):
+        """Start the loop if needed; returns True if it was already running"""
+        with self._condition:
+            self._last_access = time.monotonic()
+            if self._running:
+                return True
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+        logger.info("🔄 Analysis loop started")
+        return False
+
+    def _idle(self):
+        with self._condition:
+            if self._subscribers:
+                return False
+            return time.monotonic() - self._last_access > self.idle_timeout
+
+    def _request(self, actions):
+        with self._condition:
+            now = time.monotonic()
+            for action in actions:
+                self._requested[action] = now
+
+    def active_actions(self):
+        """Union of the actions readers asked for recently and open streams"""
+        with self._condition:
+            now = time.monotonic()
+            active = {a for a, t in self._requested.items() if now - t <= self.idle_timeout}
+            active.update(a for a, count in self._subscribers.items() if count > 0)
+        ordered = [a for a in self.default_actions if a in active]
+        return tuple(ordered + sorted(active - set(ordered)))
+
+    def subscribe(self, actions=None):
+        """Keep the loop running with these actions until unsubscribe()"""
+        with self._condition:
+            self._subscribers.update(actions or self.default_actions)
+        self._ensure_running()
+
+    def unsubscribe(self, actions=None):
+        with self._condition:
+            self._subscribers.subtract(actions or self.default_actions)
+            self._subscribers += Counter()
+            self._last_access = time.monotonic()
+
+    def _run(self):
+        last_seq = self._latest.seq if self._latest else 0
+
+        while self._running and not self._idle():
+            try:
+                frame = self._get_frame(last_seq, 1.0)
+                if frame is None:
+                    time.sleep(0.1)
+                    continue
+
+                # Everything captured since the last analysis is skipped
+                if last_seq:
+                    self.dropped += max(0, frame.seq - last_seq - 1)
+                last_seq = frame.seq
+
+                actions = self.active_actions() or self.default_actions
+                start = time.perf_counter()
+                analysis = self._analyze(frame, actions)
+                self._analyze_seconds += time.perf_counter() - start
+                self.analyzed += 1
+
+                self._publish(AnalysisResult(frame.seq, analysis, actions,
+                                             frame.timestamp, time.monotonic()))
+
+            except Exception as e:
+                logger.error(f"❌ Analysis loop error: {e}")
+                time.sleep(1)
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        logger.info("🔄 Analysis loop idle - stopped")
+
+    def _publish(self, result):
+        with self._condition:
+            self._latest = result
+            self._condition.notify_all()
+
+    def reset(self):
+        """Drop the latest result (the camera restarted; it no longer shows the scene)"""
+        with self._condition:
+            self._latest = None
+
+    def stop(self):
+        """Stop the analysis thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(2.0)
+
+    def peek(self):
+        """Newest result, without waiting, starting the loop or registering actions"""
+        return self._latest
+
+    def latest(self, max_age_ms=None, timeout=2.0, actions=None):
+        """
+        Get the freshest analysis
+
+        Args:
+            max_age_ms: Wait until the analyzed frame is at most this old
+                and covers all actions (None = return whatever is there
+                right away; only the very first result is waited for)
+            timeout: Maximum seconds to wait for a first / fresher result
+            actions: Actions the next analyses should run (default_actions
+                if None)
+
+        Returns:
+            The newest AnalysisResult - possibly older than max_age_ms or
+            missing some actions if nothing better arrived in time - or
+            None if there is none yet
+        """
+        actions = tuple(actions or self.default_actions)
+        self._request(actions)
+        was_running = self._ensure_running()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if max_age_ms is None and self._latest is not None:
+                return self._latest
+            stale_seq = self._latest.seq if self._latest and not was_running else 0
+            while True:
+                latest = self._latest
+                fresh = (
+                    latest is not None
+                    and latest.seq > stale_seq
+                    and latest.actions.issuperset(actions)
+                    and (max_age_ms is None or latest.age_ms() <= max_age_ms)
+                )
+                if fresh:
+                    return latest
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return latest
+                self._condition.wait(remaining)
+
+    def stats(self):
+        """Counters for status endpoints"""
+        latest = self._latest
+        return {
+            'running': self._running,
+            'analyzed': self.analyzed,
+            'dropped_frames': self.dropped,
+            'avg_analysis_ms': round(self._analyze_seconds / self.analyzed * 1000, 1)
+            if self.analyzed else None,
+            'actions': list(self.active_actions()),
+            'subscribers': sum(self._subscribers.values()),
+            'latest_seq': latest.seq if latest else None,
+            'latest_age_ms': latest.age_ms() if latest else None
+        }
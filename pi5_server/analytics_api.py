@@ -0,0 +1,243 @@
+"""
+Visitor Analytics API
+The analytics both servers share: visitor rollups, the dwell and tap
+heatmaps and visit tracking, their Firebase listeners and the endpoints
+that serve them, registered as one Flask Blueprint:
+
+- GET  /api/analytics/rollups   visitor / demographic rollups
+- GET  /api/analytics/dwell     face-position dwell heatmap
+- GET  /api/visits              visits in progress, recent visits, counters
+- GET  /api/visits/history      closed visits (only with a DetectionStore)
+- POST /api/heatmap/points      ingest kiosk taps
+- GET  /api/heatmap             pre-binned tap grid of one page
+- GET  /api/heatmap/pages       pages with taps
+
+Errors are JSON {'success': False, 'error': ...} with a 4xx/5xx status.
+"""
+
+import logging
+import sqlite3
+import time
+
+from flask import Blueprint, Response, jsonify, request
+
+from analytics_rollups import AnalyticsRollups, parse_time
+from click_heatmap import ClickHeatmap
+from dwell_heatmap import DwellHeatmap
+from visits import VisitTracker
+
+logger = logging.getLogger(__name__)
+
+
+def _error(message, status):
+    return jsonify({'success': False, 'error': message}), status
+
+
+class VisitorAnalytics:
+    """Rollups, heatmaps and visits of one server plus their API"""
+
+    def __init__(self, publisher, firebase_enabled, store=None):
+        """
+        Initialize the analytics (each part reloads its own saved state)
+
+        Args:
+            publisher: FirebasePublisher for rollups and visit events
+            firebase_enabled: Callable returning True once Firebase is
+                configured; nothing is published before that
+            store: Optional DetectionStore that keeps closed visits
+        """
+        self.publisher = publisher
+        self.firebase_enabled = firebase_enabled
+        self.store = store
+
+        # Closed hours and days go upstream instead of raw detections
+        self.rollups = AnalyticsRollups()
+        self.rollups.add_listener(self._on_rollup)
+
+        # Where visitors stand (face-box centres weighted by time), kept on-device
+        self.dwell = DwellHeatmap()
+
+        # Kiosk taps binned per page; the dashboard reads grids instead of every tap
+        self.clicks = ClickHeatmap()
+
+        # Face tracks become visits; enter / exit events and counters go upstream
+        self.visits = VisitTracker()
+        self.visits.add_listener(self._on_visit)
+
+        self.blueprint = self._create_blueprint()
+
+    # ---------- pipeline ----------
+
+    def record(self, faces, frame_size):
+        """Feed the tracked faces of one analyzed frame"""
+        if faces:
+            self.rollups.record(faces)
+        self.dwell.record(faces, frame_size)
+        self.visits.observe(faces)
+
+    def tick(self):
+        """Close timed-out visits and finished rollup buckets (call periodically)"""
+        self.visits.expire()
+        self.rollups.tick()
+
+    def save(self):
+        """Persist rollups and heatmaps (on shutdown)"""
+        self.rollups.save()
+        self.dwell.save()
+        self.clicks.save()
+
+    def _on_rollup(self, resolution, summary):
+        if self.firebase_enabled():
+            self.publisher.publish(f"analytics/{resolution}/{summary['key']}", summary)
+
+    def _on_visit(self, event, visit):
+        """Store closed visits; publish every event under its own key plus the counters"""
+        if event == 'exit' and self.store is not None:
+            self.store.add_visit(visit)
+        if not self.firebase_enabled():
+            return
+        # Keyed by enter time too: visit ids start over when the server restarts
+        key = f"visits/events/{visit['enter']}_{visit['visit_id']}_{event}"
+        self.publisher.publish(key, {'event': event, **visit})
+        self.publisher.publish('visits/counters', self.visits.counters())
+
+    # ---------- endpoints ----------
+
+    def _create_blueprint(self):
+        blueprint = Blueprint('analytics', __name__)
+        rollups, dwell, clicks, visits, store = (
+            self.rollups, self.dwell, self.clicks, self.visits, self.store
+        )
+
+        @blueprint.route('/api/analytics/rollups', methods=['GET'])
+        def analytics_rollups():
+            """
+            Visitor and demographic rollups
+
+            ?resolution=minute|hour|day (default hour), ?since= / ?until= in epoch
+            ms or ISO time, ?limit= buckets back from until when since is omitted
+            """
+            try:
+                result = rollups.query(
+                    request.args.get('resolution', 'hour'),
+                    parse_time(request.args.get('since')),
+                    parse_time(request.args.get('until')),
+                    request.args.get('limit', type=int)
+                )
+            except ValueError as e:
+                return _error(str(e), 400)
+            return jsonify(result)
+
+        @blueprint.route('/api/analytics/dwell', methods=['GET'])
+        def analytics_dwell():
+            """
+            Face-position dwell heatmap (face-seconds per grid cell)
+
+            Live decaying grid by default, or the hourly snapshot containing ?at=
+            (epoch ms or ISO time). ?format=png (default, ?width= to scale) | json | npy
+            """
+            try:
+                at = parse_time(request.args.get('at'))
+            except ValueError as e:
+                return _error(f"Invalid at: {e}", 400)
+            grid, start = dwell.grid(at)
+            if grid is None:
+                return _error('No snapshot for that hour', 404)
+
+            fmt = request.args.get('format', 'png')
+            headers = {'X-Dwell-Start': str(int(start * 1000))} if start is not None else {}
+            if fmt == 'png':
+                width = min(request.args.get('width', type=int) or 0, 1920) or None
+                return Response(DwellHeatmap.to_png(grid, width), mimetype='image/png', headers=headers)
+            if fmt == 'npy':
+                return Response(DwellHeatmap.to_npy(grid), mimetype='application/octet-stream',
+                                headers=headers)
+            if fmt == 'json':
+                return jsonify({
+                    **DwellHeatmap.to_dict(grid),
+                    'start': int(start * 1000) if start is not None else None,
+                    'snapshots': [int(t * 1000) for t in dwell.snapshot_times()]
+                })
+            return _error(f"Unknown format '{fmt}'", 400)
+
+        @blueprint.route('/api/visits', methods=['GET'])
+        def get_visits():
+            """
+            Visits in progress, recently closed visits (newest first, ?limit=) and
+            rolling visit / dwell counters
+            """
+            return jsonify({
+                'current': visits.current(),
+                'recent': visits.recent(request.args.get('limit', 20, type=int)),
+                'counters': visits.counters(),
+                **visits.stats(),
+                'timestamp': int(time.time() * 1000)
+            })
+
+        if store is not None:
+            @blueprint.route('/api/visits/history', methods=['GET'])
+            def get_visit_history():
+                """Closed visits (by exit time), paged like /api/face/history"""
+                try:
+                    page = store.visits(
+                        since=request.args.get('since', type=int),
+                        until=parse_time(request.args.get('until')),
+                        limit=request.args.get('limit', 50, type=int)
+                    )
+                except ValueError as e:
+                    return _error(f"Invalid until: {e}", 400)
+                except sqlite3.Error as e:
+                    logger.error(f"❌ Detection store read failed: {e}")
+                    return _error('History unavailable', 503)
+                return jsonify(page)
+
+        @blueprint.route('/api/heatmap/points', methods=['POST'])
+        def add_heatmap_points():
+            """
+            Bin a batch of kiosk taps
+
+            Body: {"points": [{"x": 12.5, "y": 40, "page": "career-it",
+            "timestamp": <epoch ms or ISO>}, ...]} (or the bare list); x / y in
+            percent of the screen
+            """
+            data = request.get_json(silent=True)
+            points = data.get('points') if isinstance(data, dict) else data
+            if not isinstance(points, list):
+                return _error('Expected a list of points', 400)
+            try:
+                accepted, rejected = clicks.add_points(points)
+            except ValueError as e:
+                return _error(str(e), 413)
+            return jsonify({'success': True, 'accepted': accepted, 'rejected': rejected})
+
+        @blueprint.route('/api/heatmap', methods=['GET'])
+        def get_heatmap():
+            """
+            Pre-binned tap grid of one page (?page=, default every page)
+
+            ?resolution= cells per side (see /api/heatmap/pages), ?since= /
+            ?until= in epoch ms or ISO time; all-time counts without them
+            """
+            try:
+                result = clicks.query(
+                    request.args.get('page', '*'),
+                    request.args.get('resolution', type=int),
+                    parse_time(request.args.get('since')),
+                    parse_time(request.args.get('until'))
+                )
+            except ValueError as e:
+                return _error(str(e), 400)
+            except KeyError:
+                return _error('Unknown page', 404)
+            return jsonify(result)
+
+        @blueprint.route('/api/heatmap/pages', methods=['GET'])
+        def get_heatmap_pages():
+            """Pages with taps, the available resolutions and ingestion counters"""
+            return jsonify({
+                'pages': clicks.page_summaries(),
+                'resolutions': clicks.resolutions(),
+                'ingest': clicks.stats()
+            })
+
+        return blueprint
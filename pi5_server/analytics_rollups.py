@@ -0,0 +1,363 @@
+"""
+Analytics Rollups
+Per-minute, per-hour and per-day aggregates of the detection stream,
+updated incrementally as detections arrive: detections, faces, peak faces,
+unique tracks and age-bucket / gender / emotion histograms.
+
+Each resolution is a ring of fixed-size NumPy arrays indexed by bucket
+number, so memory stays constant and a dashboard query costs O(buckets)
+however many detections went in. Age, gender and emotion count once per
+track and bucket (the first value analyzed for it).
+
+Closed hour and day buckets are handed to listeners (the servers publish
+them to Firebase instead of raw detections) and the rings are saved to
+ROLLUP_PATH so a restart keeps the history. Buckets close on the first
+frame after their end, or on tick() when no frames arrive.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from attribute_models import EMOTION_LABELS, GENDER_LABELS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROLLUP_PATH = os.environ.get('ROLLUP_PATH', os.path.join(BASE_DIR, 'rollups.npz'))
+
+# name -> (bucket seconds, buckets kept)
+RESOLUTIONS = {
+    'minute': (60, int(os.environ.get('ROLLUP_MINUTES', '1440'))),
+    'hour': (3600, int(os.environ.get('ROLLUP_HOURS', '336'))),
+    'day': (86400, int(os.environ.get('ROLLUP_DAYS', '400'))),
+}
+DEFAULT_LIMITS = {'minute': 60, 'hour': 24, 'day': 30}
+
+AGE_EDGES = (13, 18, 25, 35, 45, 55, 65)
+AGE_LABELS = ('0-12', '13-17', '18-24', '25-34', '35-44', '45-54', '55-64', '65+')
+GENDERS = tuple(g.capitalize() for g in GENDER_LABELS)
+EMOTIONS = tuple(e.capitalize() for e in EMOTION_LABELS)
+
+COUNTERS = ('detections', 'faces', 'max_faces', 'unique_tracks')
+HISTOGRAMS = {'age': AGE_LABELS, 'gender': GENDERS, 'emotion': EMOTIONS}
+
+
+def local_utc_offset():
+    """Seconds east of UTC, so day buckets start at local midnight"""
+    return time.localtime().tm_gmtoff
+
+
+def parse_time(value):
+    """
+    Query-string time (?since= / ?until= / ?at=) as Unix seconds
+
+    Args:
+        value: Epoch ms or an ISO 8601 time; empty or None gives None
+
+    Raises:
+        ValueError: Neither a finite number nor an ISO time
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value) / 1000
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    if not math.isfinite(seconds):
+        raise ValueError(f"Time {value} is not finite")
+    return seconds
+
+
+class RollupSeries:
+    """Ring of fixed-size buckets for one resolution"""
+
+    def __init__(self, name, bucket_seconds, size, utc_offset=0):
+        self.name = name
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.utc_offset = utc_offset
+
+        self.ids = np.full(size, -1, np.int64)
+        self.counters = {name: np.zeros(size, np.int64) for name in COUNTERS}
+        self.histograms = {name: np.zeros((size, len(labels)), np.int64)
+                           for name, labels in HISTOGRAMS.items()}
+        self.current = -1
+
+        # Tracks already counted in the current bucket
+        self._tracks = set()
+        self._attributed = set()
+        self._emoted = set()
+
+    def bucket_of(self, timestamp):
+        return int((timestamp + self.utc_offset) // self.bucket_seconds)
+
+    def bucket_start(self, bucket):
+        """Unix time at which a bucket starts"""
+        return bucket * self.bucket_seconds - self.utc_offset
+
+    def _slot(self, bucket):
+        slot = bucket % self.size
+        if self.ids[slot] != bucket:
+            self.ids[slot] = bucket
+            for array in self.counters.values():
+                array[slot] = 0
+            for array in self.histograms.values():
+                array[slot] = 0
+        return slot
+
+    def advance(self, timestamp):
+        """
+        Move the current bucket up to timestamp
+
+        Returns:
+            The bucket this closed (previous current bucket) if it had any
+            frames, else None
+        """
+        bucket = self.bucket_of(timestamp)
+        if bucket <= self.current:
+            return None
+        closed = self.current
+        self.current = bucket
+        self._tracks.clear()
+        self._attributed.clear()
+        self._emoted.clear()
+        if closed >= 0 and self.ids[closed % self.size] == closed:
+            return closed
+        return None
+
+    def record(self, faces, timestamp):
+        """
+        Add one analyzed frame
+
+        Returns:
+            The bucket this frame closed (see advance()), or None
+        """
+        closed = self.advance(timestamp)
+        bucket = self.bucket_of(timestamp)
+        slot = self._slot(bucket)
+        counters, histograms = self.counters, self.histograms
+        counters['detections'][slot] += 1
+        counters['faces'][slot] += len(faces)
+        counters['max_faces'][slot] = max(counters['max_faces'][slot], len(faces))
+
+        for face in faces:
+            track_id = face.get('track_id')
+            if track_id is not None and track_id not in self._tracks:
+                self._tracks.add(track_id)
+                counters['unique_tracks'][slot] += 1
+
+            age, gender = face.get('age'), face.get('gender')
+            if (age is not None or gender) and (track_id is None or track_id not in self._attributed):
+                if track_id is not None:
+                    self._attributed.add(track_id)
+                if age is not None:
+                    histograms['age'][slot, np.searchsorted(AGE_EDGES, age, side='right')] += 1
+                if gender in GENDERS:
+                    histograms['gender'][slot, GENDERS.index(gender)] += 1
+
+            emotion = face.get('emotion')
+            if emotion in EMOTIONS and (track_id is None or track_id not in self._emoted):
+                if track_id is not None:
+                    self._emoted.add(track_id)
+                histograms['emotion'][slot, EMOTIONS.index(emotion)] += 1
+
+        return closed
+
+    def window(self, first, last):
+        """Counters and histograms of buckets first..last (missing ones are zero)"""
+        buckets = np.arange(first, last + 1)
+        slots = buckets % self.size
+        valid = self.ids[slots] == buckets
+        counters = {name: np.where(valid, array[slots], 0) for name, array in self.counters.items()}
+        histograms = {name: np.where(valid[:, np.newaxis], array[slots], 0)
+                      for name, array in self.histograms.items()}
+        return buckets, counters, histograms
+
+    def summary(self, bucket):
+        """One bucket as a plain dict"""
+        _, counters, histograms = self.window(bucket, bucket)
+        start = self.bucket_start(bucket)
+        return {
+            'key': time.strftime('%Y-%m-%dT%H:%M' if self.name == 'minute' else
+                                 '%Y-%m-%dT%H' if self.name == 'hour' else '%Y-%m-%d',
+                                 time.gmtime(start + self.utc_offset)),
+            'start': int(start * 1000),
+            **{name: int(values[0]) for name, values in counters.items()},
+            **{name: dict(zip(HISTOGRAMS[name], (int(v) for v in values[0])))
+               for name, values in histograms.items()}
+        }
+
+
+class AnalyticsRollups:
+    """Minute / hour / day rollups of the detection stream"""
+
+    def __init__(self, path=ROLLUP_PATH, resolutions=RESOLUTIONS, utc_offset=None):
+        """
+        Initialize the rollups (loads saved rings from path if present)
+
+        Args:
+            path: .npz file the rings are saved to (None = memory only)
+            resolutions: {name: (bucket seconds, buckets kept)}
+            utc_offset: Seconds east of UTC for bucket boundaries
+                (default: the local time zone)
+        """
+        self.path = path
+        self.utc_offset = local_utc_offset() if utc_offset is None else utc_offset
+        self.series = {
+            name: RollupSeries(name, seconds, size, self.utc_offset)
+            for name, (seconds, size) in resolutions.items()
+        }
+        self._lock = threading.Lock()
+        # Held across the whole write so saves never share the temp file
+        self._save_lock = threading.Lock()
+        self._listeners = []
+        self.recorded = 0
+        self.load()
+
+    def add_listener(self, func):
+        """Call func(resolution, summary) whenever an hour or day bucket closes"""
+        self._listeners.append(func)
+
+    def record(self, faces, timestamp=None):
+        """
+        Add the faces of one analyzed frame
+
+        Args:
+            faces: Face dicts ('track_id' and, where analyzed, 'age',
+                'gender', 'emotion')
+            timestamp: Unix time of the frame (default now)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        closed = []
+        with self._lock:
+            self.recorded += 1
+            for name, series in self.series.items():
+                bucket = series.record(faces, timestamp)
+                if bucket is not None and name != 'minute':
+                    closed.append((name, series.summary(bucket)))
+        self._closed(closed)
+
+    def tick(self, now=None):
+        """Close hour / day buckets that ended while no frames were recorded"""
+        now = time.time() if now is None else now
+        closed = []
+        with self._lock:
+            for name, series in self.series.items():
+                bucket = series.advance(now)
+                if bucket is not None and name != 'minute':
+                    closed.append((name, series.summary(bucket)))
+        self._closed(closed)
+
+    def _closed(self, closed):
+        for name, summary in closed:
+            for listener in self._listeners:
+                try:
+                    listener(name, summary)
+                except Exception as e:
+                    logger.error(f"❌ Rollup listener error: {e}")
+        if any(name == 'hour' for name, _ in closed):
+            self.save()
+
+    def query(self, resolution='hour', since=None, until=None, limit=None):
+        """
+        Rollups of one resolution, oldest bucket first
+
+        Args:
+            resolution: 'minute', 'hour' or 'day'
+            since: Unix time of the first bucket wanted (default: limit
+                buckets back from until)
+            until: Unix time of the last bucket wanted (default now)
+            limit: Number of buckets when since is not given
+
+        Returns:
+            Columnar dict: 'start' (epoch ms per bucket), one list per
+            counter, {label: list} per histogram and range 'totals'
+
+        Raises:
+            ValueError: Unknown resolution
+        """
+        if resolution not in self.series:
+            raise ValueError(f"Unknown resolution '{resolution}' (choose from {', '.join(self.series)})")
+        series = self.series[resolution]
+
+        # Nothing exists before the epoch or after now
+        now = time.time()
+        until = now if until is None else min(max(until, 0), now)
+        last = series.bucket_of(until)
+        if since is not None:
+            first = series.bucket_of(min(max(since, 0), until))
+        else:
+            first = last - (limit or DEFAULT_LIMITS.get(resolution, 24)) + 1
+        # Only buckets still held by the ring
+        first = max(first, last - series.size + 1)
+        last = max(first, last)
+
+        with self._lock:
+            buckets, counters, histograms = series.window(first, last)
+
+        return {
+            'resolution': resolution,
+            'bucket_seconds': series.bucket_seconds,
+            'start': [int(series.bucket_start(b) * 1000) for b in buckets],
+            **{name: values.tolist() for name, values in counters.items()},
+            **{name: {label: values[:, i].tolist() for i, label in enumerate(HISTOGRAMS[name])}
+               for name, values in histograms.items()},
+            'totals': {
+                'detections': int(counters['detections'].sum()),
+                'faces': int(counters['faces'].sum()),
+                'max_faces': int(counters['max_faces'].max()) if len(buckets) else 0,
+                'unique_tracks': int(counters['unique_tracks'].sum()),
+                **{name: dict(zip(HISTOGRAMS[name], (int(v) for v in values.sum(axis=0))))
+                   for name, values in histograms.items()}
+            }
+        }
+
+    # ---------- persistence ----------
+
+    def save(self):
+        """Write every ring to the .npz file"""
+        if not self.path:
+            return
+        with self._save_lock:
+            arrays = {}
+            with self._lock:
+                for name, series in self.series.items():
+                    arrays[f"{name}.ids"] = series.ids.copy()
+                    for key, array in {**series.counters, **series.histograms}.items():
+                        arrays[f"{name}.{key}"] = array.copy()
+            try:
+                tmp_path = self.path + '.tmp.npz'
+                np.savez_compressed(tmp_path, **arrays)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"❌ Could not save rollups: {e}")
+
+    def load(self):
+        """Restore rings saved by save() (rings whose size changed are skipped)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                for name, series in self.series.items():
+                    ids = saved.get(f"{name}.ids")
+                    if ids is None or ids.shape != series.ids.shape:
+                        continue
+                    series.ids[:] = ids
+                    for key, array in {**series.counters, **series.histograms}.items():
+                        array[:] = saved[f"{name}.{key}"]
+                    series.current = int(ids.max())
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️  Ignoring unreadable rollups {self.path}: {e}")
+
+    def stats(self):
+        return {
+            'recorded': self.recorded,
+            'resolutions': {name: {'bucket_seconds': s.bucket_seconds, 'buckets': s.size}
+                            for name, s in self.series.items()}
+        }
@@ -5,6 +5,8 @@ Communicates with Firebase Realtime Database
 Includes face detection with age, gender, and emotion analysis
 """
 
+# First import: marks process start for the /api/ready startup report
+from warmup import PROCESS_START, Warmup
 from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 import RPi.GPIO as GPIO
@@ -13,10 +15,26 @@ import threading
 import firebase_admin
 from firebase_admin import credentials, db
 import json
+import os
 import cv2
 import numpy as np
 from picamera2 import Picamera2
-from face_analysis import get_face_analyzer
+from face_analysis import get_face_analyzer, mask_attributes, parse_actions
+from attribute_models import ATTRIBUTE_ACTIONS, ATTRIBUTE_BACKEND, shutdown_attribute_models
+from inference_pool import INFERENCE_WORKERS
+from mjpeg_broadcaster import MJPEGBroadcaster
+from frame_grabber import FrameGrabber, PICAMERA_PIXEL_FORMATS
+from analysis_loop import AnalysisLoop
+from motion_gate import MotionGate
+from distance_sensor import UltrasonicRanger
+from presence import PresenceMonitor, PRESENCE_IDLE_MODE, PRESENCE_WATCH_FPS
+from firebase_publisher import FirebasePublisher, LocalRTDB, FIREBASE_LOCAL_DB
+from detection_store import DetectionStore
+from analytics_api import VisitorAnalytics
+
+# TensorFlow / DeepFace are only imported by the models warm-up step
+warmup = Warmup()
+warmup.record_import('server', time.monotonic() - PROCESS_START)
 
 app = Flask(__name__)
 CORS(app)
@@ -36,104 +54,109 @@ GPIO.setup(ECHO_PIN, GPIO.IN)
 led_pwm = GPIO.PWM(LED_PIN, 1000)  # 1kHz frequency
 led_pwm.start(0)  # Start with LED off
 
+# The only code that pulses the HC-SR04; everything else reads its readings
+ranger = UltrasonicRanger(GPIO, PROXIMITY_SENSOR_PIN, ECHO_PIN)
+
+# Camera format: "YUV420" lets detection read the Y plane directly and
+# converts to BGR only for frames that are analyzed or streamed
+CAMERA_SIZE = (640, 480)
+CAMERA_FORMAT = os.environ.get('CAMERA_FORMAT', 'BGR888')
+
+# Time the camera warm-up gives auto-exposure to settle
+CAMERA_SETTLE_SECONDS = float(os.environ.get('CAMERA_SETTLE_SECONDS', '1.0'))
+
 # Global state
 led_status = False
 user_present = False
 camera = None
 camera_initialized = False
+camera_lock = threading.Lock()
+frame_grabber = None
 face_analyzer = None
+motion_gate = MotionGate()
+last_analysis = None
+analysis_lock = threading.Lock()
 
 # Initialize Firebase Admin
+firebase_root = None
 try:
-    cred = credentials.Certificate('firebase-credentials.json')
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://YOUR_PROJECT_ID-default-rtdb.firebaseio.com'
-    })
-    print("✅ Firebase initialized successfully")
+    if FIREBASE_LOCAL_DB:
+        firebase_root = LocalRTDB(FIREBASE_LOCAL_DB)
+        print(f"✅ Using local Firebase stand-in ({FIREBASE_LOCAL_DB})")
+    else:
+        cred = credentials.Certificate('firebase-credentials.json')
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': 'https://YOUR_PROJECT_ID-default-rtdb.firebaseio.com'
+        })
+        firebase_root = db.reference()
+        print("✅ Firebase initialized successfully")
 except Exception as e:
     print(f"⚠️ Firebase initialization failed: {e}")
 
-# Reference to Firebase Realtime Database
-presence_ref = db.reference('presence')
-led_ref = db.reference('led_status')
+# Realtime Database writes go through a background publisher so a slow
+# network never stalls sensing or request handlers
+publisher = FirebasePublisher(firebase_root)
+publisher.start()
 
+# Closed visits persist on-device; see detection_store.py
+store = DetectionStore()
+store.start()
 
-def measure_distance():
-    """Measure distance using HC-SR04 ultrasonic sensor"""
-    # Send trigger pulse
-    GPIO.output(PROXIMITY_SENSOR_PIN, True)
-    time.sleep(0.00001)
-    GPIO.output(PROXIMITY_SENSOR_PIN, False)
-    
-    # Measure echo time
-    pulse_start = time.time()
-    pulse_end = time.time()
-    
-    timeout = time.time() + 0.1  # 100ms timeout
+# Rollups, dwell / tap heatmaps and visits with their /api/analytics,
+# /api/visits and /api/heatmap endpoints (shared with app_imx500.py)
+analytics = VisitorAnalytics(publisher, lambda: firebase_root is not None, store)
+app.register_blueprint(analytics.blueprint)
+
+
+def on_presence_change(state, previous, reason):
+    """LED and Firebase follow the confirmed presence state"""
+    global user_present, led_status
     
-    while GPIO.input(ECHO_PIN) == 0 and time.time() < timeout:
-        pulse_start = time.time()
+    if presence.is_present() == user_present:
+        return
     
-    while GPIO.input(ECHO_PIN) == 1 and time.time() < timeout:
-        pulse_end = time.time()
+    distance = presence.distance
+    if presence.is_present():
+        user_present = True
+        led_status = True
+        led_pwm.ChangeDutyCycle(100)  # Full brightness
+        print(f"👤 User detected at {distance}cm - LED ON")
+    else:
+        user_present = False
+        led_status = False
+        led_pwm.ChangeDutyCycle(0)  # LED off
+        print(f"🚶 User left - LED OFF")
     
-    pulse_duration = pulse_end - pulse_start
-    distance = pulse_duration * 17150  # Speed of sound = 34300 cm/s
-    distance = round(distance, 2)
+    # Update Firebase
+    publisher.publish('presence', {
+        'userPresent': user_present,
+        'distance': distance,
+        'timestamp': int(time.time() * 1000)
+    })
     
-    return distance
+    publisher.publish('led_status', {
+        'enabled': led_status,
+        'timestamp': int(time.time() * 1000)
+    })
 
 
 def check_presence():
-    """Continuously check for user presence"""
-    global user_present, led_status
+    """Feed every distance reading to the presence state machine"""
+    last_seq = 0
     
     while True:
         try:
-            distance = measure_distance()
-            
-            # User is present if distance < 100cm
-            if distance < 100:
-                if not user_present:
-                    user_present = True
-                    led_status = True
-                    led_pwm.ChangeDutyCycle(100)  # Full brightness
-                    
-                    # Update Firebase
-                    presence_ref.set({
-                        'userPresent': True,
-                        'distance': distance,
-                        'timestamp': int(time.time() * 1000)
-                    })
-                    
-                    led_ref.set({
-                        'enabled': True,
-                        'timestamp': int(time.time() * 1000)
-                    })
-                    
-                    print(f"👤 User detected at {distance}cm - LED ON")
-            
-            else:
-                if user_present:
-                    user_present = False
-                    led_status = False
-                    led_pwm.ChangeDutyCycle(0)  # LED off
-                    
-                    # Update Firebase
-                    presence_ref.set({
-                        'userPresent': False,
-                        'distance': distance,
-                        'timestamp': int(time.time() * 1000)
-                    })
-                    
-                    led_ref.set({
-                        'enabled': False,
-                        'timestamp': int(time.time() * 1000)
-                    })
-                    
-                    print(f"🚶 User left - LED OFF")
+            reading = ranger.wait_for_reading(last_seq, 1.0)
+            if reading is None:
+                # No ranging - faces alone drive presence, timeouts still apply
+                presence.evaluate()
+                analytics.tick()
+                time.sleep(0.5)
+                continue
             
-            time.sleep(0.5)  # Check every 0.5 seconds
+            last_seq = reading.seq
+            presence.update_distance(reading.distance, reading.timestamp)
+            analytics.tick()
             
         except Exception as e:
             print(f"❌ Error in presence check: {e}")
@@ -156,6 +179,19 @@ def get_status():
     return jsonify({
         'led_status': led_status,
         'user_present': user_present,
+        'presence_state': presence.state,
+        'firebase': publisher.stats(),
+        'store': store.stats(),
+        'timestamp': int(time.time() * 1000)
+    })
+
+
+@app.route('/api/presence')
+def get_presence():
+    """Presence state, transition timings and pipeline resume latencies"""
+    return jsonify({
+        **presence.stats(),
+        'sensor': ranger.stats(),
         'timestamp': int(time.time() * 1000)
     })
 
@@ -177,7 +213,7 @@ def control_led():
         led_pwm.ChangeDutyCycle(0)
     
     # Update Firebase
-    led_ref.set({
+    publisher.publish('led_status', {
         'enabled': enabled,
         'brightness': brightness,
         'timestamp': int(time.time() * 1000)
@@ -192,10 +228,19 @@ def control_led():
 
 @app.route('/api/distance')
 def get_distance():
-    """Get current distance measurement"""
-    distance = measure_distance()
+    """Get the latest filtered distance reading (does not pulse the sensor)"""
+    reading = ranger.latest()
+    if reading is None:
+        return jsonify({
+            'distance': None,
+            'unit': 'cm',
+            'error': 'No distance reading yet',
+            'sensor': ranger.stats(),
+            'timestamp': int(time.time() * 1000)
+        }), 503
+    
     return jsonify({
-        'distance': distance,
+        **reading.to_dict(),
         'unit': 'cm',
         'timestamp': int(time.time() * 1000)
     })
@@ -205,38 +250,206 @@ def get_distance():
 
 def init_camera():
     """Initialize Pi Camera"""
-    global camera, camera_initialized, face_analyzer
+    global camera, camera_initialized, frame_grabber
     
-    try:
-        if camera_initialized:
+    with camera_lock:
+        try:
+            if camera_initialized:
+                return True
+            
+            print("📷 Initializing Pi Camera...")
+            camera = Picamera2()
+            
+            # Configure camera for face detection
+            config = camera.create_still_configuration(
+                main={"size": CAMERA_SIZE, "format": CAMERA_FORMAT},
+                lores={"size": (320, 240)},
+                display="lores"
+            )
+            camera.configure(config)
+            camera.start()
+            
+            # Single capture thread owns the camera from here on
+            # Sequence numbers continue across restarts (PRESENCE_IDLE_MODE=off)
+            frame_grabber = FrameGrabber(
+                camera.capture_array,
+                pixel_format=PICAMERA_PIXEL_FORMATS[CAMERA_FORMAT],
+                size=CAMERA_SIZE,
+                first_seq=frame_grabber.seq if frame_grabber else 0
+            )
+            frame_grabber.start()
+            camera_initialized = True
+            print("✅ Pi Camera initialized successfully")
             return True
-        
-        print("📷 Initializing Pi Camera...")
-        camera = Picamera2()
-        
-        # Configure camera for face detection
-        config = camera.create_still_configuration(
-            main={"size": (640, 480)},
-            lores={"size": (320, 240)},
-            display="lores"
-        )
-        camera.configure(config)
-        camera.start()
-        
-        # Wait for camera to warm up
-        time.sleep(2)
-        
-        # Initialize face analyzer
+            
+        except Exception as e:
+            print(f"❌ Camera initialization error: {e}")
+            camera_initialized = False
+            return False
+
+
+def warm_camera():
+    """Warm-up step: start the camera and let auto-exposure settle"""
+    if not init_camera():
+        return False
+    
+    # The grab thread keeps frames flowing while exposure settles
+    time.sleep(CAMERA_SETTLE_SECONDS)
+    return get_latest_frame() is not None
+
+
+def warm_models():
+    """Warm-up step: import TensorFlow / DeepFace and run every model once"""
+    global face_analyzer
+    
+    # With inference workers TensorFlow lives only in the worker processes,
+    # and the TFLite / ONNX backends do not need it at all
+    if INFERENCE_WORKERS == 0 and ATTRIBUTE_BACKEND == 'deepface':
+        warmup.timed_import('tensorflow')
+        warmup.timed_import('deepface.DeepFace')
+    analyzer = get_face_analyzer()
+    analyzer.warm_up()
+    face_analyzer = analyzer
+
+
+warmup.add('camera', warm_camera)
+warmup.add('models', warm_models)
+
+
+def stop_camera():
+    """Stop the grab thread and release the camera"""
+    global camera, camera_initialized
+    
+    with camera_lock:
+        if not camera_initialized:
+            return
+        camera_initialized = False
+        if frame_grabber:
+            frame_grabber.stop()
+        try:
+            camera.stop()
+            camera.close()
+        except Exception as e:
+            print(f"⚠️ Camera stop error: {e}")
+        camera = None
+        print("📷 Camera stopped")
+
+
+def sleep_pipeline():
+    """Nobody near: capture at the watch rate, or stop the camera"""
+    if warmup.state('camera') != 'ready':
+        return False
+    
+    if PRESENCE_IDLE_MODE == 'off':
+        stop_camera()
+    elif frame_grabber:
+        frame_grabber.set_max_fps(PRESENCE_WATCH_FPS)
+
+
+def reset_pipeline():
+    """Forget tracks and results from before the camera was stopped"""
+    global last_analysis
+    
+    with analysis_lock:
+        last_analysis = None
+        if face_analyzer:
+            face_analyzer.tracker.reset()
+    analysis_loop.reset()
+    face_broadcaster.reset()
+
+
+def wake_pipeline():
+    """Someone approaching: full rate again; returns once a full-rate frame arrived"""
+    latest = frame_grabber.latest() if camera_initialized and frame_grabber else None
+    if not camera_initialized:
+        reset_pipeline()
+        init_camera()
+    elif frame_grabber:
+        frame_grabber.set_max_fps(None)
+    get_latest_frame(latest.seq if latest else 0, 2.0)
+
+
+# Duty-cycles the camera pipeline with presence; see presence.py
+presence = PresenceMonitor(wake=wake_pipeline, sleep=sleep_pipeline)
+presence.add_listener(on_presence_change)
+
+
+def camera_may_start():
+    """
+    Whether a request handler should start a stopped camera: not while the
+    warm-up is starting it and not while presence keeps the pipeline
+    asleep (PRESENCE_IDLE_MODE=off) - the presence wake path does that
+    """
+    return not camera_initialized and warmup.state('camera') != 'warming' and presence.awake
+
+
+def get_analyzer():
+    """Face analyzer, created on demand if the warm-up did not provide it"""
+    global face_analyzer
+    if face_analyzer is None:
         face_analyzer = get_face_analyzer()
+    return face_analyzer
+
+
+def warming_up(*names):
+    """503 response while any of the subsystems is still warming up, else None"""
+    warming = [name for name in names if warmup.state(name) == 'warming']
+    if not warming:
+        return None
+    
+    response = jsonify({
+        'success': False,
+        'error': f"Warming up: {', '.join(warming)}",
+        'ready': False
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def get_latest_frame(after_seq=0, timeout=1.0):
+    """Get the newest frame from the grab thread (None if unavailable)"""
+    if not camera_initialized or frame_grabber is None:
+        return None
+    return frame_grabber.wait_for_frame(after_seq, timeout)
+
+
+def analyze_camera_frame(frame, actions=ATTRIBUTE_ACTIONS):
+    """
+    Detect and analyze faces in a camera frame
+    
+    While the scene is static the motion gate skips detection and DeepFace
+    and the previous analysis is returned again (if it covers the actions).
+    """
+    global last_analysis
+    
+    with analysis_lock:
+        moving, motion_score = motion_gate.update(frame)
         
-        camera_initialized = True
-        print("✅ Pi Camera initialized successfully")
-        return True
+        reusable = (
+            last_analysis is not None
+            and set(actions).issubset(last_analysis.get('actions', ()))
+        )
+        if not moving and reusable:
+            analysis = dict(last_analysis)
+            analysis['motion_skipped'] = True
+        else:
+            analysis = get_analyzer().analyze_frame_with_detection(frame, actions)
+            analysis['motion_skipped'] = False
+            last_analysis = analysis
         
-    except Exception as e:
-        print(f"❌ Camera initialization error: {e}")
-        camera_initialized = False
-        return False
+        analysis['motion_score'] = motion_score
+    
+    # Faces keep a visitor present beyond the ultrasonic range
+    presence.observe_faces(analysis.get('faces_detected', 0), frame.timestamp)
+    analytics.record(analysis.get('faces') or [], frame.size)
+    return analysis
+
+
+# One background loop analyzes the freshest frame; requests read its result
+analysis_loop = AnalysisLoop(get_latest_frame, analyze_camera_frame, ATTRIBUTE_ACTIONS)
+
+# Longest a /api/face/detect request waits (first result or ?max_age_ms=)
+ANALYSIS_MAX_WAIT = 5.0
 
 
 @app.route('/api/camera/status')
@@ -245,10 +458,23 @@ def camera_status():
     return jsonify({
         'initialized': camera_initialized,
         'available': camera is not None,
+        'grabber': frame_grabber.stats() if frame_grabber else None,
+        'analysis': analysis_loop.stats(),
+        'motion': motion_gate.stats(),
+        'attributes': face_analyzer.attribute_cache.stats() if face_analyzer else None,
+        'inference': face_analyzer.attribute_models.stats()
+        if face_analyzer and hasattr(face_analyzer.attribute_models, 'stats') else None,
         'timestamp': int(time.time() * 1000)
     })
 
 
+@app.route('/api/ready')
+def readiness():
+    """Warm-up state of every subsystem plus import / startup timings"""
+    report = warmup.report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+
 @app.route('/api/camera/init', methods=['POST'])
 def initialize_camera():
     """Initialize camera endpoint"""
@@ -264,31 +490,56 @@ def initialize_camera():
 def detect_face():
     """
     Detect faces and analyze age, gender, emotion
-    Returns JSON with face analysis results
+    Returns JSON with the latest face analysis results right away;
+    ?max_age_ms= waits (bounded) for a result from a fresher frame,
+    ?actions=emotion,age limits the models that run (attributes of other
+    actions are null, even if the shared loop computed them for others)
     """
-    global camera, camera_initialized, face_analyzer
+    try:
+        actions = parse_actions(request.args.get('actions'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    if not camera_initialized:
+    not_ready = warming_up('camera', 'models')
+    if not_ready:
+        return not_ready
+    
+    if camera_may_start():
         init_camera()
     
     if not camera_initialized:
+        if not presence.awake:
+            response = jsonify({
+                'success': False,
+                'error': 'Camera asleep (nobody near the kiosk)'
+            })
+            response.headers['Retry-After'] = '1'
+            return response, 503
         return jsonify({
             'success': False,
             'error': 'Camera not initialized'
         }), 500
     
     try:
-        # Capture frame
-        frame = camera.capture_array()
+        # Latest result of the background analysis loop
+        result = analysis_loop.latest(request.args.get('max_age_ms', type=float),
+                                      ANALYSIS_MAX_WAIT, actions)
         
-        # Convert RGB to BGR for OpenCV
-        frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        if result is None:
+            response = jsonify({
+                'success': False,
+                'error': 'No analysis available yet'
+            })
+            response.headers['Retry-After'] = '1'
+            return response, 503
         
-        # Analyze face
-        analysis = face_analyzer.analyze_frame_with_detection(frame_bgr)
+        analysis = result.analysis
         
         if not analysis.get('success'):
-            return jsonify(analysis), 200
+            return jsonify(dict(analysis, frame_seq=result.seq, age_ms=result.age_ms())), 200
+        
+        # The loop runs the union of every reader's actions - return only ours
+        analysis = mask_attributes(analysis, actions)
         
         # Return analysis results
         return jsonify({
@@ -302,6 +553,11 @@ def detect_face():
             'all_emotions': analysis.get('all_emotions', {}),
             'confidence': analysis.get('confidence', {}),
             'face_regions': analysis.get('face_regions', []),
+            'faces': [mask_attributes(face, actions) for face in analysis.get('faces', [])],
+            'actions': list(actions),
+            'motion_score': analysis.get('motion_score'),
+            'frame_seq': result.seq,
+            'age_ms': result.age_ms(),
             'timestamp': int(time.time() * 1000)
         })
         
@@ -313,46 +569,59 @@ def detect_face():
         }), 500
 
 
+def produce_face_frame(last_seq):
+    """Annotate the next frame for the broadcaster with the latest analysis"""
+    frame = get_latest_frame(last_seq)
+    if frame is None:
+        # The broadcaster backs off (NO_FRAME_BACKOFF) before asking again
+        return None
+    
+    # Overlay whatever the analysis loop has finished most recently
+    result = None if warmup.state('models') == 'warming' else analysis_loop.peek()
+    analysis = result.analysis if result else {}
+    
+    frame_bgr = frame.bgr()
+    if analysis.get('success'):
+        # The cached BGR image is shared with the analysis loop - draw on a copy
+        frame_bgr = get_analyzer().draw_analysis_on_frame(frame_bgr.copy(), analysis)
+    
+    return frame.seq, frame_bgr, analysis
+
+
+# Every /api/face/stream client shares one analyze + encode pipeline
+face_broadcaster = MJPEGBroadcaster(produce_face_frame, fps=10)
+
+
+def subscribed_stream(stream, actions):
+    """Keep the analysis loop running a stream's actions while it is open"""
+    analysis_loop.subscribe(actions)
+    try:
+        yield from stream
+    finally:
+        analysis_loop.unsubscribe(actions)
+
+
 @app.route('/api/face/stream')
 def face_stream():
     """
     Stream video with face detection overlay
-    Returns MJPEG stream
+    Returns MJPEG stream (?w=&fps=&q= scale / rate-limit per client,
+    ?actions= attributes to overlay - open streams share one overlay)
     """
-    def generate():
-        global camera, camera_initialized, face_analyzer
-        
-        if not camera_initialized:
-            init_camera()
-        
-        while camera_initialized:
-            try:
-                # Capture frame
-                frame = camera.capture_array()
-                
-                # Convert RGB to BGR for OpenCV
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                
-                # Analyze and draw on frame
-                analysis = face_analyzer.analyze_frame_with_detection(frame_bgr)
-                
-                if analysis.get('success'):
-                    frame_bgr = face_analyzer.draw_analysis_on_frame(frame_bgr, analysis)
-                
-                # Encode frame to JPEG
-                ret, buffer = cv2.imencode('.jpg', frame_bgr)
-                frame_bytes = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-                time.sleep(0.1)  # 10 FPS
-                
-            except Exception as e:
-                print(f"❌ Stream error: {e}")
-                break
-    
-    return Response(generate(),
+    try:
+        actions = parse_actions(request.args.get('actions'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if camera_may_start():
+        init_camera()
+    
+    stream = face_broadcaster.stream(
+        request.args.get('w', type=int),
+        request.args.get('fps', type=float),
+        request.args.get('q', type=int)
+    )
+    return Response(subscribed_stream(stream, actions),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
@@ -360,8 +629,17 @@ def face_stream():
 def analyze_uploaded_face():
     """
     Analyze face from uploaded image
-    Expects multipart/form-data with 'image' field
+    Expects multipart/form-data with 'image' field (?actions= as above)
     """
+    try:
+        actions = parse_actions(request.args.get('actions'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    not_ready = warming_up('models')
+    if not_ready:
+        return not_ready
+    
     try:
         if 'image' not in request.files:
             return jsonify({
@@ -376,13 +654,8 @@ def analyze_uploaded_face():
         nparr = np.frombuffer(image_bytes, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        # Initialize face analyzer if needed
-        global face_analyzer
-        if face_analyzer is None:
-            face_analyzer = get_face_analyzer()
-        
         # Analyze face
-        analysis = face_analyzer.analyze_frame_with_detection(frame)
+        analysis = get_analyzer().analyze_frame_with_detection(frame, actions)
         
         if not analysis.get('success'):
             return jsonify(analysis), 200
@@ -397,6 +670,8 @@ def analyze_uploaded_face():
             'dominant_emotion': analysis.get('dominant_emotion'),
             'all_emotions': analysis.get('all_emotions', {}),
             'confidence': analysis.get('confidence', {}),
+            'faces': analysis.get('faces', []),
+            'actions': list(actions),
             'timestamp': int(time.time() * 1000)
         })
         
@@ -410,6 +685,15 @@ def analyze_uploaded_face():
 
 def cleanup():
     """Cleanup GPIO on exit"""
+    ranger.stop()
+    face_broadcaster.stop()
+    analysis_loop.stop()
+    if frame_grabber:
+        frame_grabber.stop()
+    shutdown_attribute_models()
+    analytics.save()
+    publisher.stop()
+    store.stop()
     led_pwm.stop()
     GPIO.cleanup()
     print("🧹 GPIO cleanup completed")
@@ -417,7 +701,11 @@ def cleanup():
 
 if __name__ == '__main__':
     try:
-        # Start presence detection thread
+        # Camera and models come up in the background; see /api/ready
+        warmup.start()
+        
+        # Start ranging, then presence detection on its readings
+        ranger.start()
         presence_thread = threading.Thread(target=check_presence, daemon=True)
         presence_thread.start()
         print("🚀 Presence detection started")
@@ -7,6 +7,8 @@ Raspberry Pi 5 + AI Camera IMX500 Server
 - REST API for Multi-Device Display
 """
 
+# First import: marks process start for the /api/ready startup report
+from warmup import PROCESS_START, Warmup
 from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 import RPi.GPIO as GPIO
@@ -16,9 +18,20 @@ import cv2
 import numpy as np
 from picamera2 import Picamera2
 import json
+import sqlite3
 import os
 from datetime import datetime
-from collections import deque
+from frame_grabber import FrameGrabber, PICAMERA_PIXEL_FORMATS
+from mjpeg_broadcaster import MJPEGBroadcaster
+from face_detectors import get_detector, preload_detectors, detector_status
+from face_tracker import create_face_tracker
+from motion_gate import MotionGate
+from distance_sensor import UltrasonicRanger
+from presence import PresenceMonitor, PRESENCE_IDLE_MODE, PRESENCE_WATCH_FPS
+from firebase_publisher import FirebasePublisher, LocalRTDB, FIREBASE_LOCAL_DB
+from detection_store import DetectionStore
+from analytics_rollups import parse_time
+from analytics_api import VisitorAnalytics
 
 # Optional Firebase imports
 firebase_enabled = False
@@ -32,6 +45,9 @@ try:
 except ImportError:
     pass
 
+warmup = Warmup()
+warmup.record_import('server', time.monotonic() - PROCESS_START)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -56,26 +72,60 @@ except Exception as e:
     LED_PIN = None
     led_pwm = None
 
+# The only code that pulses the HC-SR04; everything else reads its readings
+ranger = UltrasonicRanger(GPIO, PROXIMITY_SENSOR_PIN, ECHO_PIN)
+
+# ============= Camera Configuration =============
+LORES_SIZE = (640, 480)
+# "YUV420" lets detection read the Y plane directly (no cvtColor per frame)
+LORES_FORMAT = os.environ.get('LORES_FORMAT', 'RGB888')
+
 # ============= Global State =============
 led_status = False
 user_present = False
 camera = None
 camera_initialized = False
-latest_detection = None
-detection_history = deque(maxlen=100)
+camera_lock = threading.Lock()
+frame_grabber = None
+face_tracker = None
+motion_gate = MotionGate()
+last_face_results = None
+last_saved_seq = None
+face_results_lock = threading.Lock()
 last_led_update = 0
 
+# Realtime Database writes go through a background publisher so a slow
+# network never stalls detection or request handlers (root set by init_firebase)
+publisher = FirebasePublisher()
+publisher.start()
+
+# Detections and presence events persist on-device; see detection_store.py
+store = DetectionStore()
+store.start()
+latest_detection = store.latest_detection()
+
+# Rollups, dwell / tap heatmaps and visits with their /api/analytics,
+# /api/visits and /api/heatmap endpoints (shared with app.py)
+analytics = VisitorAnalytics(publisher, lambda: firebase_db is not None, store)
+app.register_blueprint(analytics.blueprint)
+
 # ============= Firebase Initialization =============
 def init_firebase():
     """Initialize Firebase if credentials exist"""
     global firebase_db, firestore_db, firebase_enabled
     
     try:
-        if firebase_enabled and os.path.exists('firebase-credentials.json'):
+        if FIREBASE_LOCAL_DB:
+            firebase_db = LocalRTDB(FIREBASE_LOCAL_DB)
+            publisher.set_root(firebase_db)
+            print(f"✅ Using local Firebase stand-in ({FIREBASE_LOCAL_DB})")
+            return True
+        elif firebase_enabled and os.path.exists('firebase-credentials.json'):
             cred = credentials.Certificate('firebase-credentials.json')
             firebase_admin.initialize_app(cred)
             firebase_db = db.reference()
             firestore_db = firestore.client()
+            publisher.set_root(firebase_db)
             print("✅ Firebase initialized successfully")
             return True
         else:
@@ -89,211 +139,332 @@ def init_firebase():
 # ============= Camera Functions =============
 def init_imx500_camera():
     """Initialize Raspberry Pi AI Camera (IMX500)"""
-    global camera, camera_initialized
+    global camera, camera_initialized, frame_grabber
     
-    try:
-        print("🎥 Initializing IMX500 AI Camera...")
-        
-        camera = Picamera2()
-        
-        config = camera.create_still_configuration(
-            main={
-                "size": (4056, 3040),  # 12MP
-                "format": "RGB888"
-            },
-            lores={
-                "size": (640, 480),
-                "format": "RGB888"
-            },
-            display="lores"
-        )
-        
-        camera.configure(config)
-        
-        # Try to set controls, ignore if not supported
+    with camera_lock:
         try:
-            camera.set_controls({
-                "AeEnable": True,
-                "AwbEnable": True,
-            })
-        except:
-            pass
-        
-        camera.start()
-        camera_initialized = True
-        
-        print("✅ IMX500 Camera initialized - 12MP AI acceleration enabled")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Camera initialization error: {e}")
+            if camera_initialized:
+                return True
+            
+            print("🎥 Initializing IMX500 AI Camera...")
+            
+            camera = Picamera2()
+            
+            config = camera.create_still_configuration(
+                main={
+                    "size": (4056, 3040),  # 12MP
+                    "format": "RGB888"
+                },
+                lores={
+                    "size": LORES_SIZE,
+                    "format": LORES_FORMAT
+                },
+                display="lores"
+            )
+            
+            camera.configure(config)
+            
+            # Try to set controls, ignore if not supported
+            try:
+                camera.set_controls({
+                    "AeEnable": True,
+                    "AwbEnable": True,
+                })
+            except:
+                pass
+            
+            camera.start()
+            
+            # Single capture thread owns the camera from here on
+            # Sequence numbers continue across restarts (PRESENCE_IDLE_MODE=off)
+            frame_grabber = FrameGrabber(
+                lambda: camera.capture_array("lores"),
+                pixel_format=PICAMERA_PIXEL_FORMATS[LORES_FORMAT],
+                size=LORES_SIZE,
+                first_seq=frame_grabber.seq if frame_grabber else 0
+            )
+            frame_grabber.start()
+            camera_initialized = True
+            
+            print("✅ IMX500 Camera initialized - 12MP AI acceleration enabled")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Camera initialization error: {e}")
+            camera_initialized = False
+            return False
+
+
+def get_latest_frame(after_seq=0, timeout=1.0):
+    """Get the newest frame from the grab thread (None if unavailable)"""
+    if not camera_initialized or frame_grabber is None:
+        return None
+    return frame_grabber.wait_for_frame(after_seq, timeout)
+
+
+warmup.add('detector', preload_detectors)
+warmup.add('camera', init_imx500_camera)
+
+
+def stop_camera():
+    """Stop the grab thread and release the camera"""
+    global camera, camera_initialized
+    
+    with camera_lock:
+        if not camera_initialized:
+            return
         camera_initialized = False
+        if frame_grabber:
+            frame_grabber.stop()
+        try:
+            camera.stop()
+            camera.close()
+        except Exception as e:
+            print(f"⚠️  Camera stop error: {e}")
+        camera = None
+        print("🎥 Camera stopped")
+
+
+def sleep_pipeline():
+    """Nobody near: capture at the watch rate, or stop the camera"""
+    if warmup.state('camera') != 'ready':
         return False
+    
+    if PRESENCE_IDLE_MODE == 'off':
+        stop_camera()
+    elif frame_grabber:
+        frame_grabber.set_max_fps(PRESENCE_WATCH_FPS)
 
 
-def detect_faces_imx500():
-    """Detect faces using IMX500"""
-    global camera, camera_initialized
+def reset_pipeline():
+    """Forget tracks and results from before the camera was stopped"""
+    global last_face_results
+    
+    with face_results_lock:
+        last_face_results = None
+        if face_tracker:
+            face_tracker.reset()
+    camera_broadcaster.reset()
+
+
+def wake_pipeline():
+    """Someone approaching: full rate again; returns once a full-rate frame arrived"""
+    latest = frame_grabber.latest() if camera_initialized and frame_grabber else None
+    if not camera_initialized:
+        reset_pipeline()
+        init_imx500_camera()
+    elif frame_grabber:
+        frame_grabber.set_max_fps(None)
+    get_latest_frame(latest.seq if latest else 0, 2.0)
+
+
+# Duty-cycles the camera pipeline with presence; see presence.py
+presence = PresenceMonitor(wake=wake_pipeline, sleep=sleep_pipeline)
+
+
+def camera_may_start():
+    """
+    Whether a request handler should start a stopped camera: not while the
+    warm-up is starting it and not while presence keeps the pipeline
+    asleep (PRESENCE_IDLE_MODE=off) - the presence wake path does that
+    """
+    return not camera_initialized and warmup.state('camera') != 'warming' and presence.awake
+
+
+def get_face_tracker():
+    """Create the face tracker on first use (after the detector is loaded)"""
+    global face_tracker
+    if face_tracker is None:
+        face_tracker = create_face_tracker(get_detector())
+    return face_tracker
+
+
+def detect_faces_imx500(frame=None):
+    """
+    Detect faces using IMX500
+    
+    The full detector runs every FACE_DETECT_EVERY frames and faces are
+    tracked in between (see face_tracker.py). While the scene is static
+    the motion gate skips both and the previous result is reused. Each
+    frame is processed once and its result is shared by every caller
+    (snapshot, stream, detect).
+    
+    Args:
+        frame: Frame from the grab thread; the latest one is used if omitted
+    """
+    global last_face_results
     
     if not camera_initialized:
         return None
     
     try:
-        frame = camera.capture_array("lores")
+        if frame is None:
+            frame = get_latest_frame()
+            if frame is None:
+                return None
         
-        # Use direct path to haarcascade file
-        cascade_path = '/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml'
-        face_cascade = cv2.CascadeClassifier(cascade_path)
-        
-        if face_cascade.empty():
-            print(f"❌ Failed to load cascade classifier from {cascade_path}")
-            return None
-        
-        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
-        
-        results = {
-            'faces_detected': len(faces),
-            'faces': [],
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        for (x, y, w, h) in faces:
-            results['faces'].append({
-                'x': int(x),
-                'y': int(y),
-                'width': int(w),
-                'height': int(h),
-                'confidence': 0.85
-            })
+        with face_results_lock:
+            if last_face_results and last_face_results['frame_seq'] >= frame.seq:
+                return dict(last_face_results)
+            
+            moving, motion_score = motion_gate.update(frame)
+            
+            if not moving and last_face_results:
+                # Static scene - reuse the last result for this frame
+                results = dict(last_face_results)
+                results.update({
+                    'frame_seq': frame.seq,
+                    'detector_ran': False,
+                    'motion_score': motion_score,
+                    'motion_skipped': True,
+                    'timestamp': datetime.now().isoformat()
+                })
+            else:
+                tracks, detector_ran = get_face_tracker().update(frame)
+                faces = [track.to_dict() for track in tracks]
+                results = {
+                    'faces_detected': len(tracks),
+                    'faces': faces,
+                    'frame_seq': frame.seq,
+                    'detector_ran': detector_ran,
+                    'motion_score': motion_score,
+                    'motion_skipped': False,
+                    'timestamp': datetime.now().isoformat()
+                }
+            last_face_results = results
         
-        return results
+        # Faces keep a visitor present beyond the ultrasonic range
+        presence.observe_faces(results['faces_detected'], frame.timestamp)
+        analytics.record(results['faces'], frame.size)
+        return dict(results)
         
     except Exception as e:
         print(f"❌ Face detection error: {e}")
         return None
 
 
-def generate_camera_stream():
-    """Generate MJPEG stream"""
-    global camera, camera_initialized
+def produce_annotated_frame(last_seq):
+    """Capture, detect and annotate the next frame for the broadcaster"""
+    latest = get_latest_frame(last_seq)
+    if latest is None:
+        return None
     
-    if not camera_initialized:
+    # Frames are shared between consumers - draw on a copy
+    frame = latest.bgr().copy()
+    face_results = detect_faces_imx500(latest)
+    
+    if face_results and face_results['faces_detected'] > 0:
+        for face in face_results['faces']:
+            x, y, w, h = face['x'], face['y'], face['width'], face['height']
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 3)
+            cv2.putText(
+                frame, 
+                f"Human: {face['confidence']:.2f}", 
+                (x, y-10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.7,
+                (0, 255, 0),
+                2
+            )
+    
+    return latest.seq, frame, face_results
+
+
+# One pipeline shared by every stream and snapshot client (~10 FPS เพื่อลด CPU usage)
+camera_broadcaster = MJPEGBroadcaster(produce_annotated_frame, fps=10, quality=85)
+SNAPSHOT_MAX_WAIT = 10.0
+
+
+def parse_variant_args():
+    """Read the ?w=&fps=&q= output negotiation parameters"""
+    return (
+        request.args.get('w', type=int),
+        request.args.get('fps', type=float),
+        request.args.get('q', type=int)
+    )
+
+
+def generate_camera_stream(width=None, fps=None, quality=None):
+    """Generate MJPEG stream (optionally scaled / rate-limited per client)"""
+    # The warm-up starts the camera at boot; requests only retry after a
+    # failure, and never while presence has the pipeline asleep
+    if camera_may_start():
         init_imx500_camera()
     
-    while True:
-        try:
-            if camera_initialized:
-                frame = camera.capture_array("lores")
-                face_results = detect_faces_imx500()
-                
-                if face_results and face_results['faces_detected'] > 0:
-                    for face in face_results['faces']:
-                        x, y, w, h = face['x'], face['y'], face['width'], face['height']
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                        cv2.putText(
-                            frame, 
-                            f"Face: {face['confidence']:.2f}", 
-                            (x, y-10),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (0, 255, 0),
-                            2
-                        )
-                
-                # Encode to JPEG
-                ret, buffer = cv2.imencode('.jpg', frame)
-                frame_bytes = buffer.tobytes()
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n'
-                       b'Content-Length: ' + str(len(frame_bytes)).encode() + b'\r\n\r\n'
-                       + frame_bytes + b'\r\n')
-                
-                # Limit to ~10 FPS เพื่อลด CPU usage
-                time.sleep(0.1)
-        except Exception as e:
-            print(f"❌ Stream error: {e}")
-            time.sleep(1)
+    return camera_broadcaster.stream(width, fps, quality)
 
 
 def save_face_detection(detection_data):
-    """Save face detection data"""
-    global latest_detection, detection_history
+    """Save face detection data (once per frame - pollers share cached results)"""
+    global latest_detection, last_saved_seq
+    
+    with face_results_lock:
+        if detection_data.get('frame_seq') == last_saved_seq:
+            return detection_data
+        last_saved_seq = detection_data.get('frame_seq')
     
     detection_data['device_id'] = 'pi5_imx500_001'
     detection_data['location'] = 'Kiosk Main Display'
     
     latest_detection = detection_data
-    detection_history.append(detection_data)
+    store.add_detection(detection_data)
     
-    # Try to save to Firebase
+    # Queued for Firebase; only the newest detection is written per batch
     if firebase_db:
-        try:
-            firebase_db.child('detections').child('latest').set(detection_data)
-        except Exception as e:
-            print(f"⚠️  Firebase save failed: {e}")
+        publisher.publish('detections/latest', detection_data)
     
     return detection_data
 
 
 def measure_distance():
-    """Measure distance using HC-SR04"""
-    try:
-        # Send pulse
-        GPIO.output(PROXIMITY_SENSOR_PIN, True)
-        time.sleep(0.00001)
-        GPIO.output(PROXIMITY_SENSOR_PIN, False)
-        
-        # Measure pulse duration
-        pulse_start = time.time()
-        pulse_end = time.time()
-        
-        while GPIO.input(ECHO_PIN) == 0:
-            pulse_start = time.time()
-        
-        while GPIO.input(ECHO_PIN) == 1:
-            pulse_end = time.time()
-        
-        pulse_duration = pulse_end - pulse_start
-        distance = pulse_duration * 17150
-        
-        return round(distance, 2)
-    except Exception as e:
-        print(f"❌ Distance measurement error: {e}")
+    """Latest filtered HC-SR04 distance in cm (-1 if nothing is in range)"""
+    reading = ranger.latest()
+    if reading is None or reading.distance is None:
         return -1
+    return round(reading.distance, 2)
 
 
-def check_presence():
-    """Monitor presence sensor"""
+def on_presence_change(state, previous, reason):
+    """LED follows the confirmed presence state; every change is stored"""
     global user_present, led_status, last_led_update
     
+    store.add_presence_event(state, previous, reason, presence.distance)
+    
+    if presence.is_present() == user_present:
+        return
+    
+    user_present = presence.is_present()
+    if user_present:
+        print(f"👤 User detected at {measure_distance()}cm")
+    else:
+        print(f"🚶 User left")
+    
+    if led_pwm:
+        led_status = user_present
+        led_pwm.ChangeDutyCycle(100 if user_present else 0)
+        last_led_update = time.time()
+
+
+presence.add_listener(on_presence_change)
+
+
+def check_presence():
+    """Feed every distance reading to the presence state machine"""
+    last_seq = 0
+    
     while True:
         try:
-            if PROXIMITY_SENSOR_PIN and ECHO_PIN and led_pwm:
-                distance = measure_distance()
-                
-                if distance > 0 and distance < 100:  # User within 100cm
-                    if not user_present:
-                        user_present = True
-                        led_status = True
-                        led_pwm.ChangeDutyCycle(100)
-                        last_led_update = time.time()
-                        print(f"👤 User detected at {distance}cm - LED ON")
-                else:
-                    if user_present:
-                        user_present = False
-                        led_status = False
-                        led_pwm.ChangeDutyCycle(0)
-                        last_led_update = time.time()
-                        print(f"🚶 User left - LED OFF")
+            reading = ranger.wait_for_reading(last_seq, 1.0)
+            if reading is None:
+                # No ranging - faces alone drive presence, timeouts still apply
+                presence.evaluate()
+                analytics.tick()
+                time.sleep(0.5)
+                continue
             
-            time.sleep(0.5)
+            last_seq = reading.seq
+            presence.update_distance(reading.distance, reading.timestamp)
+            analytics.tick()
             
         except Exception as e:
             print(f"❌ Presence check error: {e}")
@@ -314,18 +485,33 @@ def index():
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Warm-up state of every subsystem plus import / startup timings"""
+    report = warmup.report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+
 @app.route('/api/face/detect', methods=['GET'])
 def face_detect():
     """Real-time face detection"""
+    if warmup.state('detector') == 'warming':
+        response = jsonify({'error': 'Warming up: detector', 'ready': False})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
     results = detect_faces_imx500()
     
     if results and results['faces_detected'] > 0:
-        save_face_detection(results)
+        # Static scene repeats the previous result - nothing new to save
+        if not results.get('motion_skipped'):
+            save_face_detection(results)
         return jsonify(results)
     else:
         return jsonify({
             'faces_detected': 0,
             'faces': [],
+            'motion_score': results.get('motion_score') if results else None,
             'timestamp': datetime.now().isoformat()
         })
 
@@ -344,49 +530,109 @@ def get_latest_detection():
 
 @app.route('/api/face/history', methods=['GET'])
 def get_detection_history():
-    """Get detection history"""
-    limit = request.args.get('limit', 50, type=int)
+    """
+    Get detection history
+    
+    ?since=<cursor> returns only detections stored after that cursor
+    (oldest first); without it the newest ?limit= detections are returned.
+    ?until= (epoch ms or ISO time) and ?track= narrow the rows. Pass the
+    returned cursor as since next time; has_more means another page waits.
+    ?total=1 adds the number of stored detections.
+    """
+    try:
+        page = store.detections(
+            since=request.args.get('since', type=int),
+            until=parse_time(request.args.get('until')),
+            limit=request.args.get('limit', 50, type=int),
+            track_id=request.args.get('track', type=int),
+            count=request.args.get('total', '').lower() in ('1', 'true')
+        )
+    except ValueError as e:
+        return jsonify({'error': f"Invalid until: {e}"}), 400
+    except sqlite3.Error as e:
+        print(f"❌ Detection store read failed: {e}")
+        return jsonify({'error': 'History unavailable'}), 503
+    
     return jsonify({
-        'total': len(detection_history),
-        'detections': list(detection_history)[-limit:]
+        **page,
+        'count': len(page['detections'])
     })
 
 
+@app.route('/api/presence/history', methods=['GET'])
+def get_presence_history():
+    """Presence state changes, paged like /api/face/history"""
+    try:
+        page = store.presence_events(
+            since=request.args.get('since', type=int),
+            until=parse_time(request.args.get('until')),
+            limit=request.args.get('limit', 50, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': f"Invalid until: {e}"}), 400
+    except sqlite3.Error as e:
+        print(f"❌ Detection store read failed: {e}")
+        return jsonify({'error': 'History unavailable'}), 503
+    return jsonify(page)
+
+
 @app.route('/api/camera/snapshot')
 def camera_snapshot():
-    """Get single frame snapshot (ใช้อันนี้แทน stream เพื่อลด lag)"""
-    global camera, camera_initialized
+    """
+    Get single frame snapshot (ใช้อันนี้แทน stream เพื่อลด lag)
     
-    if not camera_initialized:
+    Serves the latest frame already encoded by the shared pipeline.
+    The ETag is the frame sequence number, so If-None-Match gets a 304
+    when nothing new was captured. ?after=<seq> long-polls until a newer
+    frame is ready (up to ?timeout= seconds, default 5).
+    ?w=<width>&q=<quality> request a smaller / lighter variant and
+    ?fmt=webp returns WebP instead of JPEG.
+    """
+    if warmup.state('camera') == 'warming':
+        response = jsonify({'error': 'Warming up: camera', 'ready': False})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    # Nobody near and the camera is off: serve the last frame rather than
+    # start the camera behind the presence monitor's back
+    asleep = not camera_initialized and not presence.awake
+    if camera_may_start():
         init_imx500_camera()
     
+    if not camera_initialized and not asleep:
+        return jsonify({'error': 'Camera not initialized'}), 500
+    
     try:
-        if camera_initialized:
-            # Capture frame
-            frame = camera.capture_array("lores")
-            
-            # Detect faces and draw boxes
-            face_results = detect_faces_imx500()
-            if face_results and face_results['faces_detected'] > 0:
-                for face in face_results['faces']:
-                    x, y, w, h = face['x'], face['y'], face['width'], face['height']
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 3)
-                    cv2.putText(
-                        frame, 
-                        f"Human: {face['confidence']:.2f}", 
-                        (x, y-10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.7,
-                        (0, 255, 0),
-                        2
-                    )
-            
-            # Encode to JPEG with good quality
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            
-            return Response(buffer.tobytes(), mimetype='image/jpeg')
+        after = request.args.get('after', 0, type=int)
+        timeout = min(request.args.get('timeout', 5.0, type=float), SNAPSHOT_MAX_WAIT)
+        width, _, quality = parse_variant_args()
+        fmt = request.args.get('fmt')
+        
+        if asleep:
+            frame = camera_broadcaster.latest()
+            if frame and frame.seq <= after:
+                frame = None
         else:
-            return jsonify({'error': 'Camera not initialized'}), 500
+            frame = camera_broadcaster.wait_for_frame(after, timeout if after else 1.0)
+        if frame is None:
+            if after:
+                # Nothing newer yet - client keeps what it has
+                response = Response(status=304)
+                response.headers['X-Frame-Seq'] = str(after)
+                return response
+            return jsonify({'error': 'No frame available'}), 503
+        
+        etag = camera_broadcaster.etag(frame, width, quality, fmt)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            data = camera_broadcaster.get_variant(frame, width, quality, fmt)
+            response = Response(data, mimetype='image/webp' if fmt == 'webp' else 'image/jpeg')
+        
+        response.set_etag(etag)
+        response.headers['X-Frame-Seq'] = str(frame.seq)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         print(f"❌ Snapshot error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -395,8 +641,9 @@ def camera_snapshot():
 @app.route('/api/camera/stream')
 def camera_stream():
     """MJPEG stream (ช้ากว่า snapshot, ใช้เฉพาะเมื่อต้องการ continuous stream)"""
+    width, fps, quality = parse_variant_args()
     return Response(
-        generate_camera_stream(),
+        generate_camera_stream(width, fps, quality),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
@@ -409,6 +656,11 @@ def camera_status():
         'model': 'IMX500',
         'resolution': '12MP',
         'ai_enabled': True,
+        'grabber': frame_grabber.stats() if frame_grabber else None,
+        'detector': detector_status(),
+        'tracking': face_tracker.stats() if face_tracker else None,
+        'motion': motion_gate.stats(),
+        'stream': camera_broadcaster.stats(),
         'timestamp': datetime.now().isoformat()
     })
 
@@ -443,10 +695,19 @@ def control_led():
 
 @app.route('/api/distance', methods=['GET'])
 def get_distance():
-    """Get distance from proximity sensor"""
-    distance = measure_distance()
+    """Get the latest filtered distance reading (does not pulse the sensor)"""
+    reading = ranger.latest()
+    if reading is None:
+        return jsonify({
+            'distance': -1,
+            'unit': 'cm',
+            'error': 'No distance reading yet',
+            'sensor': ranger.stats(),
+            'timestamp': datetime.now().isoformat()
+        }), 503
+    
     return jsonify({
-        'distance': distance,
+        **reading.to_dict(),
         'unit': 'cm',
         'timestamp': datetime.now().isoformat()
     })
@@ -459,17 +720,38 @@ def get_status():
         'camera': 'online' if camera_initialized else 'offline',
         'led': 'on' if led_status else 'off',
         'firebase': 'connected' if firebase_db else 'offline',
+        'publisher': publisher.stats(),
+        'store': store.stats(),
         'user_present': user_present,
+        'presence_state': presence.state,
         'latest_detection': latest_detection,
         'timestamp': datetime.now().isoformat()
     })
 
 
+@app.route('/api/presence', methods=['GET'])
+def get_presence():
+    """Presence state, transition timings and pipeline resume latencies"""
+    return jsonify({
+        **presence.stats(),
+        'sensor': ranger.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
 def cleanup():
     """Cleanup on exit"""
     global camera, camera_initialized
     
     try:
+        ranger.stop()
+        analytics.save()
+        publisher.stop()
+        store.stop()
+        camera_broadcaster.stop()
+        if frame_grabber:
+            frame_grabber.stop()
+        
         if led_pwm:
             led_pwm.stop()
         GPIO.cleanup()
@@ -489,10 +771,12 @@ if __name__ == '__main__':
         # Initialize Firebase
         init_firebase()
         
-        # Initialize IMX500 Camera
-        init_imx500_camera()
+        # Load the face detector and start the IMX500 camera in the
+        # background so the port opens right away; see /api/ready
+        warmup.start()
         
-        # Start presence detection thread
+        # Start ranging, then presence detection on its readings
+        ranger.start()
         presence_thread = threading.Thread(target=check_presence, daemon=True)
         presence_thread.start()
         print("🚀 Presence detection started")
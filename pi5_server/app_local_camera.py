@@ -3,6 +3,7 @@ from flask_cors import CORS
 import cv2
 import threading
 import time
+from face_detectors import get_detector
 
 app = Flask(__name__)
 CORS(app)
@@ -31,12 +32,8 @@ else:
 camera_running = cap.isOpened()
 print(f"Camera status: {'Running' if camera_running else 'Not available'}")
 
-# Try to load face cascade classifier
-try:
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-except AttributeError:
-    # Fallback for older OpenCV versions
-    face_cascade = cv2.CascadeClassifier('/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml')
+# Shared, preloaded face detector (FACE_DETECTOR selects the backend)
+face_detector = get_detector()
 
 
 def generate_camera_stream():
@@ -50,8 +47,7 @@ def generate_camera_stream():
             time.sleep(0.1)
             continue
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        faces, _ = face_detector.detect(frame)
 
         for (x, y, w, h) in faces:
             cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
@@ -102,8 +98,7 @@ def camera_snapshot():
         return jsonify({'error': 'Failed to capture frame'}), 500
 
     # Detect faces and draw rectangles
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    faces, _ = face_detector.detect(frame)
 
     for (x, y, w, h) in faces:
         cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
@@ -129,12 +124,11 @@ def camera_detect():
     if not ret:
         return jsonify({'error': 'Failed to capture frame', 'faces_detected': 0}), 500
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    faces, scores = face_detector.detect(frame)
 
     results = {'faces_detected': len(faces), 'faces': [], 'timestamp': int(time.time() * 1000)}
-    for (x, y, w, h) in faces:
-        results['faces'].append({'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h), 'confidence': 0.0})
+    for (x, y, w, h), score in zip(faces, scores):
+        results['faces'].append({'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h), 'confidence': round(score, 2)})
 
     return jsonify(results)
 
@@ -0,0 +1,174 @@
+"""
+Per-Track Attribute Cache
+Age and gender do not change while a visitor stands in front of the
+kiosk, so they are sampled a few times per face track, then frozen at a
+smoothed value. Emotion is refreshed on its own, slower schedule. Entries
+expire after a TTL, are evicted least-recently-used beyond a size limit,
+and are dropped as soon as their track disappears.
+
+ATTRIBUTE_SAMPLES, EMOTION_REFRESH_SECONDS, ATTRIBUTE_CACHE_TTL and
+ATTRIBUTE_CACHE_SIZE tune the cache; ATTRIBUTE_CACHE=off disables it.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ATTRIBUTE_CACHE = os.environ.get('ATTRIBUTE_CACHE', 'on')
+ATTRIBUTE_SAMPLES = int(os.environ.get('ATTRIBUTE_SAMPLES', '3'))
+EMOTION_REFRESH_SECONDS = float(os.environ.get('EMOTION_REFRESH_SECONDS', '1.0'))
+ATTRIBUTE_CACHE_TTL = float(os.environ.get('ATTRIBUTE_CACHE_TTL', '10.0'))
+ATTRIBUTE_CACHE_SIZE = int(os.environ.get('ATTRIBUTE_CACHE_SIZE', '64'))
+
+
+class CachedAttributes:
+    """Samples and smoothed attributes of one track"""
+
+    def __init__(self, now):
+        self.ages = []
+        self.genders = []
+        self.emotion = None
+        self.emotion_time = 0.0
+        self.last_seen = now
+
+    def merged(self):
+        """DeepFace-style dict with the smoothed values"""
+        result = {}
+        if self.ages:
+            result['age'] = float(np.median(self.ages))
+        if self.genders:
+            labels = self.genders[0].keys()
+            scores = {label: float(np.mean([g.get(label, 0.0) for g in self.genders])) for label in labels}
+            result['gender'] = scores
+            result['dominant_gender'] = max(scores, key=scores.get)
+        if self.emotion is not None:
+            result.update(self.emotion)
+        return result
+
+
+class AttributeCache:
+    """Attribute results keyed by face track ID, with TTL and LRU eviction"""
+
+    def __init__(self, samples=ATTRIBUTE_SAMPLES, emotion_refresh=EMOTION_REFRESH_SECONDS,
+                 ttl=ATTRIBUTE_CACHE_TTL, max_entries=ATTRIBUTE_CACHE_SIZE,
+                 enabled=ATTRIBUTE_CACHE != 'off'):
+        """
+        Initialize the cache
+
+        Args:
+            samples: Age/gender samples per track before the value is frozen
+            emotion_refresh: Seconds between emotion updates of a track
+            ttl: Drop entries not seen for this many seconds
+            max_entries: Evict least-recently-used entries beyond this size
+            enabled: False makes every face run every model
+        """
+        self.samples = max(1, int(samples))
+        self.emotion_refresh = emotion_refresh
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.model_runs = 0
+        self.model_runs_saved = 0
+
+    def plan(self, track_id, actions, now=None):
+        """
+        Decide which models a face still needs this frame
+
+        Args:
+            track_id: Face track ID (None = untracked, always computed)
+            actions: Actions the caller wants
+
+        Returns:
+            Tuple of actions to run (may be empty)
+        """
+        if not self.enabled or track_id is None:
+            self.model_runs += len(actions)
+            return tuple(actions)
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(track_id)
+            if entry is None:
+                needed = tuple(actions)
+            else:
+                needed = tuple(
+                    action for action in actions
+                    if (action == 'age' and len(entry.ages) < self.samples)
+                    or (action == 'gender' and len(entry.genders) < self.samples)
+                    or (action == 'emotion' and now - entry.emotion_time >= self.emotion_refresh)
+                )
+            self.model_runs += len(needed)
+            self.model_runs_saved += len(actions) - len(needed)
+            return needed
+
+    def update(self, track_id, result, now=None):
+        """
+        Store fresh model output for a track and return the smoothed view
+
+        Args:
+            track_id: Face track ID (None = not cached, result returned as is)
+            result: DeepFace-style dict from the attribute models (may be empty)
+
+        Returns:
+            DeepFace-style dict combining cached and fresh values
+        """
+        if not self.enabled or track_id is None:
+            return result
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.pop(track_id, None) or CachedAttributes(now)
+            entry.last_seen = now
+
+            if 'age' in result and len(entry.ages) < self.samples:
+                entry.ages.append(result['age'])
+            if isinstance(result.get('gender'), dict) and len(entry.genders) < self.samples:
+                entry.genders.append(result['gender'])
+            if 'dominant_emotion' in result:
+                entry.emotion = {'emotion': result.get('emotion', {}),
+                                 'dominant_emotion': result['dominant_emotion']}
+                entry.emotion_time = now
+
+            self._entries[track_id] = entry
+            self._evict(now)
+            return entry.merged()
+
+    def retain(self, track_ids):
+        """Drop every entry whose track is no longer alive"""
+        alive = set(track_ids)
+        with self._lock:
+            for track_id in [t for t in self._entries if t not in alive]:
+                del self._entries[track_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        for track_id in [t for t, e in self._entries.items() if now - e.last_seen > self.ttl]:
+            del self._entries[track_id]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Counters for status endpoints"""
+        with self._lock:
+            frozen = sum(1 for e in self._entries.values()
+                         if min(len(e.ages), len(e.genders)) >= self.samples)
+            entries = len(self._entries)
+        total = self.model_runs + self.model_runs_saved
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'frozen': frozen,
+            'model_runs': self.model_runs,
+            'model_runs_saved': self.model_runs_saved,
+            'hit_rate': round(self.model_runs_saved / total, 3) if total else None
+        }
@@ -0,0 +1,346 @@
+"""
+Face Attribute Models
+Age, gender and emotion inference on face crops. All crops of a frame go
+through each model as one batch, so a group in front of the kiosk costs
+about the same as a single visitor.
+
+Preprocessing and post-processing follow DeepFace 0.0.79 so the results
+match DeepFace.analyze(..., detector_backend='skip').
+
+Backends (ATTRIBUTE_BACKEND):
+- deepface  DeepFace's Keras models (default)
+- tflite    int8 / float16 TFLite conversions, XNNPACK delegate
+- onnx      int8 / float16 ONNX conversions, ONNX Runtime
+
+The converted models ({action}_{precision}.tflite / .onnx in
+FACE_MODELS_DIR, precision from ATTRIBUTE_PRECISION) are built and
+validated against DeepFace by convert_attribute_models.py.
+"""
+
+import logging
+import os
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.environ.get('FACE_MODELS_DIR', os.path.join(BASE_DIR, 'models'))
+ATTRIBUTE_BACKEND = os.environ.get('ATTRIBUTE_BACKEND', 'deepface')
+ATTRIBUTE_PRECISION = os.environ.get('ATTRIBUTE_PRECISION', 'int8')
+ATTRIBUTE_THREADS = int(os.environ.get('ATTRIBUTE_THREADS', '0')) or None
+
+ACTIONS = ('age', 'gender', 'emotion')
+# Actions warmed up at start-up and run when a request names none
+ATTRIBUTE_ACTIONS = tuple(
+    a for a in ACTIONS if a in os.environ.get('ATTRIBUTE_ACTIONS', ','.join(ACTIONS)).split(',')
+)
+GENDER_LABELS = ('Woman', 'Man')
+EMOTION_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+FACE_INPUT_SIZE = (224, 224)
+EMOTION_INPUT_SIZE = (48, 48)
+
+
+def preprocess_face(crop, target_size=FACE_INPUT_SIZE):
+    """
+    Resize a BGR crop into the VGG-Face input the age/gender models expect
+
+    Keeps the aspect ratio, pads with black to target_size and scales to
+    [0, 1] - the same steps as DeepFace's extract_faces().
+    """
+    height, width = crop.shape[:2]
+    factor = min(target_size[0] / height, target_size[1] / width)
+    resized = cv2.resize(crop, (max(1, int(width * factor)), max(1, int(height * factor))))
+
+    pad_h = target_size[0] - resized.shape[0]
+    pad_w = target_size[1] - resized.shape[1]
+    padded = np.pad(
+        resized,
+        ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)),
+        'constant'
+    )
+    return padded.astype(np.float32) / 255.0
+
+
+def emotion_input(face):
+    """Grayscale 48x48 emotion-model input from a preprocessed face"""
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, EMOTION_INPUT_SIZE)[:, :, np.newaxis]
+
+
+def decode_predictions(action, predictions):
+    """
+    Turn raw model outputs for one face into DeepFace-style fields
+
+    Returns:
+        Dict with 'age', or 'gender' + 'dominant_gender', or
+        'emotion' + 'dominant_emotion'
+    """
+    if action == 'age':
+        return {'age': float(np.sum(predictions * np.arange(len(predictions))))}
+
+    if action == 'gender':
+        scores = {label: float(100 * p) for label, p in zip(GENDER_LABELS, predictions)}
+        return {'gender': scores, 'dominant_gender': GENDER_LABELS[int(np.argmax(predictions))]}
+
+    total = float(np.sum(predictions)) or 1.0
+    scores = {label: float(100 * p / total) for label, p in zip(EMOTION_LABELS, predictions)}
+    return {'emotion': scores, 'dominant_emotion': EMOTION_LABELS[int(np.argmax(predictions))]}
+
+
+def model_path(action, backend, precision=ATTRIBUTE_PRECISION):
+    """Path of a converted model, e.g. models/emotion_int8.tflite"""
+    return os.path.join(MODELS_DIR, f"{action}_{precision}.{backend}")
+
+
+class AttributeModels:
+    """Base class: age / gender / emotion models run in batches"""
+
+    name = 'base'
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def build(self, action):
+        """Load the model for one action"""
+        raise NotImplementedError
+
+    def forward(self, model, batch):
+        """Run one model over a float32 batch and return its outputs"""
+        raise NotImplementedError
+
+    def load(self, actions=ACTIONS):
+        """Build the models for the given actions (weights load once)"""
+        with self._lock:
+            for action in actions:
+                if action not in self._models:
+                    self._models[action] = self.build(action)
+                    logger.info(f"✅ {self.name} {action} model loaded")
+
+    def warm_up(self, actions=ACTIONS):
+        """Load the models and run one dummy batch so the first request is fast"""
+        self.predict([np.zeros((64, 64, 3), np.uint8)], actions)
+
+    def run(self, action, batch):
+        """Forward pass of one model over a batch"""
+        self.load((action,))
+        return np.asarray(self.forward(self._models[action], batch))
+
+    def predict(self, crops, actions=ACTIONS):
+        """
+        Analyze face crops
+
+        Args:
+            crops: List of BGR face crops (numpy arrays)
+            actions: Subset of ('age', 'gender', 'emotion') for every crop,
+                or a list with one such tuple per crop
+
+        Returns:
+            One dict per crop with DeepFace-style fields (empty for a crop
+            that needed no action)
+        """
+        if actions and isinstance(actions[0], str):
+            plans = [tuple(actions)] * len(crops)
+        else:
+            plans = list(actions)
+
+        results = [{} for _ in crops]
+        needed = [i for i, plan in enumerate(plans) if plan]
+        faces = {i: preprocess_face(crops[i]) for i in needed}
+
+        # One batch per model over every crop that needs it
+        for action in ACTIONS:
+            indices = [i for i in needed if action in plans[i]]
+            if not indices:
+                continue
+            if action == 'emotion':
+                batch = np.stack([emotion_input(faces[i]) for i in indices])
+            else:
+                batch = np.stack([faces[i] for i in indices])
+            for i, predictions in zip(indices, self.run(action, batch)):
+                results[i].update(decode_predictions(action, predictions))
+
+        return results
+
+
+class DeepFaceAttributeModels(AttributeModels):
+    """DeepFace's Keras models (deepface + tf-keras)"""
+
+    name = 'deepface'
+    model_names = {'age': 'Age', 'gender': 'Gender', 'emotion': 'Emotion'}
+
+    def __init__(self):
+        super().__init__()
+        from deepface import DeepFace
+
+        self._deepface = DeepFace
+
+    def build(self, action):
+        return self._deepface.build_model(self.model_names[action])
+
+    def forward(self, model, batch):
+        return model.predict_on_batch(batch)
+
+
+class TFLiteAttributeModels(AttributeModels):
+    """Quantized TFLite conversions, run with the XNNPACK delegate"""
+
+    name = 'tflite'
+
+    def __init__(self, precision=ATTRIBUTE_PRECISION, threads=ATTRIBUTE_THREADS):
+        super().__init__()
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self._interpreter_class = Interpreter
+        self.precision = precision
+        self.threads = threads
+        self._run_lock = threading.Lock()
+
+        for action in ACTIONS:
+            path = model_path(action, self.name, precision)
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+
+    def build(self, action):
+        # XNNPACK is the TFLite runtime's default CPU delegate
+        interpreter = self._interpreter_class(
+            model_path=model_path(action, self.name, self.precision),
+            num_threads=self.threads
+        )
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def forward(self, interpreter, batch):
+        # Interpreters are not thread-safe and are resized per batch size
+        with self._run_lock:
+            input_detail = interpreter.get_input_details()[0]
+            if input_detail['shape'][0] != len(batch):
+                interpreter.resize_tensor_input(input_detail['index'], [len(batch), *batch.shape[1:]])
+                interpreter.allocate_tensors()
+                input_detail = interpreter.get_input_details()[0]
+            output_detail = interpreter.get_output_details()[0]
+
+            interpreter.set_tensor(input_detail['index'], quantize(batch, input_detail))
+            interpreter.invoke()
+            return dequantize(interpreter.get_tensor(output_detail['index']), output_detail)
+
+
+class ONNXAttributeModels(AttributeModels):
+    """Quantized ONNX conversions, run with ONNX Runtime (XNNPACK if built in)"""
+
+    name = 'onnx'
+
+    def __init__(self, precision=ATTRIBUTE_PRECISION, threads=ATTRIBUTE_THREADS):
+        super().__init__()
+        import onnxruntime
+
+        self._ort = onnxruntime
+        self.precision = precision
+        self.threads = threads
+
+        for action in ACTIONS:
+            path = model_path(action, self.name, precision)
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+
+    def build(self, action):
+        options = self._ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        available = self._ort.get_available_providers()
+        providers = [p for p in ('XnnpackExecutionProvider', 'CPUExecutionProvider') if p in available]
+        return self._ort.InferenceSession(model_path(action, self.name, self.precision),
+                                          options, providers=providers)
+
+    def forward(self, session, batch):
+        model_input = session.get_inputs()[0]
+        if model_input.type == 'tensor(float16)':
+            batch = batch.astype(np.float16)
+        return session.run(None, {model_input.name: batch})[0].astype(np.float32)
+
+
+def quantize(batch, detail):
+    """Convert a float batch to a TFLite input tensor's dtype"""
+    dtype = detail['dtype']
+    if dtype in (np.int8, np.uint8):
+        scale, zero_point = detail['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+    return batch.astype(dtype)
+
+
+def dequantize(output, detail):
+    """Convert a TFLite output tensor back to float32"""
+    if output.dtype in (np.int8, np.uint8):
+        scale, zero_point = detail['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+    return output.astype(np.float32)
+
+
+_backends = {
+    'deepface': DeepFaceAttributeModels,
+    'tflite': TFLiteAttributeModels,
+    'onnx': ONNXAttributeModels,
+}
+
+
+def attribute_backend_names():
+    return list(_backends)
+
+
+def create_attribute_models(name=ATTRIBUTE_BACKEND, strict=False, **options):
+    """
+    Build an in-process attribute model backend by name
+
+    Args:
+        name: 'deepface', 'tflite' or 'onnx'
+        strict: Raise instead of falling back to DeepFace when the runtime
+            or the converted model files are missing
+        options: Backend arguments (precision, threads)
+    """
+    if name not in _backends:
+        raise ValueError(f"Unknown attribute backend '{name}'")
+    try:
+        return _backends[name](**options)
+    except (ImportError, FileNotFoundError) as e:
+        if strict or name == 'deepface':
+            raise
+        logger.warning(f"⚠️  Attribute backend '{name}' unavailable ({e}) - using deepface")
+        return DeepFaceAttributeModels()
+
+
+# Singleton instance
+_attribute_models = None
+_attribute_models_lock = threading.Lock()
+
+
+def get_attribute_models():
+    """
+    Get or create the attribute model backend
+
+    With INFERENCE_WORKERS > 0 the models run in a process pool and this
+    process never imports TensorFlow.
+    """
+    global _attribute_models
+    with _attribute_models_lock:
+        if _attribute_models is None:
+            from inference_pool import INFERENCE_WORKERS, InferencePool, PooledAttributeModels
+
+            if INFERENCE_WORKERS > 0:
+                _attribute_models = PooledAttributeModels(InferencePool(ATTRIBUTE_BACKEND))
+                logger.info(f"✅ Attribute inference on {INFERENCE_WORKERS} worker process(es)")
+            else:
+                _attribute_models = create_attribute_models(ATTRIBUTE_BACKEND)
+        return _attribute_models
+
+
+def shutdown_attribute_models():
+    """Stop the inference workers, if any"""
+    if hasattr(_attribute_models, 'pool'):
+        _attribute_models.pool.shutdown()
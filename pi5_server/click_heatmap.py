@@ -0,0 +1,353 @@
+"""
+Click Heatmap
+Server-side binning of kiosk tap positions. The kiosk posts taps in
+batches ({x, y, page, timestamp}, x / y in percent of the screen like the
+Firestore `heatmap` documents) and they are added to per-page NumPy count
+grids straight away, so a dashboard reads pre-binned grids whose size
+does not depend on how many taps were ever made.
+
+Per page there is an all-time grid, one grid per hour (HEATMAP_HOURS
+kept) and one per local day (HEATMAP_DAYS kept); only hours / days that
+had taps hold a grid. Grids are HEATMAP_BINS square and coarser
+resolutions are summed down from it on request.
+
+Grids are saved to HEATMAP_PATH at most every HEATMAP_SAVE_SECONDS and on
+shutdown.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from analytics_rollups import local_utc_offset
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HEATMAP_PATH = os.environ.get('HEATMAP_PATH', os.path.join(BASE_DIR, 'click_heatmap.npz'))
+HEATMAP_BINS = int(os.environ.get('HEATMAP_BINS', '64'))
+HEATMAP_HOURS = int(os.environ.get('HEATMAP_HOURS', '168'))
+HEATMAP_DAYS = int(os.environ.get('HEATMAP_DAYS', '90'))
+HEATMAP_SAVE_SECONDS = float(os.environ.get('HEATMAP_SAVE_SECONDS', '60'))
+
+MAX_BATCH_POINTS = 5000
+ALL_PAGES = '*'
+
+# window name -> bucket seconds
+WINDOWS = {'hour': 3600, 'day': 86400}
+
+
+def parse_timestamp(value, now):
+    """
+    Point time as Unix seconds (epoch ms number, ISO string or missing)
+
+    Raises:
+        ValueError: Not a finite number (JSON NaN / Infinity) or ISO time
+    """
+    if value is None:
+        return now
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError(f"Timestamp {value} is not finite")
+        return value / 1000
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+class PageGrids:
+    """All-time, hourly and daily count grids of one page"""
+
+    def __init__(self, bins):
+        self.total = np.zeros((bins, bins), np.int32)
+        self.buckets = {name: {} for name in WINDOWS}
+        self.last_click = None
+
+    def grid(self, window, bucket, bins):
+        grids = self.buckets[window]
+        if bucket not in grids:
+            grids[bucket] = np.zeros((bins, bins), np.int32)
+        return grids[bucket]
+
+
+class ClickHeatmap:
+    """Per-page click grids with hour / day windows"""
+
+    def __init__(self, bins=HEATMAP_BINS, hours=HEATMAP_HOURS, days=HEATMAP_DAYS,
+                 path=HEATMAP_PATH, save_seconds=HEATMAP_SAVE_SECONDS, utc_offset=None):
+        """
+        Initialize the heatmap (loads saved grids from path if present)
+
+        Args:
+            bins: Cells per side of the finest grid
+            hours: Hourly grids kept per page
+            days: Daily grids kept per page
+            path: .npz file the grids are saved to (None = memory only)
+            save_seconds: Shortest time between saves while taps arrive
+            utc_offset: Seconds east of UTC for day boundaries
+                (default: the local time zone)
+        """
+        self.bins = bins
+        self.keep = {'hour': hours, 'day': days}
+        self.path = path
+        self.save_seconds = save_seconds
+        self.utc_offset = local_utc_offset() if utc_offset is None else utc_offset
+
+        self.pages = {}
+        self._lock = threading.Lock()
+        # Held for a whole save() so two writers never share the temp file
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+        self.batches = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.load()
+
+    def bucket_of(self, window, timestamp):
+        return int((timestamp + self.utc_offset) // WINDOWS[window])
+
+    def bucket_start(self, window, bucket):
+        return bucket * WINDOWS[window] - self.utc_offset
+
+    def resolutions(self):
+        """Grid sizes that can be served (the finest halved while it divides)"""
+        sizes = [self.bins]
+        while sizes[-1] % 2 == 0 and sizes[-1] > 4:
+            sizes.append(sizes[-1] // 2)
+        return sizes
+
+    # ---------- ingestion ----------
+
+    def add_points(self, points, now=None):
+        """
+        Bin a batch of taps
+
+        Args:
+            points: Dicts with 'x', 'y' (percent, 0-100), 'page' and an
+                optional 'timestamp' (epoch ms or ISO time)
+            now: Unix time used for points without a timestamp
+
+        Returns:
+            (accepted, rejected) counts
+
+        Raises:
+            ValueError: More than MAX_BATCH_POINTS points
+        """
+        if len(points) > MAX_BATCH_POINTS:
+            raise ValueError(f"At most {MAX_BATCH_POINTS} points per batch")
+        now = time.time() if now is None else now
+
+        # Group by page so each page is one vectorized update
+        by_page = {}
+        rejected = 0
+        for point in points:
+            try:
+                x, y = float(point['x']), float(point['y'])
+                timestamp = min(parse_timestamp(point.get('timestamp'), now), now)
+            except (KeyError, TypeError, ValueError):
+                rejected += 1
+                continue
+            # Same rules the dashboard used: on screen and not the (0, 0) default
+            if not (0 <= x <= 100 and 0 <= y <= 100) or (x == 0 and y == 0):
+                rejected += 1
+                continue
+            page = str(point.get('page') or point.get('category') or 'unknown')
+            by_page.setdefault(page, []).append((x, y, timestamp))
+
+        with self._lock:
+            for page, rows in by_page.items():
+                self._add_page(page, np.array(rows, np.float64), now)
+            accepted = len(points) - rejected
+            self.batches += 1
+            self.accepted += accepted
+            self.rejected += rejected
+            self._dirty = self._dirty or accepted > 0
+            save = self._dirty and time.monotonic() - self._last_save >= self.save_seconds
+            if save:
+                # Claim this save so concurrent batches do not start another
+                self._last_save = time.monotonic()
+
+        if save:
+            self.save()
+        return accepted, rejected
+
+    def _add_page(self, page, rows, now):
+        grids = self.pages.get(page)
+        if grids is None:
+            grids = self.pages[page] = PageGrids(self.bins)
+
+        cols = np.minimum((rows[:, 0] * self.bins / 100).astype(int), self.bins - 1)
+        cells = np.minimum((rows[:, 1] * self.bins / 100).astype(int), self.bins - 1)
+        np.add.at(grids.total, (cells, cols), 1)
+
+        for window in WINDOWS:
+            buckets = (rows[:, 2] + self.utc_offset) // WINDOWS[window]
+            oldest = self.bucket_of(window, now) - self.keep[window] + 1
+            for bucket in np.unique(buckets):
+                if bucket < oldest:
+                    continue
+                mask = buckets == bucket
+                np.add.at(grids.grid(window, int(bucket), self.bins), (cells[mask], cols[mask]), 1)
+            self._prune(grids, window, oldest)
+
+        latest = float(rows[:, 2].max())
+        grids.last_click = latest if grids.last_click is None else max(grids.last_click, latest)
+
+    @staticmethod
+    def _prune(grids, window, oldest):
+        stale = [bucket for bucket in grids.buckets[window] if bucket < oldest]
+        for bucket in stale:
+            del grids.buckets[window][bucket]
+
+    # ---------- queries ----------
+
+    def query(self, page=ALL_PAGES, resolution=None, since=None, until=None):
+        """
+        Binned taps of a page over a time range
+
+        Hourly grids are used while since is within HEATMAP_HOURS, daily
+        grids (whole local days) beyond that and the all-time grid when
+        neither since nor until is given.
+
+        Args:
+            page: Page name, or '*' for every page
+            resolution: Cells per side (one of resolutions(); default finest)
+            since: Unix time of the first tap wanted
+            until: Unix time of the last tap wanted (default now)
+
+        Returns:
+            Dict with the grid as 'cells' (rows of counts, y then x),
+            'total', 'max' and the window actually covered
+
+        Raises:
+            ValueError: Unsupported resolution
+            KeyError: Unknown page
+        """
+        resolution = resolution or self.bins
+        if resolution not in self.resolutions():
+            raise ValueError(f"Unsupported resolution {resolution} "
+                             f"(choose from {', '.join(map(str, self.resolutions()))})")
+
+        now = time.time()
+        grid = np.zeros((self.bins, self.bins), np.int64)
+        with self._lock:
+            if page == ALL_PAGES:
+                pages = list(self.pages.values())
+            elif page in self.pages:
+                pages = [self.pages[page]]
+            else:
+                raise KeyError(page)
+
+            if since is None and until is None:
+                window, start, end = 'all', None, None
+                for grids in pages:
+                    grid += grids.total
+            else:
+                until = now if until is None else min(until, now)
+                since = 0.0 if since is None else since
+                window = 'hour' if self.bucket_of('hour', since) > \
+                    self.bucket_of('hour', now) - self.keep['hour'] else 'day'
+                first = max(self.bucket_of(window, since),
+                            self.bucket_of(window, now) - self.keep[window] + 1)
+                last = self.bucket_of(window, until)
+                for grids in pages:
+                    for bucket, counts in grids.buckets[window].items():
+                        if first <= bucket <= last:
+                            grid += counts
+                start = self.bucket_start(window, first)
+                end = self.bucket_start(window, last + 1)
+
+        if resolution != self.bins:
+            factor = self.bins // resolution
+            grid = grid.reshape(resolution, factor, resolution, factor).sum(axis=(1, 3))
+
+        return {
+            'page': page,
+            'resolution': resolution,
+            'window': window,
+            'start': int(start * 1000) if start is not None else None,
+            'end': int(end * 1000) if end is not None else None,
+            'total': int(grid.sum()),
+            'max': int(grid.max()),
+            'cells': grid.tolist()
+        }
+
+    def page_summaries(self):
+        """Every page with its all-time tap count and last tap (epoch ms)"""
+        with self._lock:
+            return [
+                {
+                    'page': page,
+                    'total': int(grids.total.sum()),
+                    'last_click': int(grids.last_click * 1000) if grids.last_click else None
+                }
+                for page, grids in sorted(self.pages.items())
+            ]
+
+    # ---------- persistence ----------
+
+    def save(self):
+        """Write every page's grids to the .npz file"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                index, grids = [], []
+                for page, page_grids in self.pages.items():
+                    index.append([page, 'total', page_grids.last_click])
+                    grids.append(page_grids.total.copy())
+                    for window, buckets in page_grids.buckets.items():
+                        for bucket, counts in buckets.items():
+                            index.append([page, window, bucket])
+                            grids.append(counts.copy())
+                self._dirty = False
+                self._last_save = time.monotonic()
+            if not grids:
+                return
+            try:
+                tmp_path = self.path + '.tmp.npz'
+                np.savez_compressed(tmp_path, index=np.array(json.dumps(index)), grids=np.stack(grids))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"❌ Could not save click heatmap: {e}")
+
+    def load(self):
+        """Restore grids saved by save() (skipped if HEATMAP_BINS changed)"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                index, grids = json.loads(str(saved['index'])), saved['grids']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️  Ignoring unreadable click heatmap {self.path}: {e}")
+            return
+        if grids.shape[1:] != (self.bins, self.bins):
+            logger.warning("⚠️  Saved click heatmap has another grid size - ignored")
+            return
+
+        now = time.time()
+        for (page, window, key), counts in zip(index, grids):
+            page_grids = self.pages.get(page)
+            if page_grids is None:
+                page_grids = self.pages[page] = PageGrids(self.bins)
+            if window == 'total':
+                page_grids.total[:] = counts
+                page_grids.last_click = key
+            elif key > self.bucket_of(window, now) - self.keep[window]:
+                page_grids.buckets[window][key] = counts.astype(np.int32)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pages': len(self.pages),
+                'bins': self.bins,
+                'batches': self.batches,
+                'accepted': self.accepted,
+                'rejected': self.rejected
+            }
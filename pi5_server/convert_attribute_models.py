@@ -0,0 +1,221 @@
+"""
+Convert and Validate Quantized Attribute Models
+Exports DeepFace's age, gender and emotion models to TFLite and/or ONNX at
+int8 or float16 precision, then checks every converted backend against
+DeepFace on the sample faces before it is used.
+
+    python convert_attribute_models.py                       # everything
+    python convert_attribute_models.py --format tflite --precision int8
+    python convert_attribute_models.py --validate-only
+
+Needs tensorflow + deepface (conversion), tf2onnx + onnx +
+onnxconverter-common (ONNX export), tflite-runtime or tensorflow and
+onnxruntime (validation). The Pi only needs the runtime of the backend it
+uses; the conversion can run on any machine.
+
+Outputs land in FACE_MODELS_DIR as {action}_{precision}.{format}; select
+them with ATTRIBUTE_BACKEND=tflite|onnx and ATTRIBUTE_PRECISION=int8|float16.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from attribute_models import (
+    ACTIONS, FACE_INPUT_SIZE, EMOTION_INPUT_SIZE, DeepFaceAttributeModels,
+    create_attribute_models, emotion_input, model_path, preprocess_face
+)
+from face_analysis import crop_face
+from face_detectors import SAMPLES_DIR, get_detector, load_sample_set
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('tflite', 'onnx')
+PRECISIONS = ('int8', 'float16')
+
+# Acceptance limits against DeepFace on the sample faces
+MAX_AGE_MAE = 3.0
+MIN_GENDER_AGREEMENT = 0.95
+MIN_EMOTION_AGREEMENT = 0.85
+CALIBRATION_FACES = 200
+
+
+def load_face_crops(path=SAMPLES_DIR):
+    """
+    Face crops from the sample set (Haar boxes, same padding as the server)
+
+    Images without a detectable face are used whole.
+    """
+    detector = get_detector('haar')
+    crops = []
+    for _, image, boxes in load_sample_set(path):
+        if boxes is None:
+            boxes, _ = detector.detect(image)
+        if len(boxes) == 0:
+            crops.append(image)
+        crops.extend(crop_face(image, tuple(int(v) for v in box)) for box in boxes)
+    return crops
+
+
+def model_inputs(action, crops):
+    """Preprocessed float32 inputs of one model for every crop"""
+    faces = [preprocess_face(crop) for crop in crops]
+    if action == 'emotion':
+        return np.stack([emotion_input(face) for face in faces])
+    return np.stack(faces)
+
+
+def input_shape(action):
+    if action == 'emotion':
+        return (*EMOTION_INPUT_SIZE, 1)
+    return (*FACE_INPUT_SIZE, 3)
+
+
+# ---------- conversion ----------
+
+def convert_tflite(model, action, precision, calibration):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if precision == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif len(calibration):
+        # Full int8 weights + activations; inputs / outputs stay float32
+        converter.representative_dataset = lambda: ([x[np.newaxis]] for x in calibration)
+    else:
+        logger.warning(f"⚠️  No sample faces - {action} int8 uses dynamic-range quantization")
+
+    path = model_path(action, 'tflite', precision)
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    return path
+
+
+def convert_onnx(model, action, precision):
+    import onnx
+    import tensorflow as tf
+    import tf2onnx
+
+    path = model_path(action, 'onnx', precision)
+    signature = (tf.TensorSpec((None, *input_shape(action)), tf.float32, name='input'),)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, f"{action}.onnx")
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=float_path)
+
+        if precision == 'float16':
+            from onnxconverter_common import float16
+
+            onnx.save(float16.convert_float_to_float16(onnx.load(float_path), keep_io_types=True), path)
+        else:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(float_path, path, weight_type=QuantType.QInt8)
+    return path
+
+
+def convert(formats, precisions, crops):
+    reference = DeepFaceAttributeModels()
+    for action in ACTIONS:
+        model = reference.build(action)
+        calibration = model_inputs(action, crops[:CALIBRATION_FACES]) if crops else []
+        for fmt in formats:
+            for precision in precisions:
+                start = time.perf_counter()
+                if fmt == 'tflite':
+                    path = convert_tflite(model, action, precision, calibration)
+                else:
+                    path = convert_onnx(model, action, precision)
+                logger.info(f"✅ {os.path.basename(path)} "
+                            f"({os.path.getsize(path) / 1e6:.1f} MB, {time.perf_counter() - start:.0f}s)")
+
+
+# ---------- validation ----------
+
+def timed_predict(models, crops):
+    models.warm_up()
+    start = time.perf_counter()
+    results = models.predict(crops)
+    return results, (time.perf_counter() - start) * 1000 / len(crops)
+
+
+def validate(formats, precisions, crops):
+    """
+    Compare every converted backend with DeepFace on the same crops
+
+    Returns:
+        List of report rows; 'ok' is False for rows outside the limits
+    """
+    reference, reference_ms = timed_predict(DeepFaceAttributeModels(), crops)
+    rows = [{'backend': 'deepface', 'ms_per_face': round(reference_ms, 1), 'ok': True}]
+
+    for fmt in formats:
+        for precision in precisions:
+            try:
+                models = create_attribute_models(fmt, strict=True, precision=precision)
+                results, ms = timed_predict(models, crops)
+            except (ImportError, FileNotFoundError) as e:
+                rows.append({'backend': f"{fmt}-{precision}", 'error': str(e), 'ok': False})
+                continue
+
+            age_mae = float(np.mean([abs(r['age'] - d['age']) for r, d in zip(results, reference)]))
+            gender = float(np.mean([r['dominant_gender'] == d['dominant_gender']
+                                    for r, d in zip(results, reference)]))
+            emotion = float(np.mean([r['dominant_emotion'] == d['dominant_emotion']
+                                     for r, d in zip(results, reference)]))
+            same_schema = all(set(r) == set(d) for r, d in zip(results, reference))
+            size_mb = sum(os.path.getsize(model_path(a, fmt, precision)) for a in ACTIONS) / 1e6
+
+            rows.append({
+                'backend': f"{fmt}-{precision}",
+                'ms_per_face': round(ms, 1),
+                'speedup': round(reference_ms / ms, 1) if ms else None,
+                'size_mb': round(size_mb, 1),
+                'age_mae': round(age_mae, 2),
+                'gender_agreement': round(gender, 3),
+                'emotion_agreement': round(emotion, 3),
+                'ok': (same_schema and age_mae <= MAX_AGE_MAE
+                       and gender >= MIN_GENDER_AGREEMENT and emotion >= MIN_EMOTION_AGREEMENT)
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Convert and validate quantized attribute models')
+    parser.add_argument('--format', default=','.join(FORMATS), help='tflite, onnx or both')
+    parser.add_argument('--precision', default=','.join(PRECISIONS), help='int8, float16 or both')
+    parser.add_argument('--samples', default=SAMPLES_DIR, help='Sample image directory')
+    parser.add_argument('--validate-only', action='store_true', help='Skip the conversion')
+    args = parser.parse_args()
+
+    formats = [f for f in args.format.split(',') if f in FORMATS]
+    precisions = [p for p in args.precision.split(',') if p in PRECISIONS]
+    face_crops = load_face_crops(args.samples)
+    logger.info(f"{len(face_crops)} sample faces from {args.samples}")
+
+    if not args.validate_only:
+        convert(formats, precisions, face_crops)
+
+    if not face_crops:
+        logger.warning("⚠️  No sample faces - validation skipped")
+        sys.exit(0)
+
+    table = validate(formats, precisions, face_crops)
+    print(f"\n{'backend':<16}{'ms/face':>9}{'size MB':>9}{'age MAE':>9}{'gender':>8}{'emotion':>9}  ok")
+    for row in table:
+        if 'error' in row:
+            print(f"{row['backend']:<16}  {row['error']}")
+            continue
+        print(f"{row['backend']:<16}{row['ms_per_face']:>9}{row.get('size_mb', ''):>9}"
+              f"{row.get('age_mae', ''):>9}{row.get('gender_agreement', ''):>8}"
+              f"{row.get('emotion_agreement', ''):>9}  {'yes' if row['ok'] else 'NO'}")
+    sys.exit(0 if all(row['ok'] for row in table) else 1)
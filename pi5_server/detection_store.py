@@ -0,0 +1,368 @@
+"""
+Detection Store
+Durable on-device history of face detections, presence events and visits
+in an SQLite database (WAL mode). The pipeline only appends to an in-memory
+batch; a writer thread inserts batches in one transaction every
+STORE_FLUSH_SECONDS (or once STORE_BATCH_SIZE rows are waiting) and
+applies the retention limits.
+
+Rows are read with a cursor - the row id, which only ever grows - so a
+dashboard asks for ?since=<cursor> and gets just the rows it has not
+seen yet. Reads never flush: a row shows up once the writer thread has
+stored it, within STORE_FLUSH_SECONDS. Faces are stored per track as
+well, indexed by track id and time.
+
+STORE_PATH sets the database file, STORE_RETENTION_DAYS and
+STORE_MAX_ROWS the time- and size-based retention.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.environ.get('STORE_PATH', os.path.join(BASE_DIR, 'kiosk.db'))
+STORE_FLUSH_SECONDS = float(os.environ.get('STORE_FLUSH_SECONDS', '1.0'))
+STORE_BATCH_SIZE = int(os.environ.get('STORE_BATCH_SIZE', '200'))
+STORE_RETENTION_DAYS = float(os.environ.get('STORE_RETENTION_DAYS', '30'))
+STORE_MAX_ROWS = int(os.environ.get('STORE_MAX_ROWS', '200000'))
+STORE_PRUNE_SECONDS = float(os.environ.get('STORE_PRUNE_SECONDS', '300'))
+
+MAX_PAGE_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    frame_seq INTEGER,
+    faces INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_ts ON detections (ts);
+
+CREATE TABLE IF NOT EXISTS faces (
+    detection_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    track_id INTEGER,
+    x INTEGER, y INTEGER, width INTEGER, height INTEGER,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS idx_faces_track ON faces (track_id, ts);
+CREATE INDEX IF NOT EXISTS idx_faces_detection ON faces (detection_id);
+
+CREATE TABLE IF NOT EXISTS presence_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    state TEXT NOT NULL,
+    previous TEXT,
+    reason TEXT,
+    distance REAL
+);
+CREATE INDEX IF NOT EXISTS idx_presence_ts ON presence_events (ts);
+
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    enter REAL NOT NULL,
+    dwell REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_visits_ts ON visits (ts);
+"""
+
+
+class DetectionStore:
+    """SQLite-backed detection / presence / visit history with batched writes"""
+
+    def __init__(self, path=STORE_PATH, flush_seconds=STORE_FLUSH_SECONDS,
+                 batch_size=STORE_BATCH_SIZE, retention_days=STORE_RETENTION_DAYS,
+                 max_rows=STORE_MAX_ROWS, prune_seconds=STORE_PRUNE_SECONDS,
+                 name='detection-store'):
+        """
+        Open (or create) the database
+
+        Args:
+            path: SQLite file (':memory:' for a throwaway store)
+            flush_seconds: Longest time a row waits in the batch
+            batch_size: Pending rows that trigger an early flush
+            retention_days: Rows older than this are deleted (0 = keep)
+            max_rows: Most rows kept per table (0 = no limit)
+            prune_seconds: How often retention runs
+            name: Name of the writer thread
+        """
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.prune_seconds = prune_seconds
+        self._name = name
+
+        # One connection shared under a lock; WAL keeps readers in other
+        # processes (sqlite3 CLI, backups) from blocking the writer
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+
+        self._pending_detections = []
+        self._pending_presence = []
+        self._pending_visits = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._last_prune = 0.0
+
+        self.inserted = 0
+        self.batches = 0
+        self.pruned = 0
+        self.errors = 0
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the writer thread (no-op if already running)"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the writer thread and write whatever is still pending"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while self._running:
+            with self._condition:
+                if self._pending_count() < self.batch_size:
+                    self._condition.wait(self.flush_seconds)
+            try:
+                self.flush()
+                if time.monotonic() - self._last_prune >= self.prune_seconds:
+                    self.prune()
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.error(f"❌ Detection store write failed: {e}")
+                time.sleep(1)
+
+    def _pending_count(self):
+        return len(self._pending_detections) + len(self._pending_presence) + len(self._pending_visits)
+
+    # ---------- writes ----------
+
+    def add_detection(self, detection, timestamp=None):
+        """Queue a detection dict (faces with track_id / box / confidence)"""
+        row = (time.time() if timestamp is None else timestamp, detection)
+        with self._condition:
+            self._pending_detections.append(row)
+            if len(self._pending_detections) >= self.batch_size:
+                self._condition.notify_all()
+
+    def add_presence_event(self, state, previous=None, reason=None, distance=None, timestamp=None):
+        """Queue a presence state change"""
+        row = (time.time() if timestamp is None else timestamp, state, previous, reason, distance)
+        with self._condition:
+            self._pending_presence.append(row)
+
+    def add_visit(self, visit):
+        """Queue a closed visit record (visits.Visit.to_dict())"""
+        row = (visit['exit'] / 1000, visit['enter'] / 1000, visit['dwell_s'], visit)
+        with self._condition:
+            self._pending_visits.append(row)
+
+    def flush(self):
+        """Insert every pending row in one transaction"""
+        with self._condition:
+            detections, self._pending_detections = self._pending_detections, []
+            presence, self._pending_presence = self._pending_presence, []
+            visits, self._pending_visits = self._pending_visits, []
+        if not detections and not presence and not visits:
+            return 0
+
+        try:
+            self._insert(detections, presence, visits)
+        except sqlite3.Error:
+            # Rolled back - put the rows back for the next attempt
+            with self._condition:
+                self._pending_detections[:0] = detections
+                self._pending_presence[:0] = presence
+                self._pending_visits[:0] = visits
+            raise
+        count = len(detections) + len(presence) + len(visits)
+        self.inserted += count
+        self.batches += 1
+        return count
+
+    def _insert(self, detections, presence, visits):
+        with self._db_lock, self._db:
+            for ts, detection in detections:
+                faces = detection.get('faces') or []
+                cursor = self._db.execute(
+                    'INSERT INTO detections (ts, frame_seq, faces, data) VALUES (?, ?, ?, ?)',
+                    (ts, detection.get('frame_seq'), len(faces), json.dumps(detection, default=str))
+                )
+                self._db.executemany(
+                    'INSERT INTO faces (detection_id, ts, track_id, x, y, width, height, confidence) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(cursor.lastrowid, ts, face.get('track_id'), face.get('x'), face.get('y'),
+                      face.get('width'), face.get('height'), face.get('confidence'))
+                     for face in faces]
+                )
+            self._db.executemany(
+                'INSERT INTO presence_events (ts, state, previous, reason, distance) '
+                'VALUES (?, ?, ?, ?, ?)', presence
+            )
+            self._db.executemany(
+                'INSERT INTO visits (ts, enter, dwell, data) VALUES (?, ?, ?, ?)',
+                [(ts, enter, dwell, json.dumps(visit, default=str)) for ts, enter, dwell, visit in visits]
+            )
+
+    def prune(self, now=None):
+        """Apply the time- and size-based retention limits"""
+        now = time.time() if now is None else now
+        self._last_prune = time.monotonic()
+        deleted = 0
+        with self._db_lock, self._db:
+            for table in ('detections', 'presence_events', 'visits'):
+                if self.retention_days:
+                    deleted += self._db.execute(
+                        f'DELETE FROM {table} WHERE ts < ?',
+                        (now - self.retention_days * 86400,)
+                    ).rowcount
+                if self.max_rows:
+                    deleted += self._db.execute(
+                        f'DELETE FROM {table} WHERE id <= '
+                        f'(SELECT id FROM {table} ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                        (self.max_rows,)
+                    ).rowcount
+            self._db.execute(
+                'DELETE FROM faces WHERE detection_id < (SELECT COALESCE(MIN(id), 0) FROM detections)'
+            )
+        self.pruned += deleted
+        return deleted
+
+    # ---------- reads ----------
+
+    def _page(self, table, since, until, limit, extra_where='', extra_args=()):
+        """Rows after the since cursor (oldest first), or the newest rows without one"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, args = [], []
+        if since is not None:
+            where.append(f'{table}.id > ?')
+            args.append(since)
+        if until is not None:
+            where.append(f'{table}.ts <= ?')
+            args.append(until)
+        if extra_where:
+            where.append(extra_where)
+            args.extend(extra_args)
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+        order = 'ASC' if since is not None else 'DESC'
+
+        with self._db_lock:
+            rows = self._db.execute(
+                f'SELECT * FROM {table} {clause} ORDER BY {table}.id {order} LIMIT ?',
+                (*args, limit + 1)
+            ).fetchall()
+            columns = [d[0] for d in self._db.execute(f'SELECT * FROM {table} LIMIT 0').description]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if order == 'DESC':
+            rows.reverse()
+        return [dict(zip(columns, row)) for row in rows], has_more
+
+    def detections(self, since=None, until=None, limit=50, track_id=None, count=False):
+        """
+        Page through stored detections
+
+        Args:
+            since: Cursor from a previous page; only newer rows are returned
+                (oldest first). None returns the newest `limit` rows.
+            until: Only rows up to this Unix time (seconds)
+            limit: Page size (capped at MAX_PAGE_SIZE)
+            track_id: Only detections containing this track
+            count: Add 'total', the number of detections stored (a full
+                table scan - leave off for frequent polling)
+
+        Returns:
+            Dict with 'detections', 'cursor' (pass as since next time),
+            'has_more' and, with count, 'total'
+
+        Raises:
+            sqlite3.Error: The database could not be read
+        """
+        extra, extra_args = '', ()
+        if track_id is not None:
+            extra = 'detections.id IN (SELECT detection_id FROM faces WHERE track_id = ?)'
+            extra_args = (track_id,)
+        rows, has_more = self._page('detections', since, until, limit, extra, extra_args)
+
+        detections = []
+        for row in rows:
+            detection = json.loads(row['data'])
+            detection['cursor'] = row['id']
+            detections.append(detection)
+        cursor = rows[-1]['id'] if rows else since
+        page = {'detections': detections, 'cursor': cursor, 'has_more': has_more}
+        if count:
+            with self._db_lock:
+                page['total'] = self._db.execute('SELECT COUNT(*) FROM detections').fetchone()[0]
+        return page
+
+    def presence_events(self, since=None, until=None, limit=50):
+        """Page through presence state changes (same cursor rules as detections)"""
+        rows, has_more = self._page('presence_events', since, until, limit)
+        for row in rows:
+            row['cursor'] = row.pop('id')
+        cursor = rows[-1]['cursor'] if rows else since
+        return {'events': rows, 'cursor': cursor, 'has_more': has_more}
+
+    def visits(self, since=None, until=None, limit=50):
+        """Page through closed visits by exit time (same cursor rules as detections)"""
+        rows, has_more = self._page('visits', since, until, limit)
+        visits = []
+        for row in rows:
+            visit = json.loads(row['data'])
+            visit['cursor'] = row['id']
+            visits.append(visit)
+        cursor = rows[-1]['id'] if rows else since
+        return {'visits': visits, 'cursor': cursor, 'has_more': has_more}
+
+    def latest_detection(self):
+        """Newest stored detection (survives restarts), or None"""
+        rows = self.detections(limit=1)['detections']
+        return rows[0] if rows else None
+
+    def stats(self):
+        """Row counts and writer counters for status endpoints"""
+        with self._db_lock:
+            detections = self._db.execute('SELECT COUNT(*) FROM detections').fetchone()[0]
+            events = self._db.execute('SELECT COUNT(*) FROM presence_events').fetchone()[0]
+            visits = self._db.execute('SELECT COUNT(*) FROM visits').fetchone()[0]
+        with self._condition:
+            pending = self._pending_count()
+        return {
+            'path': self.path,
+            'detections': detections,
+            'presence_events': events,
+            'visits': visits,
+            'pending': pending,
+            'inserted': self.inserted,
+            'batches': self.batches,
+            'pruned': self.pruned,
+            'errors': self.errors
+        }
@@ -0,0 +1,314 @@
+"""
+Ultrasonic Ranging Service
+One thread owns the HC-SR04: it fires the trigger pulse at a fixed rate and
+times the echo from GPIO edge callbacks (time.monotonic_ns() at each edge)
+instead of spinning on GPIO.input(). A missing echo times out after the
+longest possible round trip, so the thread never hangs.
+
+Raw samples go through a median / outlier filter over a short window and
+the filtered reading is published with its sample time. The presence loop
+and /api/distance read that cached reading - nothing else pulses the
+sensor, so concurrent measurements can no longer corrupt each other.
+
+DISTANCE_INTERVAL sets the ranging period (the HC-SR04 needs >= 60 ms
+between pulses), DISTANCE_WINDOW the filter length, DISTANCE_MAX_CM the
+range beyond which a sample counts as "nothing there".
+"""
+
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DISTANCE_INTERVAL = float(os.environ.get('DISTANCE_INTERVAL', '0.06'))
+DISTANCE_WINDOW = int(os.environ.get('DISTANCE_WINDOW', '5'))
+DISTANCE_MIN_CM = float(os.environ.get('DISTANCE_MIN_CM', '2'))
+DISTANCE_MAX_CM = float(os.environ.get('DISTANCE_MAX_CM', '400'))
+DISTANCE_OUTLIER_CM = float(os.environ.get('DISTANCE_OUTLIER_CM', '20'))
+DISTANCE_MAX_AGE = float(os.environ.get('DISTANCE_MAX_AGE', '0.5'))
+
+# Half the speed of sound (34300 cm/s) - the echo covers the distance twice
+CM_PER_NS = 34300 / 2 / 1e9
+
+# The echo line goes high ~0.5 ms after the trigger; allow some scheduling slack
+ECHO_START_SECONDS = 0.01
+
+
+def filter_samples(samples, outlier_cm=DISTANCE_OUTLIER_CM):
+    """
+    Median / outlier filter over a window of raw distances
+
+    Samples further than max(outlier_cm, 3 * MAD) from the window median
+    are dropped; the rest are averaged.
+
+    Returns:
+        (distance, inliers) - distance is None for an empty window
+    """
+    if not samples:
+        return None, []
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples)
+    limit = max(outlier_cm, 3 * mad)
+    inliers = [s for s in samples if abs(s - median) <= limit]
+    return sum(inliers) / len(inliers), inliers
+
+
+class DistanceReading:
+    """A filtered distance tagged with its sequence number and sample time"""
+
+    __slots__ = ('seq', 'distance', 'raw', 'samples', 'timestamp', 'wall_time')
+
+    def __init__(self, seq, distance, raw, samples, timestamp, wall_time):
+        """
+        Args:
+            seq: Sequence number of the ranging cycle
+            distance: Filtered distance in cm, None if nothing is in range
+            raw: This cycle's raw distance in cm (None on timeout / out of range)
+            samples: Number of samples the filtered value is based on
+            timestamp: time.monotonic() of the sample
+            wall_time: time.time() of the sample
+        """
+        self.seq = seq
+        self.distance = distance
+        self.raw = raw
+        self.samples = samples
+        self.timestamp = timestamp
+        self.wall_time = wall_time
+
+    def age_ms(self, now=None):
+        """Milliseconds since the sample was taken"""
+        now = time.monotonic() if now is None else now
+        return int((now - self.timestamp) * 1000)
+
+    def to_dict(self):
+        return {
+            'distance': round(self.distance, 2) if self.distance is not None else None,
+            'raw': round(self.raw, 2) if self.raw is not None else None,
+            'samples': self.samples,
+            'sampled_at': int(self.wall_time * 1000),
+            'age_ms': self.age_ms()
+        }
+
+
+class UltrasonicRanger:
+    """Range continuously with an HC-SR04 and publish filtered readings"""
+
+    def __init__(self, gpio, trigger_pin, echo_pin, interval=DISTANCE_INTERVAL,
+                 window=DISTANCE_WINDOW, min_cm=DISTANCE_MIN_CM, max_cm=DISTANCE_MAX_CM,
+                 outlier_cm=DISTANCE_OUTLIER_CM, max_age=DISTANCE_MAX_AGE,
+                 name='ultrasonic-ranger'):
+        """
+        Initialize the ranger (pins must already be set up)
+
+        Args:
+            gpio: The RPi.GPIO module
+            trigger_pin: BCM pin wired to TRIG
+            echo_pin: BCM pin wired to ECHO
+            interval: Seconds between trigger pulses
+            window: Number of recent samples the filter looks at
+            min_cm: Shorter samples are treated as noise
+            max_cm: Longer samples (and missing echoes) mean nothing in range
+            outlier_cm: Minimum distance from the median that counts as outlier
+            max_age: Samples older than this drop out of the window
+            name: Name of the ranging thread
+        """
+        self._gpio = gpio
+        self.trigger_pin = trigger_pin
+        self.echo_pin = echo_pin
+        self.interval = interval
+        self.min_cm = min_cm
+        self.max_cm = max_cm
+        self.outlier_cm = outlier_cm
+        self.max_age = max_age
+        self._name = name
+
+        # Longest possible round trip plus the delay before the echo starts
+        self.echo_timeout = ECHO_START_SECONDS + 2 * max_cm / 34300
+
+        self._window = deque(maxlen=max(1, window))
+        self._condition = threading.Condition()
+        self._latest = None
+        self._thread = None
+        self._running = False
+        self._seq = 0
+
+        # Edge state, written by the GPIO callback thread
+        self._edge_lock = threading.Lock()
+        self._armed = False
+        self._rise_ns = None
+        self._fall_ns = None
+        self._echo_done = threading.Event()
+
+        self.timeouts = 0
+        self.out_of_range = 0
+        self.outliers = 0
+        self.busy = 0
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Register the echo edge callback and start ranging"""
+        if self._running:
+            return True
+        try:
+            self._gpio.add_event_detect(self.echo_pin, self._gpio.BOTH, callback=self._on_edge)
+        except Exception as e:
+            logger.error(f"❌ Echo edge detection unavailable: {e}")
+            return False
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+        logger.info("📏 Ultrasonic ranging started")
+        return True
+
+    def stop(self, timeout=1.0):
+        """Stop ranging and remove the edge callback"""
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        try:
+            self._gpio.remove_event_detect(self.echo_pin)
+        except Exception:
+            pass
+
+    @property
+    def running(self):
+        return self._running
+
+    # ---------- ranging ----------
+
+    def _on_edge(self, channel):
+        """GPIO callback: first edge after the trigger is the rise, then the fall"""
+        now = time.monotonic_ns()
+        with self._edge_lock:
+            if not self._armed:
+                return
+            if self._rise_ns is None:
+                self._rise_ns = now
+            else:
+                self._fall_ns = now
+                self._armed = False
+                self._echo_done.set()
+
+    def _ping(self):
+        """
+        Fire one trigger pulse and wait for its echo
+
+        Returns:
+            Raw distance in cm, or None on timeout / echo line stuck high
+        """
+        if self._gpio.input(self.echo_pin):
+            # Echo of an earlier pulse (or a fault) still holds the line
+            self.busy += 1
+            return None
+
+        with self._edge_lock:
+            self._rise_ns = None
+            self._fall_ns = None
+            self._armed = True
+            self._echo_done.clear()
+
+        self._gpio.output(self.trigger_pin, True)
+        time.sleep(0.00001)
+        self._gpio.output(self.trigger_pin, False)
+
+        got_echo = self._echo_done.wait(self.echo_timeout)
+        with self._edge_lock:
+            self._armed = False
+            rise, fall = self._rise_ns, self._fall_ns
+
+        if not got_echo or rise is None or fall is None:
+            self.timeouts += 1
+            return None
+        return (fall - rise) * CM_PER_NS
+
+    def _run(self):
+        next_deadline = time.monotonic()
+
+        while self._running:
+            try:
+                raw = self._ping()
+                self._record(raw)
+            except Exception as e:
+                logger.error(f"❌ Distance measurement error: {e}")
+                time.sleep(0.5)
+
+            next_deadline += self.interval
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_deadline = time.monotonic()
+
+    def _record(self, raw):
+        """Add one raw sample to the window and publish the filtered reading"""
+        now = time.monotonic()
+        if raw is not None and not (self.min_cm <= raw <= self.max_cm):
+            self.out_of_range += 1
+            raw = None
+
+        # Timeouts stay in the window as "nothing in range" so a visitor
+        # walking away clears the reading within one window
+        self._window.append((now, raw))
+        while self._window and now - self._window[0][0] > self.max_age:
+            self._window.popleft()
+
+        values = [v for _, v in self._window if v is not None]
+        if len(values) * 2 <= len(self._window):
+            distance, inliers = None, []
+        else:
+            distance, inliers = filter_samples(values, self.outlier_cm)
+            if raw is not None and raw not in inliers:
+                self.outliers += 1
+
+        with self._condition:
+            self._seq += 1
+            self._latest = DistanceReading(self._seq, distance, raw, len(inliers),
+                                           now, time.time())
+            self._condition.notify_all()
+
+    # ---------- consumers ----------
+
+    def latest(self):
+        """Return the newest reading, or None before the first cycle"""
+        return self._latest
+
+    def wait_for_reading(self, after_seq=0, timeout=1.0):
+        """
+        Block until a reading newer than after_seq is available
+
+        Returns:
+            The newest DistanceReading, or None on timeout / when stopped
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._running:
+                if self._latest and self._latest.seq > after_seq:
+                    return self._latest
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return None
+
+    def stats(self):
+        """Ranging counters for status endpoints"""
+        latest = self._latest
+        return {
+            'running': self._running,
+            'cycles': self._seq,
+            'timeouts': self.timeouts,
+            'out_of_range': self.out_of_range,
+            'outliers': self.outliers,
+            'echo_busy': self.busy,
+            'interval_ms': int(self.interval * 1000),
+            'latest': latest.to_dict() if latest else None
+        }
@@ -0,0 +1,231 @@
+"""
+Dwell Heatmap
+Where people stand in front of the kiosk, accumulated from the face
+pipeline without any per-event writes. Every analyzed frame adds the time
+since the previous frame to the grid cell under each face-box centre, so
+a cell's value is face-seconds spent there.
+
+- live      decaying grid (half-life DWELL_HALF_LIFE seconds) - recent
+            engagement, fades when nobody is around
+- snapshots one undecayed grid per hour, DWELL_SNAPSHOTS of them kept
+            and saved to DWELL_PATH
+
+Grids are small (DWELL_GRID cells, camera aspect) and are served as a
+colour-mapped PNG, JSON or raw .npy.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DWELL_PATH = os.environ.get('DWELL_PATH', os.path.join(BASE_DIR, 'dwell.npz'))
+DWELL_GRID = tuple(int(v) for v in os.environ.get('DWELL_GRID', '64x48').split('x'))
+DWELL_HALF_LIFE = float(os.environ.get('DWELL_HALF_LIFE', '600'))
+DWELL_SNAPSHOTS = int(os.environ.get('DWELL_SNAPSHOTS', '168'))
+DWELL_SNAPSHOT_SECONDS = 3600
+
+# Longest gap between frames credited as dwell (e.g. the pipeline slept)
+DWELL_MAX_STEP = 1.0
+
+
+class DwellHeatmap:
+    """Decaying face-position dwell grid with hourly snapshots"""
+
+    def __init__(self, grid=DWELL_GRID, half_life=DWELL_HALF_LIFE, snapshots=DWELL_SNAPSHOTS,
+                 snapshot_seconds=DWELL_SNAPSHOT_SECONDS, path=DWELL_PATH):
+        """
+        Initialize the heatmap (loads saved snapshots from path if present)
+
+        Args:
+            grid: (columns, rows) of the grid
+            half_life: Seconds for the live grid to decay to half
+            snapshots: Number of hourly snapshots kept
+            snapshot_seconds: Snapshot period
+            path: .npz file for the snapshots (None = memory only)
+        """
+        self.columns, self.rows = grid
+        self.half_life = half_life
+        self.snapshot_seconds = snapshot_seconds
+        self.path = path
+
+        self._live = np.zeros((self.rows, self.columns), np.float32)
+        self._period = np.zeros_like(self._live)
+        self._period_start = None
+        self._snapshots = deque(maxlen=snapshots)
+        self._updated = None
+        self._last_frame = None
+        self._lock = threading.Lock()
+        # One save at a time - concurrent saves would share the temp file
+        self._save_lock = threading.Lock()
+
+        self.frames = 0
+        self.observations = 0
+        self.load()
+
+    def _decay(self, now):
+        if self._updated is not None and self.half_life:
+            self._live *= 0.5 ** ((now - self._updated) / self.half_life)
+        self._updated = now
+
+    def _roll_period(self, now):
+        """Close the hourly grid once its period is over"""
+        start = now - now % self.snapshot_seconds
+        closed = False
+        if self._period_start is not None and start != self._period_start:
+            if self._period.any():
+                self._snapshots.append((self._period_start, self._period.copy()))
+                closed = True
+            self._period[:] = 0
+        elif self._period_start is None and self._snapshots and self._snapshots[-1][0] == start:
+            # Restarted within the hour that was saved on shutdown - continue it
+            self._period[:] = self._snapshots.pop()[1]
+        self._period_start = start
+        return closed
+
+    def record(self, faces, frame_size, timestamp=None):
+        """
+        Add one analyzed frame (call it for frames without faces too)
+
+        Args:
+            faces: Face dicts with 'x', 'y', 'width', 'height'
+            frame_size: (width, height) the boxes refer to
+            timestamp: Unix time of the frame (default now)
+        """
+        now = time.time() if timestamp is None else timestamp
+        width, height = frame_size
+
+        with self._lock:
+            step = 0.0 if self._last_frame is None else min(max(now - self._last_frame, 0.0),
+                                                           DWELL_MAX_STEP)
+            self._last_frame = now
+            self.frames += 1
+            self._decay(now)
+            closed = self._roll_period(now)
+
+            if faces and step:
+                cx = np.array([f['x'] + f['width'] / 2 for f in faces], np.float32)
+                cy = np.array([f['y'] + f['height'] / 2 for f in faces], np.float32)
+                cols = np.clip((cx * self.columns / width).astype(int), 0, self.columns - 1)
+                rows = np.clip((cy * self.rows / height).astype(int), 0, self.rows - 1)
+                np.add.at(self._live, (rows, cols), step)
+                np.add.at(self._period, (rows, cols), step)
+                self.observations += len(faces)
+
+        if closed:
+            self.save()
+
+    def grid(self, at=None):
+        """
+        A dwell grid (rows x columns, face-seconds)
+
+        Args:
+            at: None for the live (decayed) grid, or a Unix time whose
+                hourly snapshot is wanted (the current hour is included)
+
+        Returns:
+            (grid, period start or None) - grid is None if no snapshot covers at
+        """
+        with self._lock:
+            if at is None:
+                self._decay(time.time())
+                return self._live.copy(), None
+
+            start = at - at % self.snapshot_seconds
+            if start == self._period_start:
+                return self._period.copy(), start
+            for snapshot_start, snapshot in self._snapshots:
+                if snapshot_start == start:
+                    return snapshot.copy(), start
+        return None, start
+
+    def snapshot_times(self):
+        """Start times of the stored hourly snapshots (oldest first)"""
+        with self._lock:
+            return [start for start, _ in self._snapshots]
+
+    # ---------- output formats ----------
+
+    @staticmethod
+    def to_png(grid, width=None):
+        """Colour-mapped PNG (JET, scaled to the grid maximum)"""
+        peak = float(grid.max())
+        scaled = (grid / peak * 255).astype(np.uint8) if peak > 0 else np.zeros(grid.shape, np.uint8)
+        image = cv2.applyColorMap(scaled, cv2.COLORMAP_JET)
+        if width:
+            height = max(1, round(width * grid.shape[0] / grid.shape[1]))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+        ok, png = cv2.imencode('.png', image)
+        if not ok:
+            raise RuntimeError("PNG encoding failed")
+        return png.tobytes()
+
+    @staticmethod
+    def to_npy(grid):
+        buffer = io.BytesIO()
+        np.save(buffer, grid.astype(np.float32))
+        return buffer.getvalue()
+
+    @staticmethod
+    def to_dict(grid, decimals=2):
+        return {
+            'columns': grid.shape[1],
+            'rows': grid.shape[0],
+            'max': round(float(grid.max()), decimals),
+            'total_s': round(float(grid.sum()), decimals),
+            'cells': np.round(grid, decimals).tolist()
+        }
+
+    # ---------- persistence ----------
+
+    def save(self):
+        """Write the hourly snapshots (and the current hour) to the .npz file"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                starts = [start for start, _ in self._snapshots]
+                grids = [grid for _, grid in self._snapshots]
+                if self._period_start is not None and self._period.any():
+                    starts.append(self._period_start)
+                    grids.append(self._period.copy())
+            if not grids:
+                return
+            try:
+                tmp_path = self.path + '.tmp.npz'
+                np.savez_compressed(tmp_path, starts=np.array(starts, np.float64), grids=np.stack(grids))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.error(f"❌ Could not save dwell heatmap: {e}")
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as saved:
+                starts, grids = saved['starts'], saved['grids']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️  Ignoring unreadable dwell heatmap {self.path}: {e}")
+            return
+        if grids.shape[1:] != self._live.shape:
+            logger.warning("⚠️  Saved dwell heatmap has another grid size - ignored")
+            return
+        for start, grid in zip(starts, grids):
+            self._snapshots.append((float(start), grid.astype(np.float32)))
+
+    def stats(self):
+        return {
+            'grid': [self.columns, self.rows],
+            'half_life_s': self.half_life,
+            'frames': self.frames,
+            'observations': self.observations,
+            'snapshots': len(self._snapshots)
+        }
@@ -1,68 +1,256 @@
 """
 Face Analysis with Age, Gender, and Emotion Detection
-Using DeepFace library for comprehensive face analysis
+Using DeepFace's models, batched over every face in the frame
 """
 
 import cv2
 import numpy as np
-from deepface import DeepFace
 import logging
+import threading
+from attribute_cache import AttributeCache
+from attribute_models import ACTIONS, ATTRIBUTE_ACTIONS, get_attribute_models
+from face_detectors import get_detector
+from face_tracker import create_face_tracker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Extra margin around each detected box before it is handed to the models
+FACE_CROP_PADDING = 0.2
+
+
+def crop_face(image, box, padding=FACE_CROP_PADDING):
+    """
+    Crop a face from the image with some context around it
+    
+    Args:
+        image: BGR image (numpy array)
+        box: (x, y, w, h) face box
+        padding: Margin to add on every side, as a fraction of the box size
+        
+    Returns:
+        Cropped BGR image (a view into image)
+    """
+    x, y, w, h = box
+    pad_x, pad_y = int(w * padding), int(h * padding)
+    height, width = image.shape[:2]
+    x1, y1 = max(0, x - pad_x), max(0, y - pad_y)
+    x2, y2 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    return image[y1:y2, x1:x2]
+
+
+def parse_actions(value, default=ATTRIBUTE_ACTIONS):
+    """
+    Parse an ?actions=emotion,age request argument
+    
+    Args:
+        value: Comma-separated action names, or None / '' for the default
+        
+    Returns:
+        Tuple of actions in canonical order
+        
+    Raises:
+        ValueError: Unknown action name
+    """
+    if not value:
+        return tuple(default)
+    requested = {a.strip().lower() for a in value.split(',') if a.strip()}
+    unknown = requested - set(ACTIONS)
+    if unknown:
+        raise ValueError(f"Unknown action(s): {', '.join(sorted(unknown))} "
+                         f"(choose from {', '.join(ACTIONS)})")
+    return tuple(a for a in ACTIONS if a in requested)
+
+
+def format_attributes(result, actions=ACTIONS):
+    """
+    Shape raw model output for one face into the API fields
+    
+    Args:
+        result: DeepFace-style dict ('age', 'dominant_gender', 'gender',
+            'dominant_emotion', 'emotion')
+        actions: Requested actions; fields of the others are None
+        
+    Returns:
+        Dict with 'age', 'gender', 'emotion', 'all_emotions', 'confidence'
+    """
+    age = result.get('age') if 'age' in actions else None
+    gender = result.get('dominant_gender', 'Unknown') if 'gender' in actions else None
+    emotion = result.get('dominant_emotion', 'Unknown') if 'emotion' in actions else None
+    all_emotions = result.get('emotion', {}) if emotion else {}
+    genders = result.get('gender', {})
+    
+    return {
+        'age': int(age) if isinstance(age, (int, float)) else None,
+        'gender': gender.capitalize() if gender else None,
+        'emotion': emotion.capitalize() if emotion else None,
+        'all_emotions': all_emotions,
+        'confidence': {
+            'gender': genders.get(gender, 0) if gender and isinstance(genders, dict) else 0,
+            'emotion': all_emotions.get(emotion, 0) if all_emotions else 0
+        }
+    }
+
+
+def mask_attributes(fields, actions):
+    """
+    Blank the attribute fields of actions a caller did not ask for
+    
+    A shared analysis may have run more models than one reader requested;
+    the masked copy looks like format_attributes(result, actions) output.
+    
+    Args:
+        fields: Analysis or per-face dict with the format_attributes fields
+        actions: Requested actions
+        
+    Returns:
+        Copy of fields with the other actions' fields None (all_emotions
+        empty, confidence 0)
+    """
+    masked = dict(fields)
+    if 'age' not in actions:
+        masked['age'] = None
+    if 'gender' not in actions:
+        masked['gender'] = None
+    if 'emotion' not in actions:
+        masked['emotion'] = None
+        masked['all_emotions'] = {}
+        if 'dominant_emotion' in masked:
+            masked['dominant_emotion'] = None
+    if isinstance(fields.get('confidence'), dict):
+        masked['confidence'] = {
+            key: value if key in actions else 0
+            for key, value in fields['confidence'].items()
+        }
+    return masked
+
 
 class FaceAnalyzer:
     """Analyze faces for age, gender, and emotions"""
     
     def __init__(self):
         """Initialize the face analyzer"""
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
+        self.detector = get_detector()
+        self.tracker = create_face_tracker(self.detector)
+        self.attribute_models = get_attribute_models()
+        self.attribute_cache = AttributeCache()
         logger.info("✅ Face Analyzer initialized")
     
+    def warm_up(self, actions=ATTRIBUTE_ACTIONS):
+        """Run the detector and the given attribute models once on a blank image"""
+        self.detector.detect(np.zeros((240, 320), np.uint8))
+        self.attribute_models.warm_up(actions)
+    
     def detect_faces(self, frame):
         """
         Detect faces in the given frame
         
         Args:
-            frame: Input image frame (numpy array)
+            frame: BGR / grayscale numpy array, or a grabber Frame (the
+                detector then reads the grayscale plane when it can)
             
         Returns:
             List of face bounding boxes [(x, y, w, h), ...]
         """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+        if hasattr(frame, 'gray'):
+            frame = self.detector.prepare(frame)
+        faces, _ = self.detector.detect(frame)
         return faces
     
-    def analyze_face(self, frame):
+    def track_faces(self, frame):
         """
-        Analyze face for age, gender, and emotion
+        Detect or track faces in a camera frame
         
         Args:
-            frame: Input image frame (numpy array)
+            frame: Grabber Frame; frames must arrive in capture order
+            
+        Returns:
+            List of Track objects with stable track_id values
+        """
+        tracks, _ = self.tracker.update(frame)
+        return tracks
+    
+    def analyze_faces(self, frame, faces, track_ids=None, actions=ACTIONS):
+        """
+        Analyze every face in one batched pass per attribute model
+        
+        Faces with a track ID go through the attribute cache: age and
+        gender freeze after a few samples, emotion refreshes on a timer.
+        Only the models of the requested actions are loaded and run.
+        
+        Args:
+            frame: BGR image frame (numpy array) or a grabber Frame
+            faces: Face boxes [(x, y, w, h), ...] found in this frame
+            track_ids: Optional track ID per box
+            actions: Subset of ('age', 'gender', 'emotion')
+            
+        Returns:
+            List of per-face results, largest (closest) face first:
+            [{'track_id', 'x', 'y', 'width', 'height', 'age', 'gender',
+              'emotion', 'all_emotions', 'confidence'}, ...]
+        """
+        if track_ids is None:
+            track_ids = [None] * len(faces)
+        
+        # Colour conversion only for frames that reach the models
+        image = frame.bgr() if hasattr(frame, 'bgr') else frame
+        
+        entries = sorted(
+            ((tuple(int(v) for v in box), track_id) for box, track_id in zip(faces, track_ids)),
+            key=lambda entry: entry[0][2] * entry[0][3],
+            reverse=True
+        )
+        crops = [crop_face(image, box) for box, _ in entries]
+        
+        # Tracked faces only re-run the models their cache entry still needs
+        plans = [self.attribute_cache.plan(track_id, actions) for _, track_id in entries]
+        results = self.attribute_models.predict(crops, plans)
+        results = [
+            self.attribute_cache.update(track_id, result)
+            for (_, track_id), result in zip(entries, results)
+        ]
+        
+        return [
+            dict(
+                {'track_id': track_id, 'x': x, 'y': y, 'width': w, 'height': h},
+                **format_attributes(result, actions)
+            )
+            for ((x, y, w, h), track_id), result in zip(entries, results)
+        ]
+    
+    def analyze_face(self, frame, faces=None, track_ids=None, actions=ACTIONS):
+        """
+        Analyze faces for age, gender, and emotion
+        
+        The attribute models only see a padded crop of each face, and
+        DeepFace's own detector is skipped - detection happens once. The
+        top-level fields describe the largest (closest) face; 'faces' holds
+        the attributes of every face.
+        
+        Args:
+            frame: BGR image frame (numpy array) or a grabber Frame
+            faces: Face boxes already found in this frame; detected if omitted
+            track_ids: Optional track ID per box
+            actions: Subset of ('age', 'gender', 'emotion'); fields of
+                actions not requested are None
             
         Returns:
             Dictionary with analysis results:
             {
                 'age': int,
-                'gender': str ('Male' or 'Female'),
+                'gender': str ('Man' or 'Woman'),
                 'emotion': str,
                 'dominant_emotion': str,
                 'all_emotions': dict,
                 'faces_detected': int,
-                'face_regions': list
+                'face_regions': list,
+                'faces': list
             }
         """
         try:
-            # Detect faces first
-            faces = self.detect_faces(frame)
+            # Detect faces first (unless the caller already did)
+            if faces is None:
+                faces = self.detect_faces(frame)
             
             if len(faces) == 0:
                 return {
@@ -71,48 +259,26 @@ class FaceAnalyzer:
                     'faces_detected': 0
                 }
             
-            # Use DeepFace for comprehensive analysis
-            # Actions: age, gender, emotion, race
-            analysis = DeepFace.analyze(
-                frame,
-                actions=['age', 'gender', 'emotion'],
-                enforce_detection=False,
-                detector_backend='opencv'
-            )
-            
-            # Handle single face or multiple faces
-            if isinstance(analysis, list):
-                result = analysis[0]  # Take first face
-            else:
-                result = analysis
-            
-            # Extract information
-            age = result.get('age', 'Unknown')
-            gender = result.get('dominant_gender', 'Unknown')
-            emotion = result.get('dominant_emotion', 'Unknown')
-            all_emotions = result.get('emotion', {})
-            
-            # Get face region
-            region = result.get('region', {})
+            per_face = self.analyze_faces(frame, faces, track_ids, actions)
+            primary = per_face[0]
             
             return {
                 'success': True,
-                'age': int(age) if isinstance(age, (int, float)) else None,
-                'gender': gender.capitalize(),
-                'emotion': emotion.capitalize(),
-                'dominant_emotion': emotion.capitalize(),
-                'all_emotions': all_emotions,
+                'age': primary['age'],
+                'gender': primary['gender'],
+                'emotion': primary['emotion'],
+                'dominant_emotion': primary['emotion'],
+                'all_emotions': primary['all_emotions'],
                 'faces_detected': len(faces),
                 'face_regions': [{
-                    'x': int(region.get('x', 0)),
-                    'y': int(region.get('y', 0)),
-                    'width': int(region.get('w', 0)),
-                    'height': int(region.get('h', 0))
+                    'x': primary['x'],
+                    'y': primary['y'],
+                    'width': primary['width'],
+                    'height': primary['height']
                 }],
-                'confidence': {
-                    'gender': result.get('gender', {}).get(gender, 0) if isinstance(result.get('gender'), dict) else 0,
-                    'emotion': all_emotions.get(emotion, 0) if all_emotions else 0
-                }
+                'confidence': primary['confidence'],
+                'faces': per_face,
+                'actions': list(actions)
             }
             
         except Exception as e:
@@ -123,40 +289,50 @@ class FaceAnalyzer:
                 'faces_detected': 0
             }
     
-    def analyze_frame_with_detection(self, frame):
+    def analyze_frame_with_detection(self, frame, actions=ACTIONS):
         """
         Analyze frame and return both detection and analysis results
         
         Args:
-            frame: Input image frame (numpy array)
+            frame: BGR image frame (numpy array) or a grabber Frame
+            actions: Subset of ('age', 'gender', 'emotion')
             
         Returns:
             Dictionary with complete analysis including face detection boxes
         """
-        # First detect faces
-        faces = self.detect_faces(frame)
+        # First detect faces (camera frames are tracked between detections)
+        if hasattr(frame, 'gray'):
+            tracks = self.track_faces(frame)
+            self.attribute_cache.retain(track.track_id for track in self.tracker.tracks)
+            faces = [track.int_box() for track in tracks]
+            track_ids = [track.track_id for track in tracks]
+        else:
+            faces = self.detect_faces(frame)
+            track_ids = [None] * len(faces)
         
         if len(faces) == 0:
             return {
                 'success': False,
                 'error': 'No human face detected',
                 'faces_detected': 0,
-                'is_human': False
+                'is_human': False,
+                'actions': list(actions)
             }
         
-        # Then analyze the face
-        analysis = self.analyze_face(frame)
+        # Then analyze every face on the boxes we already have
+        analysis = self.analyze_face(frame, faces, track_ids, actions)
         
         # Add detection boxes
         if analysis.get('success'):
             analysis['detection_boxes'] = [
                 {
+                    'track_id': track_id,
                     'x': int(x),
                     'y': int(y),
                     'width': int(w),
                     'height': int(h)
                 }
-                for (x, y, w, h) in faces
+                for (x, y, w, h), track_id in zip(faces, track_ids)
             ]
             analysis['is_human'] = True
         
@@ -176,21 +352,26 @@ class FaceAnalyzer:
         if not analysis.get('success'):
             return frame
         
-        # Draw face rectangles
-        for box in analysis.get('detection_boxes', []):
-            x, y, w, h = box['x'], box['y'], box['width'], box['height']
+        # Draw face rectangles, each labelled with its own attributes
+        for face in analysis.get('faces') or analysis.get('detection_boxes', []):
+            x, y, w, h = face['x'], face['y'], face['width'], face['height']
             
             # Draw rectangle
             cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
             
-            # Prepare text
-            age = analysis.get('age', 'N/A')
-            gender = analysis.get('gender', 'N/A')
-            emotion = analysis.get('emotion', 'N/A')
+            # Prepare text (attributes that were not requested are None)
+            age = face.get('age')
+            gender = face.get('gender')
+            emotion = face.get('emotion')
+            if age is None and gender is None and emotion is None:
+                continue
             
             # Draw text background
-            text = f"Age: {age} | Gender: {gender}"
-            text2 = f"Mood: {emotion}"
+            text = ' | '.join(part for part in (
+                f"Age: {age}" if age is not None else None,
+                f"Gender: {gender}" if gender is not None else None
+            ) if part)
+            text2 = f"Mood: {emotion}" if emotion is not None else ''
             
             cv2.rectangle(frame, (x, y - 60), (x + w, y), (0, 0, 0), -1)
             
@@ -203,13 +384,15 @@ class FaceAnalyzer:
         return frame
 
 
-# Singleton instance
+# Singleton instance (created by the warm-up thread or the first request)
 _face_analyzer = None
+_face_analyzer_lock = threading.Lock()
 
 
 def get_face_analyzer():
     """Get or create the face analyzer instance"""
     global _face_analyzer
-    if _face_analyzer is None:
-        _face_analyzer = FaceAnalyzer()
-    return _face_analyzer
+    with _face_analyzer_lock:
+        if _face_analyzer is None:
+            _face_analyzer = FaceAnalyzer()
+        return _face_analyzer
@@ -0,0 +1,479 @@
+"""
+Face Detector Registry
+One place that loads each face detection backend once and exposes it
+behind a common detect(gray_or_bgr) -> (boxes, scores) interface.
+
+Backends:
+- haar      OpenCV Haar cascade (always available)
+- yunet     OpenCV DNN YuNet   (models/face_detection_yunet_2023mar.onnx)
+- res10     OpenCV DNN res10 SSD (models/deploy.prototxt +
+            models/res10_300x300_ssd_iter_140000.caffemodel)
+- deepface-<name>  DeepFace detectors (ssd, mtcnn, retinaface, mediapipe)
+
+Select a backend with the FACE_DETECTOR environment variable. Setting it to
+"auto" benchmarks the available backends on the sample set and picks the
+fastest one that meets the recall threshold. At startup only the OpenCV
+backends take part (the DeepFace ones import TensorFlow) unless DeepFace
+is already loaded. The full benchmark can be run from the command line:
+
+    python face_detectors.py --samples samples/faces --min-recall 0.9
+"""
+
+import os
+import glob
+import json
+import time
+import logging
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.environ.get('FACE_MODELS_DIR', os.path.join(BASE_DIR, 'models'))
+SAMPLES_DIR = os.environ.get('FACE_SAMPLES_DIR', os.path.join(BASE_DIR, 'samples', 'faces'))
+DEFAULT_DETECTOR = os.environ.get('FACE_DETECTOR', 'haar')
+DEFAULT_MIN_RECALL = 0.9
+
+# Backends FACE_DETECTOR=auto may load without pulling in TensorFlow
+LIGHTWEIGHT_DETECTORS = ('haar', 'yunet', 'res10')
+
+# Haar cascades give no usable score, keep the value the API always reported
+HAAR_CONFIDENCE = 0.85
+
+
+def _to_gray(image):
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _to_bgr(image):
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return image
+
+
+class FaceDetector:
+    """Base class: detect(image) returns ([(x, y, w, h), ...], [score, ...])"""
+
+    name = None
+    # Preferred input: 'gray' backends skip colour conversion entirely
+    input_format = 'bgr'
+
+    def prepare(self, frame):
+        """Pick the cheapest input for this backend from a grabber Frame"""
+        return frame.gray() if self.input_format == 'gray' else frame.bgr()
+
+    def detect(self, image):
+        raise NotImplementedError
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade (frontal face)"""
+
+    name = 'haar'
+    input_format = 'gray'
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5, min_size=(30, 30)):
+        candidates = [
+            '/usr/share/opencv4/haarcascades/haarcascade_frontalface_default.xml'
+        ]
+        if hasattr(cv2, 'data'):
+            candidates.insert(0, cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+        self.cascade = None
+        for path in candidates:
+            cascade = cv2.CascadeClassifier(path)
+            if not cascade.empty():
+                self.cascade = cascade
+                break
+        if self.cascade is None:
+            raise FileNotFoundError(f"Haar cascade not found in {candidates}")
+
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, image):
+        faces = self.cascade.detectMultiScale(
+            _to_gray(image),
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size
+        )
+        boxes = [tuple(int(v) for v in face) for face in faces]
+        return boxes, [HAAR_CONFIDENCE] * len(boxes)
+
+
+class YuNetDetector(FaceDetector):
+    """OpenCV DNN YuNet (cv2.FaceDetectorYN)"""
+
+    name = 'yunet'
+    model_file = 'face_detection_yunet_2023mar.onnx'
+
+    def __init__(self, score_threshold=0.7, nms_threshold=0.3):
+        path = os.path.join(MODELS_DIR, self.model_file)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.model = cv2.FaceDetectorYN.create(path, '', (320, 320), score_threshold, nms_threshold)
+        self.input_size = (320, 320)
+
+    def detect(self, image):
+        image = _to_bgr(image)
+        h, w = image.shape[:2]
+        if (w, h) != self.input_size:
+            self.model.setInputSize((w, h))
+            self.input_size = (w, h)
+
+        _, faces = self.model.detect(image)
+        if faces is None:
+            return [], []
+
+        boxes = [(int(f[0]), int(f[1]), int(f[2]), int(f[3])) for f in faces]
+        scores = [float(f[14]) for f in faces]
+        return boxes, scores
+
+
+class Res10SSDDetector(FaceDetector):
+    """OpenCV DNN res10 300x300 SSD (Caffe)"""
+
+    name = 'res10'
+    prototxt_file = 'deploy.prototxt'
+    weights_file = 'res10_300x300_ssd_iter_140000.caffemodel'
+
+    def __init__(self, score_threshold=0.5):
+        prototxt = os.path.join(MODELS_DIR, self.prototxt_file)
+        weights = os.path.join(MODELS_DIR, self.weights_file)
+        for path in (prototxt, weights):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.score_threshold = score_threshold
+
+    def detect(self, image):
+        image = _to_bgr(image)
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(
+            cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0)
+        )
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        boxes, scores = [], []
+        for det in detections:
+            score = float(det[2])
+            if score < self.score_threshold:
+                continue
+            x1, y1, x2, y2 = (det[3:7] * np.array([w, h, w, h])).astype(int)
+            x1, y1 = max(0, x1), max(0, y1)
+            boxes.append((int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+            scores.append(score)
+        return boxes, scores
+
+
+class DeepFaceDetector(FaceDetector):
+    """Any detector bundled with DeepFace (ssd, mtcnn, retinaface, mediapipe)"""
+
+    def __init__(self, backend):
+        from deepface.detectors import FaceDetector as DeepFaceDetectors
+
+        self.name = f'deepface-{backend}'
+        self.backend = backend
+        self._detectors = DeepFaceDetectors
+        self.model = DeepFaceDetectors.build_model(backend)
+
+    def detect(self, image):
+        faces = self._detectors.detect_faces(self.model, self.backend, _to_bgr(image), align=False)
+        boxes, scores = [], []
+        for _, region, confidence in faces:
+            x, y, w, h = region
+            boxes.append((int(x), int(y), int(w), int(h)))
+            scores.append(float(confidence) if confidence is not None else 0.0)
+        return boxes, scores
+
+
+# ============= Registry =============
+
+_factories = {
+    'haar': HaarDetector,
+    'yunet': YuNetDetector,
+    'res10': Res10SSDDetector,
+}
+for _backend in ('ssd', 'mtcnn', 'retinaface', 'mediapipe'):
+    _factories[f'deepface-{_backend}'] = (lambda b: lambda: DeepFaceDetector(b))(_backend)
+
+_detectors = {}
+_failed = {}
+_default_name = None
+_lock = threading.Lock()
+
+
+def detector_names():
+    """Names of all registered backends"""
+    return list(_factories)
+
+
+def load_detector(name):
+    """
+    Load a backend once and cache it
+
+    Returns:
+        FaceDetector instance, or None if the backend is unavailable
+    """
+    with _lock:
+        if name in _detectors:
+            return _detectors[name]
+        if name in _failed:
+            return None
+        factory = _factories.get(name)
+        if factory is None:
+            _failed[name] = 'unknown detector'
+            return None
+        try:
+            start = time.perf_counter()
+            detector = factory()
+            _detectors[name] = detector
+            logger.info(f"✅ Face detector '{name}' loaded in {(time.perf_counter() - start) * 1000:.0f}ms")
+            return detector
+        except Exception as e:
+            _failed[name] = str(e)
+            logger.warning(f"⚠️  Face detector '{name}' unavailable: {e}")
+            return None
+
+
+def preload_detectors(names=None):
+    """Load the given backends (default: the configured one) at startup"""
+    if names is None:
+        get_detector()
+        return
+    for name in names:
+        load_detector(name)
+
+
+def get_detector(name=None):
+    """
+    Get a loaded detector
+
+    Args:
+        name: Backend name; defaults to FACE_DETECTOR ("auto" benchmarks)
+
+    Returns:
+        FaceDetector instance (falls back to Haar if the backend fails)
+    """
+    global _default_name
+
+    if name is None:
+        if _default_name is None:
+            _default_name = _resolve_default()
+        name = _default_name
+
+    detector = load_detector(name)
+    if detector is None and name != 'haar':
+        logger.warning(f"⚠️  Falling back to Haar cascade instead of '{name}'")
+        detector = load_detector('haar')
+    return detector
+
+
+def _resolve_default():
+    if DEFAULT_DETECTOR != 'auto':
+        return DEFAULT_DETECTOR
+    try:
+        samples = load_sample_set(SAMPLES_DIR)
+        if samples:
+            best, _ = select_fastest_detector(samples, names=auto_candidates())
+            if best:
+                return best
+        else:
+            logger.warning(f"⚠️  No benchmark samples in {SAMPLES_DIR}")
+    except Exception as e:
+        logger.warning(f"⚠️  Detector benchmark failed: {e}")
+    return 'haar'
+
+
+def auto_candidates():
+    """Backends FACE_DETECTOR=auto benchmarks: DeepFace's only if it is already imported"""
+    if 'deepface' in sys.modules:
+        return detector_names()
+    return list(LIGHTWEIGHT_DETECTORS)
+
+
+def detector_status():
+    """Loaded / failed backends for status endpoints"""
+    with _lock:
+        return {
+            'default': _default_name,
+            'loaded': list(_detectors),
+            'unavailable': dict(_failed)
+        }
+
+
+# ============= Benchmark =============
+
+def load_sample_set(path=SAMPLES_DIR):
+    """
+    Load benchmark images and their ground-truth face boxes
+
+    The directory holds images plus an optional labels.json mapping each
+    file name to a list of [x, y, w, h] boxes. Images without labels are
+    still returned (with boxes=None) so a reference backend can label them.
+
+    Returns:
+        List of (name, image, boxes) tuples
+    """
+    labels = {}
+    labels_path = os.path.join(path, 'labels.json')
+    if os.path.exists(labels_path):
+        with open(labels_path) as f:
+            labels = json.load(f)
+
+    samples = []
+    for file in sorted(glob.glob(os.path.join(path, '*'))):
+        if os.path.splitext(file)[1].lower() not in ('.jpg', '.jpeg', '.png'):
+            continue
+        image = cv2.imread(file)
+        if image is None:
+            continue
+        name = os.path.basename(file)
+        boxes = labels.get(name)
+        samples.append((name, image, [tuple(b) for b in boxes] if boxes is not None else None))
+    return samples
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match(truth, predicted, iou_threshold):
+    """Count ground-truth boxes matched by a prediction"""
+    used = set()
+    hits = 0
+    for t in truth:
+        best, best_iou = None, iou_threshold
+        for i, p in enumerate(predicted):
+            if i in used:
+                continue
+            iou = _iou(t, p)
+            if iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+            hits += 1
+    return hits
+
+
+def benchmark_detectors(samples, names=None, iou_threshold=0.5, repeats=3,
+                        reference='res10'):
+    """
+    Measure speed and recall of each available backend
+
+    Args:
+        samples: Output of load_sample_set()
+        names: Backends to test (default: all registered)
+        iou_threshold: Minimum IoU for a detection to count as a hit
+        repeats: Timed passes over the sample set per backend
+        reference: Backend used to label samples without ground truth
+
+    Returns:
+        List of dicts with name, mean_ms, recall and precision (None when
+        there were no boxes to measure against); the backend that
+        labelled samples is marked 'reference' - its recall is not a
+        measurement
+    """
+    names = names or detector_names()
+
+    labeller = None
+    if any(boxes is None for _, _, boxes in samples):
+        ref = load_detector(reference)
+        labeller = reference
+        if ref is None:
+            ref, labeller = load_detector('haar'), 'haar'
+        samples = [
+            (name, image, boxes if boxes is not None else ref.detect(image)[0])
+            for name, image, boxes in samples
+        ]
+
+    results = []
+    for name in names:
+        detector = load_detector(name)
+        if detector is None:
+            continue
+
+        # Warm-up pass so lazy initialization is not timed
+        detector.detect(samples[0][1])
+
+        elapsed = 0.0
+        hits = truth_total = predicted_total = 0
+        for run in range(repeats):
+            for _, image, truth in samples:
+                start = time.perf_counter()
+                predicted, _ = detector.detect(image)
+                elapsed += time.perf_counter() - start
+                if run == 0:
+                    hits += _match(truth, predicted, iou_threshold)
+                    truth_total += len(truth)
+                    predicted_total += len(predicted)
+
+        results.append({
+            'name': name,
+            'mean_ms': round(elapsed / (repeats * len(samples)) * 1000, 2),
+            'recall': round(hits / truth_total, 3) if truth_total else None,
+            'precision': round(hits / predicted_total, 3) if predicted_total else None,
+            'reference': name == labeller
+        })
+
+    return results
+
+
+def select_fastest_detector(samples, min_recall=DEFAULT_MIN_RECALL, names=None):
+    """
+    Pick the fastest backend whose recall meets min_recall
+
+    The backend that labelled unannotated samples is not a candidate, and
+    neither is any backend when the samples hold no faces at all.
+
+    Returns:
+        (name or None, benchmark results)
+    """
+    results = benchmark_detectors(samples, names)
+    eligible = [r for r in results
+                if not r['reference'] and r['recall'] is not None and r['recall'] >= min_recall]
+    if not eligible:
+        return None, results
+    best = min(eligible, key=lambda r: r['mean_ms'])
+    logger.info(f"🏁 Fastest face detector: {best['name']} ({best['mean_ms']}ms, recall {best['recall']})")
+    return best['name'], results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Benchmark face detection backends')
+    parser.add_argument('--samples', default=SAMPLES_DIR, help='Sample image directory')
+    parser.add_argument('--backends', help='Comma-separated backends (default: all)')
+    parser.add_argument('--min-recall', type=float, default=DEFAULT_MIN_RECALL)
+    args = parser.parse_args()
+
+    sample_set = load_sample_set(args.samples)
+    if not sample_set:
+        parser.error(f"No sample images found in {args.samples}")
+
+    backends = args.backends.split(',') if args.backends else None
+    best, table = select_fastest_detector(sample_set, args.min_recall, backends)
+
+    print(f"\n{'backend':<22}{'ms/frame':>10}{'recall':>8}{'precision':>11}")
+    for row in table:
+        print(f"{row['name']:<22}{row['mean_ms']:>10}{str(row['recall']):>8}{str(row['precision']):>11}"
+              f"{'  (labelled samples)' if row['reference'] else ''}")
+    print(f"\nRecommended: FACE_DETECTOR={best or 'haar'}")
@@ -0,0 +1,294 @@
+"""
+Face Tracking Between Detections
+Runs the full face detector every N frames (or as soon as tracking
+confidence drops) and follows known faces on the frames in between with a
+cheap tracker. Every face keeps a stable track ID across frames.
+
+Tracking methods:
+- flow    sparse Lucas-Kanade optical flow on the grayscale frame (default)
+- mosse   OpenCV MOSSE correlation filter (opencv-contrib, cv2.legacy)
+- kcf     OpenCV KCF tracker
+
+FACE_TRACKING selects the method ("off" = run the detector on every frame,
+track IDs are still assigned) and FACE_DETECT_EVERY the detection interval.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FACE_TRACKING = os.environ.get('FACE_TRACKING', 'flow')
+FACE_DETECT_EVERY = int(os.environ.get('FACE_DETECT_EVERY', '5'))
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """A face followed across frames"""
+
+    def __init__(self, track_id, box, score, now):
+        self.track_id = track_id
+        self.box = tuple(float(v) for v in box)
+        self.score = score
+        self.confidence = 1.0
+        self.hits = 1
+        self.misses = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.tracked = False
+        self.points = None
+        self.cv_tracker = None
+
+    def int_box(self):
+        return tuple(int(round(v)) for v in self.box)
+
+    def to_dict(self):
+        x, y, w, h = self.int_box()
+        return {
+            'track_id': self.track_id,
+            'x': x,
+            'y': y,
+            'width': w,
+            'height': h,
+            'confidence': round(self.score * self.confidence, 2),
+            'tracked': self.tracked,
+            'age_s': round(self.last_seen - self.first_seen, 2)
+        }
+
+
+def _create_cv_tracker(method):
+    factories = []
+    if method == 'mosse':
+        factories = [getattr(getattr(cv2, 'legacy', None), 'TrackerMOSSE_create', None)]
+    elif method == 'kcf':
+        factories = [getattr(cv2, 'TrackerKCF_create', None),
+                     getattr(getattr(cv2, 'legacy', None), 'TrackerKCF_create', None)]
+    for factory in factories:
+        if factory is not None:
+            return factory()
+    return None
+
+
+class FaceTracker:
+    """Detect every N frames, track in between, keep stable track IDs"""
+
+    def __init__(self, detector, detect_every=5, method='flow', min_confidence=0.5,
+                 match_iou=0.3, max_misses=2):
+        """
+        Initialize the tracker
+
+        Args:
+            detector: FaceDetector from the registry
+            detect_every: Run the detector every N frames (1 = every frame)
+            method: 'flow', 'mosse' or 'kcf'
+            min_confidence: Re-detect as soon as any track falls below this
+            match_iou: Minimum IoU to match a detection to an existing track
+            max_misses: Detection rounds a track may miss before it is dropped
+        """
+        if method in ('mosse', 'kcf') and _create_cv_tracker(method) is None:
+            logger.warning(f"⚠️  OpenCV {method.upper()} tracker unavailable - using optical flow")
+            method = 'flow'
+
+        self.detector = detector
+        self.detect_every = max(1, int(detect_every))
+        self.method = method
+        self.min_confidence = min_confidence
+        self.match_iou = match_iou
+        self.max_misses = max_misses
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._prev_gray = None
+        self._frames_since_detect = 0
+        self._lock = threading.Lock()
+
+        self.frames = 0
+        self.detections = 0
+
+    def update(self, frame):
+        """
+        Advance the tracker by one frame
+
+        Args:
+            frame: Grabber Frame (preferred) or BGR / grayscale numpy array
+
+        Returns:
+            (list of visible Track objects, True if the detector ran)
+        """
+        with self._lock:
+            now = time.monotonic()
+            if hasattr(frame, 'gray'):
+                gray = frame.gray()
+            else:
+                gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            self.frames += 1
+            need_detection = (
+                self._prev_gray is None
+                or self._frames_since_detect + 1 >= self.detect_every
+                or any(t.confidence < self.min_confidence for t in self.tracks)
+            )
+
+            if need_detection:
+                self._detect(frame, gray, now)
+            else:
+                self._track(frame, gray, now)
+                self._frames_since_detect += 1
+
+            self._prev_gray = gray
+            return [t for t in self.tracks if t.misses == 0], need_detection
+
+    def reset(self):
+        """Forget every track (e.g. when the camera restarts)"""
+        with self._lock:
+            self.tracks = []
+            self._prev_gray = None
+            self._frames_since_detect = 0
+
+    # ---------- detection rounds ----------
+
+    def _detect(self, frame, gray, now):
+        self.detections += 1
+        self._frames_since_detect = 0
+
+        image = self.detector.prepare(frame) if hasattr(frame, 'gray') else frame
+        boxes, scores = self.detector.detect(image)
+
+        # Greedy IoU matching of detections to existing tracks
+        pairs = sorted(
+            ((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks) for bi, b in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, ti, bi in pairs:
+            if overlap < self.match_iou:
+                break
+            if ti in matched_tracks or bi in matched_boxes:
+                continue
+            matched_tracks.add(ti)
+            matched_boxes.add(bi)
+            track = self.tracks[ti]
+            track.box = tuple(float(v) for v in boxes[bi])
+            track.score = scores[bi]
+            track.confidence = 1.0
+            track.hits += 1
+            track.misses = 0
+            track.last_seen = now
+            track.tracked = False
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                # Keep it hidden for a few rounds in case the detector blinked
+                track.misses += 1
+                track.confidence = 0.0
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                survivors.append(Track(next(self._ids), box, scores[bi], now))
+
+        self.tracks = survivors
+        if self.detect_every > 1:
+            for track in self.tracks:
+                if track.misses == 0:
+                    self._init_tracking(track, frame, gray)
+
+    # ---------- tracking between detections ----------
+
+    def _init_tracking(self, track, frame, gray):
+        x, y, w, h = track.int_box()
+        if self.method == 'flow':
+            mask = np.zeros_like(gray)
+            mask[max(0, y):y + h, max(0, x):x + w] = 255
+            track.points = cv2.goodFeaturesToTrack(gray, maxCorners=30, qualityLevel=0.01,
+                                                   minDistance=4, mask=mask)
+        else:
+            track.cv_tracker = _create_cv_tracker(self.method)
+            image = frame.bgr() if hasattr(frame, 'bgr') else frame
+            track.cv_tracker.init(image, (x, y, w, h))
+
+    def _track(self, frame, gray, now):
+        for track in self.tracks:
+            if track.misses > 0:
+                # Not seen by the last detector pass - hold position
+                track.confidence = 0.0
+                continue
+
+            if self.method == 'flow':
+                self._track_flow(track, gray)
+            else:
+                image = frame.bgr() if hasattr(frame, 'bgr') else frame
+                ok, box = track.cv_tracker.update(image)
+                track.confidence = 1.0 if ok else 0.0
+                if ok:
+                    track.box = tuple(float(v) for v in box)
+
+            track.tracked = True
+            if track.confidence > 0:
+                track.last_seen = now
+
+    def _track_flow(self, track, gray):
+        if track.points is None or len(track.points) < 4:
+            track.confidence = 0.0
+            return
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._prev_gray, gray, track.points, None, winSize=(15, 15), maxLevel=2
+        )
+        good = status.reshape(-1) == 1
+        if good.sum() < 4:
+            track.confidence = 0.0
+            return
+
+        old = track.points[good].reshape(-1, 2)
+        new = new_points[good].reshape(-1, 2)
+        dx, dy = np.median(new - old, axis=0)
+
+        # Scale from the change in spread of the tracked points
+        old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1).mean()
+        new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1).mean()
+        scale = float(new_spread / old_spread) if old_spread > 1e-3 else 1.0
+        scale = min(max(scale, 0.8), 1.25)
+
+        x, y, w, h = track.box
+        cx, cy = x + w / 2 + dx, y + h / 2 + dy
+        w, h = w * scale, h * scale
+        track.box = (cx - w / 2, cy - h / 2, w, h)
+        track.points = new.reshape(-1, 1, 2)
+        track.confidence = float(good.sum()) / len(good)
+
+    def stats(self):
+        """Counters for status endpoints"""
+        return {
+            'method': self.method,
+            'detect_every': self.detect_every,
+            'frames': self.frames,
+            'detector_runs': self.detections,
+            'active_tracks': len(self.tracks)
+        }
+
+
+def create_face_tracker(detector):
+    """Build a FaceTracker configured from FACE_TRACKING / FACE_DETECT_EVERY"""
+    if FACE_TRACKING == 'off':
+        return FaceTracker(detector, detect_every=1)
+    return FaceTracker(detector, FACE_DETECT_EVERY, FACE_TRACKING)
@@ -0,0 +1,418 @@
+"""
+Write-behind Firebase Publisher
+Sensor threads and request handlers hand their Realtime Database updates
+to publish() and return immediately; one background thread writes them.
+
+- Only the newest value per path is kept (older pending ones are dropped)
+- Updates arriving within PUBLISH_WINDOW seconds go out as one
+  multi-path update() request
+- Failed writes are retried with exponential backoff (up to
+  PUBLISH_MAX_BACKOFF seconds) and the pending values are spooled to
+  PUBLISH_SPOOL, so updates made while offline survive a restart
+- At most PUBLISH_MAX_PENDING paths wait; beyond that the oldest are
+  dropped (events published under unique keys would otherwise pile up
+  for as long as Firebase is unreachable)
+- A batch Firebase refuses because of its data (a value that cannot be
+  serialized, an invalid key) is written path by path instead; paths
+  refused on their own are dropped and logged rather than retried
+
+Paths are RTDB paths relative to the root reference ('presence',
+'detections/latest'); one path must not be nested inside another.
+
+LocalRTDB is an in-process stand-in for the RTDB root reference (set
+FIREBASE_LOCAL_DB to use it), for running and testing without network.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PUBLISH_WINDOW = float(os.environ.get('PUBLISH_WINDOW', '0.5'))
+PUBLISH_MAX_BACKOFF = float(os.environ.get('PUBLISH_MAX_BACKOFF', '60'))
+PUBLISH_SPOOL = os.environ.get('PUBLISH_SPOOL', os.path.join(BASE_DIR, 'firebase-spool.json'))
+PUBLISH_MAX_PENDING = int(os.environ.get('PUBLISH_MAX_PENDING', '1000'))
+FIREBASE_LOCAL_DB = os.environ.get('FIREBASE_LOCAL_DB')
+
+# FirebaseError codes meaning the request itself was refused - retrying
+# the same data cannot succeed
+REFUSED_CODES = ('INVALID_ARGUMENT', 'FAILED_PRECONDITION', 'OUT_OF_RANGE', 'PERMISSION_DENIED')
+
+
+def _is_refused(error):
+    """True if a write failed because of its data rather than the network"""
+    if isinstance(error, OSError):
+        # ConnectionError, timeouts, requests' exceptions
+        return False
+    if isinstance(error, (TypeError, ValueError)):
+        # Raised while the client encodes the values as JSON
+        return True
+    return getattr(error, 'code', None) in REFUSED_CODES
+
+
+class FirebasePublisher:
+    """Coalesce, batch and retry RTDB writes on a background thread"""
+
+    def __init__(self, root=None, window=PUBLISH_WINDOW, max_backoff=PUBLISH_MAX_BACKOFF,
+                 spool_path=PUBLISH_SPOOL, max_pending=PUBLISH_MAX_PENDING,
+                 name='firebase-publisher'):
+        """
+        Initialize the publisher (pending values from the spool are reloaded)
+
+        Args:
+            root: RTDB root reference (db.reference() or LocalRTDB); None
+                until Firebase is configured, see set_root()
+            window: Seconds to collect updates into one batch
+            max_backoff: Longest wait between retries
+            spool_path: JSON file for pending values while offline (None = no spool)
+            max_pending: Most paths kept waiting; the oldest are dropped beyond it
+            name: Name of the publisher thread
+        """
+        self.root = root
+        self.window = window
+        self.max_backoff = max_backoff
+        self.spool_path = spool_path
+        self.max_pending = max_pending
+        self._name = name
+
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._in_flight = False
+        self._spooled = False
+
+        self.published = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_error = None
+        self._last_success = None
+
+        self._load_spool()
+
+    # ---------- producers ----------
+
+    def publish(self, path, value):
+        """Queue value for path; replaces any pending value of that path"""
+        with self._condition:
+            if path in self._pending:
+                self.coalesced += 1
+                del self._pending[path]
+            self._pending[path] = value
+            self.published += 1
+            self._trim()
+            self._condition.notify_all()
+
+    def _trim(self):
+        """Drop the oldest pending paths beyond max_pending (caller holds the condition)"""
+        if len(self._pending) <= self.max_pending:
+            return
+        if not self.dropped:
+            logger.warning(f"⚠️  Over {self.max_pending} Firebase updates pending - dropping the oldest")
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+
+    def set_root(self, root):
+        """Attach the RTDB root once Firebase is initialized"""
+        with self._condition:
+            self.root = root
+            self._retry_at = 0.0
+            self._condition.notify_all()
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the publisher thread (no-op if already running)"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the thread, trying one last write; whatever is left is spooled"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        if self.root is None:
+            # Firebase never came up - nothing to deliver later either
+            return
+        if self._pending:
+            self._flush(self._take())
+        self._save_spool()
+
+    def flush(self, timeout=5.0):
+        """Block until nothing is pending (or timeout); True if all was written"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._retry_at = 0.0
+            self._condition.notify_all()
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    # ---------- writer thread ----------
+
+    def _take(self):
+        with self._condition:
+            batch = OrderedDict(self._pending)
+            self._pending.clear()
+            self._in_flight = bool(batch)
+            return batch
+
+    def _run(self):
+        while self._running:
+            with self._condition:
+                while self._running and not (self._pending and self.root is not None):
+                    self._condition.wait(1.0)
+                if not self._running:
+                    break
+                # Backoff after a failure; new updates keep coalescing meanwhile
+                delay = self._retry_at - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+            # Let updates arriving within the window join this batch
+            if self.window:
+                time.sleep(self.window)
+            self._flush(self._take())
+
+    def _flush(self, batch):
+        """Write one batch as a multi-path update; requeue it on a network failure"""
+        if not batch:
+            return True
+        written = len(batch)
+        try:
+            if self.root is None:
+                raise ConnectionError("Firebase not initialized")
+            self.root.update(dict(batch))
+        except Exception as e:
+            if not _is_refused(e):
+                return self._requeue(batch, e)
+            # Retrying the whole batch would fail on the same value forever
+            written, unsent, error = self._write_paths(batch, e)
+            if unsent:
+                return self._requeue(unsent, error, written)
+
+        with self._condition:
+            recovered = self._failures > 0
+            self._in_flight = False
+            self._failures = 0
+            self._retry_at = 0.0
+            self.batches += 1
+            self.written += written
+            self._last_success = time.monotonic()
+            self.last_error = None
+            self._condition.notify_all()
+        if recovered:
+            logger.info("✅ Firebase reachable again")
+        if self._spooled:
+            self._save_spool()
+        return True
+
+    def _write_paths(self, batch, error):
+        """
+        Write the paths of a refused batch one at a time, dropping the
+        ones Firebase refuses on their own
+
+        Returns:
+            (paths written, paths left unsent after a network error, that error)
+        """
+        logger.warning(f"⚠️  Firebase refused a batch of {len(batch)} ({error}) - writing path by path")
+        paths = list(batch)
+        written = 0
+        for index, path in enumerate(paths):
+            try:
+                self.root.update({path: batch[path]})
+                written += 1
+            except Exception as e:
+                if not _is_refused(e):
+                    return written, OrderedDict((p, batch[p]) for p in paths[index:]), e
+                with self._condition:
+                    self.rejected += 1
+                    self.last_error = f"{path}: {e}"
+                logger.error(f"❌ Firebase refused '{path}' ({e}) - dropped")
+        return written, None, None
+
+    def _requeue(self, batch, error, written=0):
+        """Put a failed batch back in front of newer updates and back off"""
+        with self._condition:
+            # Values published since the batch was taken are newer - keep
+            # them, queued after the batch so _trim() drops the oldest first
+            requeued = OrderedDict((path, value) for path, value in batch.items()
+                                   if path not in self._pending)
+            requeued.update(self._pending)
+            self._pending = requeued
+            self._trim()
+            self._in_flight = False
+            self.written += written
+            self.failed += 1
+            self._failures += 1
+            backoff = min(self.max_backoff, 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + backoff * random.uniform(0.5, 1.0)
+            self.last_error = str(error)
+            self._condition.notify_all()
+        if self._failures == 1:
+            logger.warning(f"⚠️  Firebase write failed ({error}) - retrying with backoff, spooling to disk")
+        self._save_spool()
+        return False
+
+    # ---------- offline spool ----------
+
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        try:
+            with open(self.spool_path) as f:
+                spooled = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Ignoring unreadable spool {self.spool_path}: {e}")
+            return
+        self._pending.update(spooled)
+        self._spooled = bool(spooled)
+        if spooled:
+            logger.info(f"📦 {len(spooled)} spooled Firebase update(s) queued")
+
+    def _save_spool(self):
+        """Write the pending values to disk (removes the spool when empty)"""
+        if not self.spool_path:
+            return
+        with self._condition:
+            pending = dict(self._pending)
+        self._spooled = bool(pending)
+        try:
+            if not pending:
+                if os.path.exists(self.spool_path):
+                    os.remove(self.spool_path)
+                return
+            tmp_path = self.spool_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(pending, f, default=str)
+            os.replace(tmp_path, self.spool_path)
+        except OSError as e:
+            logger.error(f"❌ Could not write Firebase spool: {e}")
+
+    def stats(self):
+        """Publisher counters for status endpoints"""
+        with self._condition:
+            return {
+                'online': self.root is not None and self._failures == 0,
+                'pending': len(self._pending),
+                'published': self.published,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'rejected': self.rejected,
+                'retry_in_s': round(max(0.0, self._retry_at - time.monotonic()), 1)
+                if self._failures else None,
+                'last_success_s': round(time.monotonic() - self._last_success, 1)
+                if self._last_success else None,
+                'last_error': self.last_error
+            }
+
+
+class LocalRTDB:
+    """
+    In-process stand-in for a Realtime Database reference
+
+    Supports the calls the servers make (child, set, update, get). Data
+    is kept in memory and optionally mirrored to a JSON file. Set offline
+    or latency on any reference to simulate an unreachable / slow network.
+    """
+
+    def __init__(self, path=None, _store=None, _prefix=()):
+        if _store is None:
+            _store = {'data': {}, 'lock': threading.Lock(), 'offline': False,
+                      'latency': 0.0, 'requests': 0}
+            if path and os.path.exists(path):
+                with open(path) as f:
+                    _store['data'] = json.load(f)
+        self.path = path
+        self._store = _store
+        self._prefix = _prefix
+
+    offline = property(lambda self: self._store['offline'],
+                       lambda self, value: self._store.__setitem__('offline', value))
+    latency = property(lambda self: self._store['latency'],
+                       lambda self, value: self._store.__setitem__('latency', value))
+    requests = property(lambda self: self._store['requests'])
+
+    @staticmethod
+    def _split(path):
+        return tuple(part for part in str(path).split('/') if part)
+
+    def child(self, path):
+        return LocalRTDB(self.path, self._store, self._prefix + self._split(path))
+
+    def _request(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.offline:
+            raise ConnectionError("LocalRTDB is offline")
+        self._store['requests'] += 1
+
+    def _write(self, parts, value):
+        value = json.loads(json.dumps(value, default=str))
+        if not parts:
+            self._store['data'] = value if isinstance(value, dict) else {}
+            return
+        node = self._store['data']
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _persist(self):
+        if self.path:
+            with open(self.path, 'w') as f:
+                json.dump(self._store['data'], f, indent=2)
+
+    def set(self, value):
+        self._request()
+        with self._store['lock']:
+            self._write(self._prefix, value)
+            self._persist()
+
+    def update(self, values):
+        """Multi-path update: every key is a path relative to this reference"""
+        self._request()
+        with self._store['lock']:
+            for key, value in values.items():
+                self._write(self._prefix + self._split(key), value)
+            self._persist()
+
+    def get(self):
+        self._request()
+        with self._store['lock']:
+            node = self._store['data']
+            for part in self._prefix:
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            return json.loads(json.dumps(node))
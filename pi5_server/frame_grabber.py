@@ -0,0 +1,245 @@
+"""
+Background Frame Grabber
+A single capture thread owns the camera and publishes sequence-numbered
+frames into a small ring buffer. Snapshot, stream and detection code read
+the latest frame from the buffer instead of capturing on their own.
+
+Frames can be captured as YUV420: detection then reads the Y plane as a
+zero-copy grayscale view and colour conversion only happens for frames
+that are actually encoded or analyzed.
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Picamera2 format names -> channel order of the numpy array it returns
+# (libcamera's "RGB888" is stored B,G,R in memory)
+PICAMERA_PIXEL_FORMATS = {
+    'RGB888': 'BGR',
+    'BGR888': 'RGB',
+    'YUV420': 'YUV420',
+}
+
+
+class Frame:
+    """A captured frame tagged with its sequence number and capture time"""
+
+    __slots__ = ('seq', 'array', 'timestamp', 'pixel_format', 'size', '_gray', '_bgr')
+
+    def __init__(self, seq, array, timestamp, pixel_format='BGR', size=None):
+        """
+        Args:
+            seq: Sequence number (monotonic per source)
+            array: Raw numpy array from the camera
+            timestamp: time.monotonic() at capture
+            pixel_format: 'BGR', 'RGB' or 'YUV420' (planar I420)
+            size: (width, height) of the image; needed when a YUV420
+                buffer is wider than the image (row stride padding)
+        """
+        self.seq = seq
+        self.array = array
+        self.timestamp = timestamp
+        self.pixel_format = pixel_format
+        if size is None:
+            height, width = array.shape[:2]
+            if pixel_format == 'YUV420':
+                height = height * 2 // 3
+            size = (width, height)
+        self.size = size
+        self._gray = None
+        self._bgr = None
+
+    @property
+    def age(self):
+        """Seconds since the frame was captured"""
+        return time.monotonic() - self.timestamp
+
+    def gray(self):
+        """Grayscale image - a zero-copy view of the Y plane for YUV420"""
+        if self._gray is None:
+            width, height = self.size
+            if self.pixel_format == 'YUV420':
+                self._gray = self.array[:height, :width]
+            elif self.pixel_format == 'RGB':
+                self._gray = cv2.cvtColor(self.array, cv2.COLOR_RGB2GRAY)
+            else:
+                self._gray = cv2.cvtColor(self.array, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def bgr(self):
+        """BGR image, converted on first use and cached (treat as read-only)"""
+        if self._bgr is None:
+            width, _ = self.size
+            if self.pixel_format == 'YUV420':
+                self._bgr = cv2.cvtColor(self.array, cv2.COLOR_YUV2BGR_I420)[:, :width]
+            elif self.pixel_format == 'RGB':
+                self._bgr = cv2.cvtColor(self.array, cv2.COLOR_RGB2BGR)
+            else:
+                self._bgr = self.array
+        return self._bgr
+
+
+class FrameGrabber:
+    """Capture frames on a dedicated thread and share them with consumers"""
+
+    def __init__(self, capture, buffer_size=4, max_fps=None, name='frame-grabber',
+                 pixel_format='BGR', size=None, first_seq=0):
+        """
+        Initialize the grabber
+
+        Args:
+            capture: Callable returning the next frame (numpy array),
+                e.g. lambda: camera.capture_array("lores")
+            buffer_size: Number of recent frames kept in the ring buffer
+            max_fps: Optional cap on the capture rate (None = camera rate)
+            name: Name of the capture thread
+            pixel_format: Layout of captured arrays ('BGR', 'RGB', 'YUV420')
+            size: (width, height) of captured images, see Frame
+            first_seq: Sequence number to continue from - pass the last
+                grabber's seq when the camera restarts, so consumers
+                holding an older seq (and ETags) stay valid
+        """
+        self._capture = capture
+        self.pixel_format = pixel_format
+        self.size = size
+        self._buffer = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._name = name
+        self._seq = first_seq
+        self._errors = 0
+        self._rate_changed = threading.Event()
+        self.max_fps = max_fps
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the capture thread (no-op if already running)"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+        logger.info("🎞️  Frame grabber started")
+
+    def stop(self, timeout=2.0):
+        """Stop the capture thread and wake up any waiting consumers"""
+        self._running = False
+        self._rate_changed.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        logger.info("🎞️  Frame grabber stopped")
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def seq(self):
+        """Sequence number of the newest frame captured"""
+        return self._seq
+
+    def set_max_fps(self, max_fps):
+        """Change the capture rate cap (None = camera rate) without waiting out the old period"""
+        self.max_fps = max_fps
+        self._rate_changed.set()
+
+    def _run(self):
+        """Capture loop: grab, stamp and publish frames until stopped"""
+        next_deadline = time.monotonic()
+
+        while self._running:
+            try:
+                array = self._capture()
+            except Exception as e:
+                self._errors += 1
+                logger.error(f"❌ Frame capture error: {e}")
+                time.sleep(0.5)
+                continue
+
+            if array is None:
+                time.sleep(0.01)
+                continue
+
+            self._publish(array)
+
+            if self._rate_changed.is_set():
+                self._rate_changed.clear()
+                next_deadline = time.monotonic()
+
+            if self.max_fps:
+                next_deadline += 1.0 / self.max_fps
+                delay = next_deadline - time.monotonic()
+                if delay > 0:
+                    # A rate change (e.g. leaving watch mode) ends the wait early
+                    self._rate_changed.wait(delay)
+                else:
+                    next_deadline = time.monotonic()
+
+    def _publish(self, array):
+        with self._condition:
+            self._seq += 1
+            self._buffer.append(
+                Frame(self._seq, array, time.monotonic(), self.pixel_format, self.size)
+            )
+            self._condition.notify_all()
+
+    # ---------- consumers ----------
+
+    def latest(self):
+        """Return the newest frame, or None if nothing was captured yet"""
+        with self._condition:
+            return self._buffer[-1] if self._buffer else None
+
+    def get(self, seq):
+        """Return the frame with the given sequence number if still buffered"""
+        with self._condition:
+            for frame in self._buffer:
+                if frame.seq == seq:
+                    return frame
+        return None
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """
+        Block until a frame newer than after_seq is available
+
+        Args:
+            after_seq: Sequence number the caller already has (0 = any frame)
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The newest Frame, or None on timeout / when stopped
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._running:
+                if self._buffer and self._buffer[-1].seq > after_seq:
+                    return self._buffer[-1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return None
+
+    def stats(self):
+        """Return capture counters for status endpoints"""
+        latest = self.latest()
+        return {
+            'running': self._running,
+            'frames_captured': self._seq,
+            'capture_errors': self._errors,
+            'max_fps': self.max_fps,
+            'buffered': len(self._buffer),
+            'latest_seq': latest.seq if latest else None,
+            'latest_age_ms': int(latest.age * 1000) if latest else None
+        }
@@ -0,0 +1,289 @@
+"""
+Image Encoder Backends
+JPEG/WebP encoding behind one interface so the stream and snapshot paths
+can use the fastest encoder installed on the device.
+
+Backends:
+- turbojpeg   PyTurboJPEG (libjpeg-turbo), encodes RGB/BGR/gray directly
+- simplejpeg  simplejpeg (libjpeg-turbo), encodes RGB/BGR/gray directly
+- opencv      cv2.imencode (always available, BGR only)
+- pil         Pillow (RGB only)
+- webp        cv2.imencode('.webp') - smaller files, browser <img> only
+
+IMAGE_ENCODER selects the JPEG backend ("auto" = first available of
+turbojpeg, simplejpeg, opencv; for RGB input Pillow comes before OpenCV,
+which would have to convert to BGR first). Benchmark every backend with:
+
+    python image_encoders.py --benchmark
+"""
+
+import io
+import os
+import time
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODER = os.environ.get('IMAGE_ENCODER', 'auto')
+AUTO_ORDER = ('turbojpeg', 'simplejpeg', 'opencv')
+AUTO_ORDER_RGB = ('turbojpeg', 'simplejpeg', 'pil', 'opencv')
+
+
+def _as_bgr(image, pixel_format):
+    if pixel_format == 'RGB':
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    return image
+
+
+class ImageEncoder:
+    """Base class: encode(image, quality, pixel_format) -> bytes"""
+
+    name = None
+    mimetype = 'image/jpeg'
+
+    def encode(self, image, quality=85, pixel_format='BGR'):
+        """
+        Encode an image
+
+        Args:
+            image: HxWx3 (RGB or BGR) or HxW grayscale numpy array
+            quality: 0-100
+            pixel_format: 'RGB', 'BGR' or 'GRAY'
+
+        Returns:
+            Encoded bytes
+        """
+        raise NotImplementedError
+
+
+class OpenCVEncoder(ImageEncoder):
+    """cv2.imencode (needs BGR, RGB input costs one extra conversion)"""
+
+    name = 'opencv'
+
+    def encode(self, image, quality=85, pixel_format='BGR'):
+        ok, buffer = cv2.imencode('.jpg', _as_bgr(image, pixel_format),
+                                  [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        if not ok:
+            raise ValueError('JPEG encoding failed')
+        return buffer.tobytes()
+
+
+class TurboJPEGEncoder(ImageEncoder):
+    """PyTurboJPEG bindings to libjpeg-turbo"""
+
+    name = 'turbojpeg'
+
+    def __init__(self):
+        import turbojpeg
+
+        self._jpeg = turbojpeg.TurboJPEG()
+        self._formats = {
+            'RGB': turbojpeg.TJPF_RGB,
+            'BGR': turbojpeg.TJPF_BGR,
+            'GRAY': turbojpeg.TJPF_GRAY,
+        }
+        self._gray_subsample = turbojpeg.TJSAMP_GRAY
+
+    def encode(self, image, quality=85, pixel_format='BGR'):
+        if pixel_format == 'GRAY':
+            if image.ndim == 2:
+                image = image[:, :, np.newaxis]
+            return self._jpeg.encode(image, quality=int(quality),
+                                     pixel_format=self._formats['GRAY'],
+                                     jpeg_subsample=self._gray_subsample)
+        return self._jpeg.encode(image, quality=int(quality),
+                                 pixel_format=self._formats[pixel_format])
+
+
+class SimpleJPEGEncoder(ImageEncoder):
+    """simplejpeg (libjpeg-turbo, wheels for aarch64)"""
+
+    name = 'simplejpeg'
+
+    def __init__(self):
+        import simplejpeg
+
+        self._simplejpeg = simplejpeg
+
+    def encode(self, image, quality=85, pixel_format='BGR'):
+        if pixel_format == 'GRAY' and image.ndim == 2:
+            image = image[:, :, np.newaxis]
+        return self._simplejpeg.encode_jpeg(
+            np.ascontiguousarray(image), quality=int(quality), colorspace=pixel_format
+        )
+
+
+class PILEncoder(ImageEncoder):
+    """Pillow JPEG encoder"""
+
+    name = 'pil'
+
+    def __init__(self):
+        from PIL import Image
+
+        self._image = Image
+
+    def encode(self, image, quality=85, pixel_format='RGB'):
+        if pixel_format == 'BGR':
+            image = image[:, :, ::-1]
+        buffer = io.BytesIO()
+        self._image.fromarray(np.ascontiguousarray(image)).save(buffer, 'JPEG', quality=int(quality))
+        return buffer.getvalue()
+
+
+class WebPEncoder(ImageEncoder):
+    """WebP via OpenCV - roughly 25-35% smaller than JPEG at similar quality"""
+
+    name = 'webp'
+    mimetype = 'image/webp'
+
+    def encode(self, image, quality=85, pixel_format='BGR'):
+        ok, buffer = cv2.imencode('.webp', _as_bgr(image, pixel_format),
+                                  [cv2.IMWRITE_WEBP_QUALITY, int(quality)])
+        if not ok:
+            raise ValueError('WebP encoding failed')
+        return buffer.tobytes()
+
+
+# ============= Registry =============
+
+_factories = {
+    'turbojpeg': TurboJPEGEncoder,
+    'simplejpeg': SimpleJPEGEncoder,
+    'opencv': OpenCVEncoder,
+    'pil': PILEncoder,
+    'webp': WebPEncoder,
+}
+_encoders = {}
+_failed = {}
+_lock = threading.Lock()
+
+
+def encoder_names():
+    """Names of all registered backends"""
+    return list(_factories)
+
+
+def load_encoder(name):
+    """Load a backend once; returns None if its library is missing"""
+    with _lock:
+        if name in _encoders:
+            return _encoders[name]
+        if name in _failed or name not in _factories:
+            return None
+        try:
+            encoder = _factories[name]()
+            _encoders[name] = encoder
+            return encoder
+        except Exception as e:
+            _failed[name] = str(e)
+            logger.info(f"ℹ️  Image encoder '{name}' unavailable: {e}")
+            return None
+
+
+def get_encoder(name=None, pixel_format='BGR'):
+    """
+    Get an encoder backend
+
+    Args:
+        name: Backend name; defaults to IMAGE_ENCODER ("auto" = fastest installed)
+        pixel_format: Channel order the caller will pass; "auto" then
+            prefers a backend that encodes it without a conversion
+
+    Returns:
+        ImageEncoder instance (falls back to OpenCV)
+    """
+    name = name or DEFAULT_ENCODER
+    if name == 'auto':
+        candidates = AUTO_ORDER_RGB if pixel_format == 'RGB' else AUTO_ORDER
+    else:
+        candidates = (name, 'opencv')
+    for candidate in candidates:
+        encoder = load_encoder(candidate)
+        if encoder is not None:
+            return encoder
+    raise RuntimeError('No image encoder available')
+
+
+# ============= Benchmark =============
+
+def sample_frame(width, height, seed=0):
+    """Synthetic camera-like RGB frame: gradients, shapes and sensor noise"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, np.newaxis]
+    frame = np.empty((height, width, 3), dtype=np.float32)
+    frame[:, :, 0] = 200 * x + 30 * y
+    frame[:, :, 1] = 120 + 80 * np.sin(6 * x + 3 * y)
+    frame[:, :, 2] = 180 * (1 - y) + 40 * x
+    for _ in range(12):
+        cx, cy = rng.integers(0, width), rng.integers(0, height)
+        radius = int(rng.integers(height // 20, height // 6))
+        color = [int(c) for c in rng.integers(0, 255, 3)]
+        cv2.circle(frame, (int(cx), int(cy)), radius, color, -1)
+    frame += rng.normal(0, 6, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def benchmark_encoders(names=None, sizes=((640, 480), (1920, 1080)), quality=85,
+                       pixel_format='RGB', duration=1.0):
+    """
+    Measure encode throughput and output size of each available backend
+
+    Returns:
+        List of dicts with name, size, fps and bytes_per_frame
+    """
+    results = []
+    for width, height in sizes:
+        frame = sample_frame(width, height)
+        if pixel_format == 'BGR':
+            frame = np.ascontiguousarray(frame[:, :, ::-1])
+
+        for name in names or encoder_names():
+            encoder = load_encoder(name)
+            if encoder is None:
+                continue
+
+            data = encoder.encode(frame, quality, pixel_format)
+            count = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                encoder.encode(frame, quality, pixel_format)
+                count += 1
+            elapsed = time.perf_counter() - start
+
+            results.append({
+                'name': name,
+                'size': f'{width}x{height}',
+                'fps': round(count / elapsed, 1),
+                'bytes_per_frame': len(data)
+            })
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark JPEG/WebP encoder backends')
+    parser.add_argument('--benchmark', action='store_true', help='Run the throughput benchmark')
+    parser.add_argument('--backends', help='Comma-separated backends (default: all)')
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--pixel-format', choices=('RGB', 'BGR'), default='RGB')
+    parser.add_argument('--duration', type=float, default=1.0, help='Seconds per backend and size')
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        print(f"Default encoder: {get_encoder().name}")
+        print(f"Available: {[n for n in encoder_names() if load_encoder(n)]}")
+    else:
+        backends = args.backends.split(',') if args.backends else None
+        table = benchmark_encoders(backends, quality=args.quality,
+                                   pixel_format=args.pixel_format, duration=args.duration)
+        print(f"\n{'backend':<12}{'size':>11}{'fps':>9}{'KB/frame':>10}")
+        for row in table:
+            print(f"{row['name']:<12}{row['size']:>11}{row['fps']:>9}{row['bytes_per_frame'] / 1024:>10.1f}")
@@ -0,0 +1,334 @@
+"""
+Inference Worker Pool
+Runs the attribute models in separate worker processes so TensorFlow
+inference does not compete for the GIL with capture, JPEG encoding, the
+presence loop and the Flask request threads. Every worker loads its
+models once when it starts; face crops go in through a bounded queue and
+results come back as futures.
+
+INFERENCE_WORKERS sets the worker count (0 = run the models in-process),
+INFERENCE_QUEUE_SIZE the number of batches allowed to wait for a worker.
+The analysis loop submits one batch at a time, so by default every worker
+may use all cores (INFERENCE_THREADS to cap them); more than one worker
+only helps when uploads to /api/face/analyze arrive alongside the loop.
+
+Workers start with forkserver (INFERENCE_START_METHOD) rather than fork,
+which would copy a process already running capture, publisher and GPIO
+threads. The forkserver preloads only this module, and the server's
+__main__ is hidden for the moment a worker process starts, so workers do
+not re-run its GPIO / Firebase setup. A worker that dies breaks the pool;
+it is recreated up to INFERENCE_MAX_RESTARTS times, after that the models
+run in-process.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from attribute_models import ACTIONS, create_attribute_models
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '0'))
+INFERENCE_QUEUE_SIZE = int(os.environ.get('INFERENCE_QUEUE_SIZE', '4'))
+INFERENCE_TIMEOUT = float(os.environ.get('INFERENCE_TIMEOUT', '10.0'))
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '0'))
+INFERENCE_START_METHOD = os.environ.get('INFERENCE_START_METHOD', 'forkserver')
+INFERENCE_MAX_RESTARTS = int(os.environ.get('INFERENCE_MAX_RESTARTS', '3'))
+
+# Longest a worker waits in warm_up() for the others to load their models
+WARM_UP_TIMEOUT = 600.0
+
+# ---------- worker process side ----------
+
+_worker_models = None
+_worker_barrier = None
+
+
+def _init_worker(backend, threads, barrier):
+    """Pool initializer: set the thread count and load the models of this worker"""
+    global _worker_models, _worker_barrier
+
+    _worker_barrier = barrier
+    for var in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[var] = str(threads)
+
+    _worker_models = create_attribute_models(backend)
+    _worker_models.warm_up()
+
+
+def _predict(crops, actions):
+    return _worker_models.predict(crops, actions)
+
+
+def _barrier():
+    """Warm-up task; returns once every worker runs one, i.e. all are initialized"""
+    _worker_barrier.wait(WARM_UP_TIMEOUT)
+    return os.getpid()
+
+
+# ---------- server process side ----------
+
+_main_lock = threading.Lock()
+
+
+@contextmanager
+def _hidden_main():
+    """
+    Hide the server script from multiprocessing while workers start
+
+    spawn / forkserver children import the parent's __main__ (found via
+    its __spec__ or __file__); the server modules set up GPIO, Firebase and
+    the camera at import time. Workers only need this module. Only held
+    around Process.start(), see _worker_context().
+    """
+    main = sys.modules['__main__']
+    with _main_lock:
+        spec = getattr(main, '__spec__', None)
+        path = main.__dict__.pop('__file__', None)
+        main.__spec__ = None
+        try:
+            yield
+        finally:
+            main.__spec__ = spec
+            if path is not None:
+                main.__file__ = path
+
+
+class _HiddenMainStart:
+    """Process mixin: start() with __main__ hidden (the object is pickled, so module level)"""
+
+    def start(self):
+        with _hidden_main():
+            super().start()
+
+
+class _SpawnWorkerProcess(_HiddenMainStart, multiprocessing.context.SpawnProcess):
+    pass
+
+
+_worker_processes = {'spawn': _SpawnWorkerProcess}
+
+if sys.platform != 'win32':
+    class _ForkServerWorkerProcess(_HiddenMainStart, multiprocessing.context.ForkServerProcess):
+        pass
+
+    _worker_processes['forkserver'] = _ForkServerWorkerProcess
+
+
+def _worker_context(start_method):
+    """
+    multiprocessing context whose processes start with __main__ hidden
+
+    fork children do not import __main__, so that context is used as is.
+    """
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        context.set_forkserver_preload([__name__])
+    if start_method not in _worker_processes:
+        return context
+
+    worker_context = type(context)()
+    worker_context.Process = _worker_processes[start_method]
+    return worker_context
+
+
+class InferencePool:
+    """Process pool for attribute inference with a bounded submit queue"""
+
+    def __init__(self, backend='deepface', workers=INFERENCE_WORKERS,
+                 queue_size=INFERENCE_QUEUE_SIZE, start_method=INFERENCE_START_METHOD,
+                 threads=INFERENCE_THREADS):
+        """
+        Initialize the pool (worker processes start on warm_up / first use)
+
+        Args:
+            backend: Attribute model backend each worker loads
+            workers: Number of worker processes
+            queue_size: Batches that may wait for a free worker
+            start_method: multiprocessing start method
+            threads: Inference threads per worker (0 = all cores)
+        """
+        self.backend = backend
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self.threads = threads or os.cpu_count() or 1
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = 'spawn'
+        self.start_method = start_method
+        self._context = _worker_context(start_method)
+
+        self._executor = self._create_executor()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.restarts = 0
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self.backend, self.threads, self._context.Barrier(self.workers))
+        )
+
+    def restart(self, broken=None):
+        """
+        Replace a broken executor with a fresh one
+
+        Args:
+            broken: The executor that failed; nothing happens if another
+                caller already replaced it
+
+        Returns:
+            False once INFERENCE_MAX_RESTARTS is used up
+        """
+        with self._lock:
+            if broken is not None and broken is not self._executor:
+                return True
+            if self.restarts >= INFERENCE_MAX_RESTARTS:
+                return False
+            self.restarts += 1
+            old, self._executor = self._executor, self._create_executor()
+        old.shutdown(wait=False, cancel_futures=True)
+        logger.warning(f"⚠️  Inference worker died - pool restarted ({self.restarts}/{INFERENCE_MAX_RESTARTS})")
+        return True
+
+    def submit(self, crops, actions, timeout=0.0):
+        """
+        Queue a batch of face crops
+
+        Args:
+            crops: List of BGR face crops
+            actions: Actions for every crop, or one tuple per crop
+            timeout: Seconds to wait for queue space (0 = fail at once)
+
+        Returns:
+            concurrent.futures.Future resolving to the per-crop results
+
+        Raises:
+            queue.Full: The queue is full - the caller should drop the frame
+            BrokenProcessPool: A worker died; see restart()
+        """
+        acquired = self._slots.acquire(timeout=timeout) if timeout else self._slots.acquire(False)
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise queue.Full("Inference queue is full")
+
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(_predict, crops, actions)
+        except Exception:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future is None or future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+        self._slots.release()
+
+    def warm_up(self):
+        """
+        Start every worker and wait until each has its models loaded
+
+        One barrier task per worker: each blocks until all are running, so
+        they land on different workers and each ran its initializer.
+
+        Raises:
+            BrokenProcessPool: A worker died while starting
+        """
+        futures = [self._executor.submit(_barrier) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """Counters for status endpoints"""
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'workers': self.workers,
+                'threads': self.threads,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'restarts': self.restarts
+            }
+
+
+class PooledAttributeModels:
+    """Attribute model backend that forwards every batch to the pool"""
+
+    def __init__(self, pool, timeout=INFERENCE_TIMEOUT):
+        self.pool = pool
+        self.name = f"{pool.backend}-pool"
+        self.timeout = timeout
+        # In-process models once the pool cannot be restarted any more
+        self._fallback = None
+
+    def load(self, actions=None):
+        self.warm_up(actions)
+
+    def warm_up(self, actions=None):
+        try:
+            self.pool.warm_up()
+        except BrokenProcessPool:
+            if not self.pool.restart():
+                self._use_fallback().warm_up(actions)
+                return
+            self.pool.warm_up()
+
+    def _use_fallback(self):
+        if self._fallback is None:
+            logger.error("❌ Inference workers keep dying - running the models in-process")
+            self._fallback = create_attribute_models(self.pool.backend)
+            self.name = self._fallback.name
+            self.pool.shutdown()
+        return self._fallback
+
+    def predict(self, crops, actions=ACTIONS):
+        """Blocking predict; waits for queue space up to the result timeout"""
+        if not crops or not any(actions):
+            return [{} for _ in crops]
+        if self._fallback is not None:
+            return self._fallback.predict(crops, actions)
+
+        # One retry on a fresh pool when a worker died with this batch
+        for _ in range(2):
+            executor = self.pool._executor
+            try:
+                return self.pool.submit(crops, actions, self.timeout).result(self.timeout)
+            except BrokenProcessPool:
+                if not self.pool.restart(executor):
+                    break
+        return self._use_fallback().predict(crops, actions)
+
+    def stats(self):
+        stats = self.pool.stats()
+        stats['fallback'] = self._fallback is not None
+        return stats
@@ -0,0 +1,314 @@
+"""
+Encode-once MJPEG Broadcaster
+One producer thread captures/annotates each frame, encodes it to JPEG once
+and fans the same bytes out to every connected client. Clients always get
+the newest frame; a slow client skips frames instead of queueing them.
+The latest encoded frame doubles as a sequence-numbered snapshot cache.
+Clients may ask for a smaller width, lower quality, lower frame rate or
+WebP instead of JPEG; each variant is produced once per frame and shared.
+"""
+
+import threading
+import time
+import logging
+
+import cv2
+
+from image_encoders import get_encoder
+
+logger = logging.getLogger(__name__)
+
+
+# Variant requests are snapped to a coarse grid so clients share cache entries
+MIN_VARIANT_WIDTH = 160
+VARIANT_WIDTH_STEP = 16
+MIN_VARIANT_QUALITY = 30
+VARIANT_QUALITY_STEP = 5
+MAX_VARIANTS_PER_FRAME = 8
+
+# Wait before asking again when the producer has no frame (camera stopped
+# or not initialized - produce() may return None without blocking)
+NO_FRAME_BACKOFF = 0.2
+
+
+class EncodedFrame:
+    """An annotated frame, its JPEG bytes and any scaled variants"""
+
+    __slots__ = ('seq', 'image', 'jpeg', 'meta', 'timestamp', 'variants', 'lock')
+
+    def __init__(self, seq, image, jpeg, meta, timestamp):
+        self.seq = seq
+        self.image = image
+        self.jpeg = jpeg
+        self.meta = meta
+        self.timestamp = timestamp
+        self.variants = {}
+        self.lock = threading.Lock()
+
+
+def multipart_chunk(jpeg):
+    """Wrap JPEG bytes as one part of a multipart/x-mixed-replace stream"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n'
+            + jpeg + b'\r\n')
+
+
+class MJPEGBroadcaster:
+    """Produce, encode and share annotated frames with all subscribers"""
+
+    def __init__(self, produce, fps=10, quality=95, idle_timeout=5.0, name='mjpeg-broadcaster',
+                 encoder=None, pixel_format='BGR'):
+        """
+        Initialize the broadcaster
+
+        Args:
+            produce: Callable(last_seq) returning (seq, image, meta) for the
+                next frame newer than last_seq, or None if none is ready.
+            fps: Target output frame rate
+            quality: JPEG quality (0-100)
+            idle_timeout: Seconds without subscribers before the producer stops
+            name: Name of the producer thread
+            encoder: ImageEncoder for the JPEG path (default: get_encoder())
+            pixel_format: Channel order of produced images ('BGR' or 'RGB'),
+                handed to the encoder so no conversion is needed
+        """
+        self._produce = produce
+        self.fps = fps
+        self.quality = quality
+        self.encoder = encoder or get_encoder()
+        self.pixel_format = pixel_format
+        self.idle_timeout = idle_timeout
+        self._name = name
+
+        self._condition = threading.Condition()
+        self._latest = None
+        self._thread = None
+        self._running = False
+        self._subscribers = 0
+        self._last_access = time.monotonic()
+
+        self._frames_encoded = 0
+        self._encode_seconds = 0.0
+
+    # ---------- producer ----------
+
+    def _ensure_running(self):
+        """Start the producer if needed; returns True if it was already running"""
+        with self._condition:
+            self._last_access = time.monotonic()
+            if self._running:
+                return True
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+        logger.info("📡 MJPEG broadcaster started")
+        return False
+
+    def _idle(self):
+        with self._condition:
+            if self._subscribers > 0:
+                return False
+            return time.monotonic() - self._last_access > self.idle_timeout
+
+    def _run(self):
+        """Producer loop paced by a frame deadline instead of a fixed sleep"""
+        last_seq = self._latest.seq if self._latest else 0
+        next_deadline = time.monotonic()
+
+        while self._running and not self._idle():
+            try:
+                produced = self._produce(last_seq)
+                if produced is None:
+                    time.sleep(NO_FRAME_BACKOFF)
+                    continue
+
+                seq, image, meta = produced
+                start = time.perf_counter()
+                jpeg = self.encoder.encode(image, self.quality, self.pixel_format)
+                self._encode_seconds += time.perf_counter() - start
+                self._frames_encoded += 1
+                last_seq = seq
+
+                self._publish(EncodedFrame(seq, image, jpeg, meta, time.monotonic()))
+
+                next_deadline += 1.0 / self.fps
+                delay = next_deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind: start a new schedule rather than bursting
+                    next_deadline = time.monotonic()
+
+            except Exception as e:
+                logger.error(f"❌ Broadcast producer error: {e}")
+                time.sleep(1)
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        logger.info("📡 MJPEG broadcaster idle - producer stopped")
+
+    def _publish(self, frame):
+        with self._condition:
+            self._latest = frame
+            self._condition.notify_all()
+
+    def reset(self):
+        """Drop the cached frame (the camera restarted; it no longer shows the scene)"""
+        with self._condition:
+            self._latest = None
+
+    def stop(self):
+        """Stop the producer thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(2.0)
+
+    # ---------- consumers ----------
+
+    def latest(self):
+        """Newest encoded frame without waiting or starting the producer (None if none)"""
+        with self._condition:
+            return self._latest
+
+    def wait_for_frame(self, after_seq=0, timeout=1.0):
+        """
+        Block until an encoded frame newer than after_seq is available
+
+        Args:
+            after_seq: Sequence number the caller already has (0 = any frame)
+            timeout: Maximum seconds to wait
+
+        Returns:
+            The newest EncodedFrame, or None on timeout
+        """
+        was_running = self._ensure_running()
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if not was_running and self._latest:
+                # Cached frame predates the idle period - wait for a fresh one
+                after_seq = max(after_seq, self._latest.seq)
+            while True:
+                if self._latest and self._latest.seq > after_seq:
+                    return self._latest
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None
+                self._condition.wait(remaining)
+
+    def normalize_variant(self, width=None, quality=None):
+        """
+        Snap a requested width/quality onto the shared variant grid
+
+        Returns:
+            (width or None, quality or None) - None means "as produced"
+        """
+        latest = self._latest
+        native_width = latest.image.shape[1] if latest else None
+
+        if width is not None:
+            width = max(MIN_VARIANT_WIDTH, int(width) // VARIANT_WIDTH_STEP * VARIANT_WIDTH_STEP)
+            if native_width and width >= native_width:
+                width = None
+
+        if quality is not None:
+            quality = int(quality) // VARIANT_QUALITY_STEP * VARIANT_QUALITY_STEP
+            quality = min(max(MIN_VARIANT_QUALITY, quality), 100)
+            if quality == self.quality:
+                quality = None
+
+        return width, quality
+
+    def get_variant(self, frame, width=None, quality=None, fmt=None):
+        """
+        Get frame scaled to width and encoded at quality
+
+        Variants are cached on the frame, so every client asking for the
+        same (width, quality, fmt) shares one resize and one encode.
+
+        Args:
+            frame: EncodedFrame from wait_for_frame()
+            width: Target width (height keeps the aspect ratio), None = native
+            quality: JPEG/WebP quality, None = broadcaster default
+            fmt: 'webp' for WebP output, None/'jpeg' for JPEG
+
+        Returns:
+            Encoded bytes
+        """
+        width, quality = self.normalize_variant(width, quality)
+        fmt = 'webp' if fmt == 'webp' else None
+        if width is None and quality is None and fmt is None:
+            return frame.jpeg
+
+        key = (width, quality, fmt)
+        with frame.lock:
+            jpeg = frame.variants.get(key)
+            if jpeg is not None:
+                return jpeg
+
+            image = frame.image
+            if width is not None:
+                height = round(image.shape[0] * width / image.shape[1])
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+            encoder = get_encoder('webp') if fmt else self.encoder
+            data = encoder.encode(image, quality or self.quality, self.pixel_format)
+            if len(frame.variants) < MAX_VARIANTS_PER_FRAME:
+                frame.variants[key] = data
+            return data
+
+    def etag(self, frame, width=None, quality=None, fmt=None):
+        """ETag for a frame variant: the sequence number plus the variant key"""
+        width, quality = self.normalize_variant(width, quality)
+        fmt = 'webp' if fmt == 'webp' else None
+        if width is None and quality is None and fmt is None:
+            return str(frame.seq)
+        return f"{frame.seq}-w{width or 'native'}-q{quality or self.quality}-{fmt or 'jpeg'}"
+
+    def stream(self, width=None, fps=None, quality=None):
+        """
+        Generator of multipart chunks for a Flask streaming Response
+
+        Args:
+            width: Optional output width for this client
+            fps: Optional frame rate cap for this client (<= broadcaster fps)
+            quality: Optional JPEG quality for this client
+        """
+        with self._condition:
+            self._subscribers += 1
+        try:
+            last_seq = 0
+            interval = 1.0 / fps if fps and fps < self.fps else 0
+            next_send = time.monotonic()
+            while True:
+                if interval:
+                    delay = next_send - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                frame = self.wait_for_frame(last_seq)
+                if frame is None:
+                    continue
+                last_seq = frame.seq
+                next_send = max(next_send + interval, time.monotonic())
+                yield multipart_chunk(self.get_variant(frame, width, quality))
+        finally:
+            with self._condition:
+                self._subscribers -= 1
+                self._last_access = time.monotonic()
+
+    def stats(self):
+        """Return broadcaster counters for status endpoints"""
+        latest = self._latest
+        return {
+            'running': self._running,
+            'subscribers': self._subscribers,
+            'target_fps': self.fps,
+            'encoder': self.encoder.name,
+            'frames_encoded': self._frames_encoded,
+            'avg_encode_ms': round(self._encode_seconds / self._frames_encoded * 1000, 2)
+            if self._frames_encoded else None,
+            'latest_seq': latest.seq if latest else None
+        }
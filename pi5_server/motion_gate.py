@@ -0,0 +1,114 @@
+"""
+Motion Gate
+Cheap background subtraction on a downscaled grayscale frame. While the
+scene is static the face pipeline skips detection/analysis and reuses its
+last result; any motion (or a periodic refresh) lets the next frame through.
+
+MOTION_GATE=off disables gating, MOTION_THRESHOLD sets the fraction of
+changed pixels that counts as motion.
+"""
+
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+MOTION_GATE = os.environ.get('MOTION_GATE', 'on')
+MOTION_THRESHOLD = float(os.environ.get('MOTION_THRESHOLD', '0.01'))
+
+
+class MotionGate:
+    """Decide per frame whether the scene changed enough to re-analyze"""
+
+    def __init__(self, threshold=MOTION_THRESHOLD, size=(160, 120), pixel_threshold=25,
+                 learning_rate=0.05, hold_seconds=2.0, refresh_seconds=5.0,
+                 enabled=MOTION_GATE != 'off'):
+        """
+        Initialize the gate
+
+        Args:
+            threshold: Fraction of changed pixels that counts as motion
+            size: Working resolution (width, height)
+            pixel_threshold: Gray-level difference for a pixel to count as changed
+            learning_rate: Background running-average weight per frame
+            hold_seconds: Keep the gate open this long after the last motion
+            refresh_seconds: Open the gate at least this often on a static scene
+            enabled: False lets every frame through (score is still reported)
+        """
+        self.threshold = threshold
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.learning_rate = learning_rate
+        self.hold_seconds = hold_seconds
+        self.refresh_seconds = refresh_seconds
+        self.enabled = enabled
+
+        self._background = None
+        self._last_motion = 0.0
+        self._last_open = 0.0
+        self._lock = threading.Lock()
+
+        self.score = 0.0
+        self.frames = 0
+        self.skipped = 0
+
+    def update(self, frame):
+        """
+        Feed one frame
+
+        Args:
+            frame: Grabber Frame or BGR / grayscale numpy array
+
+        Returns:
+            (open, score) - open is False when the caller may reuse its
+            previous result; score is the fraction of changed pixels
+        """
+        if hasattr(frame, 'gray'):
+            gray = frame.gray()
+        else:
+            gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+        with self._lock:
+            now = time.monotonic()
+            self.frames += 1
+
+            if self._background is None:
+                self._background = small
+                self._last_motion = self._last_open = now
+                return True, 1.0
+
+            diff = cv2.absdiff(small, self._background)
+            score = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+            cv2.accumulateWeighted(small, self._background, self.learning_rate)
+            self.score = score
+
+            if score >= self.threshold:
+                self._last_motion = now
+
+            is_open = (
+                not self.enabled
+                or now - self._last_motion <= self.hold_seconds
+                or now - self._last_open >= self.refresh_seconds
+            )
+            if is_open:
+                self._last_open = now
+            else:
+                self.skipped += 1
+            return is_open, round(score, 4)
+
+    def stats(self):
+        """Counters for status endpoints"""
+        return {
+            'enabled': self.enabled,
+            'motion_score': round(self.score, 4),
+            'threshold': self.threshold,
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'seconds_since_motion': round(time.monotonic() - self._last_motion, 1)
+            if self.frames else None
+        }
@@ -0,0 +1,274 @@
+"""
+Presence State Machine
+Combines the ultrasonic distance with face detections into one debounced
+presence state and duty-cycles the camera pipeline with it: while nobody
+is near the kiosk, capture drops to a low-rate watch mode (or the camera
+stops); the first sign of someone approaching brings the full pipeline
+back and the time that took is recorded against a resume budget.
+
+States: idle -> arriving -> present -> leaving -> idle
+
+- idle      nobody near; the pipeline sleeps once the exit grace passed
+- arriving  someone closer than PRESENCE_ENTER_CM (or a face seen); the
+            pipeline is woken at once, presence is confirmed after
+            PRESENCE_ENTER_SECONDS of continuous evidence
+- present   confirmed; kept while closer than PRESENCE_EXIT_CM or a face
+            was seen within PRESENCE_FACE_HOLD_SECONDS (hysteresis)
+- leaving   no evidence; back to present on any, idle after
+            PRESENCE_EXIT_SECONDS
+
+PRESENCE_IDLE_MODE: watch (capture at PRESENCE_WATCH_FPS, default),
+off (stop the camera) or full (never duty-cycle, only track the state).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_ENTER_CM = float(os.environ.get('PRESENCE_ENTER_CM', '100'))
+PRESENCE_EXIT_CM = float(os.environ.get('PRESENCE_EXIT_CM', '130'))
+PRESENCE_ENTER_SECONDS = float(os.environ.get('PRESENCE_ENTER_SECONDS', '0.3'))
+PRESENCE_EXIT_SECONDS = float(os.environ.get('PRESENCE_EXIT_SECONDS', '5.0'))
+PRESENCE_FACE_HOLD_SECONDS = float(os.environ.get('PRESENCE_FACE_HOLD_SECONDS', '3.0'))
+PRESENCE_IDLE_MODE = os.environ.get('PRESENCE_IDLE_MODE', 'watch')
+PRESENCE_WATCH_FPS = float(os.environ.get('PRESENCE_WATCH_FPS', '2'))
+PRESENCE_RESUME_BUDGET_MS = float(os.environ.get('PRESENCE_RESUME_BUDGET_MS', '500'))
+
+STATES = ('idle', 'arriving', 'present', 'leaving')
+
+
+class PresenceMonitor:
+    """Debounced presence from distance + faces, driving pipeline sleep / wake"""
+
+    def __init__(self, wake=None, sleep=None, enter_cm=PRESENCE_ENTER_CM,
+                 exit_cm=PRESENCE_EXIT_CM, enter_seconds=PRESENCE_ENTER_SECONDS,
+                 exit_seconds=PRESENCE_EXIT_SECONDS, face_hold=PRESENCE_FACE_HOLD_SECONDS,
+                 idle_mode=PRESENCE_IDLE_MODE, resume_budget_ms=PRESENCE_RESUME_BUDGET_MS,
+                 history=50):
+        """
+        Initialize the monitor (state idle, pipeline assumed awake)
+
+        Args:
+            wake: Callable bringing the full pipeline back; blocks until the
+                first full-rate frame (its duration is the resume latency)
+            sleep: Callable putting the pipeline into the idle mode; may
+                return False to be retried later (e.g. camera still warming)
+            enter_cm: Distance below which someone is arriving
+            exit_cm: Distance above which a present visitor may be leaving
+            enter_seconds: Continuous evidence needed to confirm presence
+            exit_seconds: Time without evidence before going idle
+            face_hold: Seconds a detected face counts as evidence
+            idle_mode: 'watch', 'off' or 'full' (full never calls sleep)
+            resume_budget_ms: Resume latency target reported by stats()
+            history: Number of transitions kept for stats()
+        """
+        self._wake = wake
+        self._sleep = sleep
+        self.enter_cm = enter_cm
+        self.exit_cm = max(exit_cm, enter_cm)
+        self.enter_seconds = enter_seconds
+        self.exit_seconds = exit_seconds
+        self.face_hold = face_hold
+        self.idle_mode = idle_mode
+        self.resume_budget_ms = resume_budget_ms
+
+        self._lock = threading.RLock()
+        self._listeners = []
+        now = time.monotonic()
+        self.state = 'idle'
+        self.state_since = now
+        self.awake = True
+        self.distance = None
+        self._distance_time = None
+        self._last_face = None
+        self._last_evidence = now
+        self._evidence_since = None
+        self._switching = False
+
+        self._transitions = deque(maxlen=history)
+        self._time_in_state = dict.fromkeys(STATES, 0.0)
+        self._resumes = []
+        self.wakes = 0
+        self.sleeps = 0
+        self.over_budget = 0
+
+    def add_listener(self, func):
+        """Call func(state, previous, reason) after every state change"""
+        self._listeners.append(func)
+
+    def is_present(self):
+        """True while presence is confirmed (present or leaving)"""
+        return self.state in ('present', 'leaving')
+
+    # ---------- inputs ----------
+
+    def update_distance(self, distance, timestamp=None):
+        """
+        Feed a filtered distance reading
+
+        Args:
+            distance: Distance in cm, None if nothing is in range
+            timestamp: time.monotonic() of the sample (default now)
+        """
+        self.distance = distance
+        self._distance_time = time.monotonic() if timestamp is None else timestamp
+        self.evaluate(self._distance_time, 'distance')
+
+    def observe_faces(self, count, timestamp=None):
+        """Feed the face count of an analyzed frame"""
+        if count > 0:
+            self._last_face = time.monotonic() if timestamp is None else timestamp
+            self.evaluate(self._last_face, 'face')
+
+    # ---------- state machine ----------
+
+    def _evidence(self, now, threshold):
+        near = self.distance is not None and self.distance < threshold
+        face = self._last_face is not None and now - self._last_face <= self.face_hold
+        return near or face
+
+    def evaluate(self, now=None, reason='tick'):
+        """Advance the state machine; wakes / sleeps the pipeline as needed"""
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            previous = self.state
+            entering = self._evidence(now, self.enter_cm)
+            staying = self._evidence(now, self.exit_cm)
+            if staying:
+                self._last_evidence = now
+
+            if self.state == 'idle':
+                if entering:
+                    self._evidence_since = now
+                    self._set_state('arriving', now, reason)
+
+            elif self.state == 'arriving':
+                if not entering:
+                    self._set_state('idle', now, reason)
+                elif now - self._evidence_since >= self.enter_seconds:
+                    self._set_state('present', now, reason)
+
+            elif self.state == 'present':
+                if not staying:
+                    self._set_state('leaving', now, reason)
+
+            elif self.state == 'leaving':
+                if staying:
+                    self._set_state('present', now, reason)
+                elif now - self.state_since >= self.exit_seconds:
+                    self._set_state('idle', now, 'timeout')
+
+            # Sleep only after a full exit grace without evidence, so a
+            # noisy sample that woke the pipeline does not make it flap
+            wake = self.state != 'idle' and not self.awake and not self._switching
+            sleep = (
+                self.state == 'idle' and self.awake and not self._switching
+                and self.idle_mode != 'full'
+                and now - self._last_evidence >= self.exit_seconds
+            )
+            self._switching = wake or sleep
+            state = self.state
+
+        if wake:
+            self._run_wake(now)
+        elif sleep:
+            self._run_sleep()
+
+        if state != previous:
+            for listener in self._listeners:
+                try:
+                    listener(state, previous, reason)
+                except Exception as e:
+                    logger.error(f"❌ Presence listener error: {e}")
+        return state
+
+    def _set_state(self, state, now, reason):
+        self._time_in_state[self.state] += now - self.state_since
+        self._transitions.append({
+            'from': self.state,
+            'to': state,
+            'reason': reason,
+            'after_s': round(now - self.state_since, 3),
+            'distance': round(self.distance, 1) if self.distance is not None else None,
+            'at': int((time.time() - (time.monotonic() - now)) * 1000)
+        })
+        logger.info(f"👤 Presence {self.state} -> {state} ({reason})")
+        self.state = state
+        self.state_since = now
+
+    def _run_wake(self, since):
+        """Wake the pipeline; latency counts from the sample that triggered it"""
+        try:
+            if self._wake:
+                self._wake()
+        except Exception as e:
+            logger.error(f"❌ Pipeline wake failed: {e}")
+            self._switching = False
+            return
+        latency_ms = (time.monotonic() - since) * 1000
+        with self._lock:
+            self._switching = False
+            self.awake = True
+            self.wakes += 1
+            self._resumes.append(latency_ms)
+            del self._resumes[:-100]
+            if latency_ms > self.resume_budget_ms:
+                self.over_budget += 1
+                logger.warning(f"⚠️  Pipeline resume took {latency_ms:.0f}ms "
+                               f"(budget {self.resume_budget_ms:.0f}ms)")
+
+    def _run_sleep(self):
+        try:
+            if self._sleep and self._sleep() is False:
+                self._switching = False
+                return
+        except Exception as e:
+            logger.error(f"❌ Pipeline sleep failed: {e}")
+            self._switching = False
+            return
+        with self._lock:
+            self._switching = False
+            self.awake = False
+            self.sleeps += 1
+        logger.info(f"💤 Pipeline idle ({self.idle_mode})")
+
+    # ---------- reporting ----------
+
+    def stats(self):
+        """State, transition timings and resume latencies for /api/presence"""
+        now = time.monotonic()
+        with self._lock:
+            time_in_state = dict(self._time_in_state)
+            time_in_state[self.state] += now - self.state_since
+            resumes = list(self._resumes)
+            return {
+                'state': self.state,
+                'present': self.is_present(),
+                'state_for_s': round(now - self.state_since, 3),
+                'pipeline': 'full' if self.awake else self.idle_mode,
+                'distance': round(self.distance, 1) if self.distance is not None else None,
+                'last_face_s': round(now - self._last_face, 1) if self._last_face else None,
+                'time_in_state_s': {k: round(v, 1) for k, v in time_in_state.items()},
+                'transitions': list(self._transitions),
+                'wakes': self.wakes,
+                'sleeps': self.sleeps,
+                'resume_ms': {
+                    'last': round(resumes[-1], 1) if resumes else None,
+                    'avg': round(sum(resumes) / len(resumes), 1) if resumes else None,
+                    'max': round(max(resumes), 1) if resumes else None,
+                    'budget': self.resume_budget_ms,
+                    'over_budget': self.over_budget
+                },
+                'thresholds': {
+                    'enter_cm': self.enter_cm,
+                    'exit_cm': self.exit_cm,
+                    'enter_s': self.enter_seconds,
+                    'exit_s': self.exit_seconds,
+                    'face_hold_s': self.face_hold
+                }
+            }
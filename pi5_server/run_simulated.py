@@ -6,6 +6,14 @@ import random
 import io
 from PIL import Image, ImageDraw, ImageFont
 
+# Optional fast encoder (libjpeg-turbo) - falls back to PIL
+try:
+    import numpy as np
+    from image_encoders import get_encoder
+    jpeg_encoder = get_encoder(pixel_format='RGB')
+except ImportError:
+    jpeg_encoder = None
+
 app = Flask(__name__)
 CORS(app)
 
@@ -67,13 +75,16 @@ def snapshot():
         draw.rectangle([(240, 180), (400, 340)], outline=(0, 255, 0), width=3)
         draw.text((245, 160), "Face Detected", fill=(0, 255, 0))
         
-        # Convert to JPEG bytes
-        img_io = io.BytesIO()
-        img.save(img_io, 'JPEG', quality=85)
-        img_io.seek(0)
+        # Convert to JPEG bytes (straight from RGB, no BGR round trip)
+        if jpeg_encoder:
+            jpeg = jpeg_encoder.encode(np.asarray(img), 85, 'RGB')
+        else:
+            img_io = io.BytesIO()
+            img.save(img_io, 'JPEG', quality=85)
+            jpeg = img_io.getvalue()
         
         # Create response with no-cache headers
-        response = Response(img_io.getvalue(), mimetype='image/jpeg')
+        response = Response(jpeg, mimetype='image/jpeg')
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
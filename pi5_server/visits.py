@@ -0,0 +1,247 @@
+"""
+Visits
+Turns face tracks into visit records: one visit per person in front of
+the kiosk, from the first frame their track is seen to the last, with
+dwell time, the largest face box (how close they came) and the
+attributes seen during the visit (mean age, most frequent gender and
+emotion).
+
+- A track becomes a visit once seen for VISIT_MIN_SECONDS; shorter ones
+  are discarded as flicker and no event is sent for them
+- A visit ends VISIT_EXIT_SECONDS after its track was last seen. A new
+  track that appears close to where an unfinished visit was last seen
+  continues that visit (the tracker lost and re-detected the face)
+- 'enter' and 'exit' events go to listeners; closed visits are kept for
+  rolling counters over VISIT_WINDOWS and the last VISIT_HISTORY are
+  listed by the servers
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+VISIT_MIN_SECONDS = float(os.environ.get('VISIT_MIN_SECONDS', '1.0'))
+VISIT_EXIT_SECONDS = float(os.environ.get('VISIT_EXIT_SECONDS', '3.0'))
+VISIT_HISTORY = int(os.environ.get('VISIT_HISTORY', '200'))
+
+# Rolling counter windows (name -> seconds)
+VISIT_WINDOWS = {'5m': 300, '1h': 3600, '24h': 86400}
+
+
+class Visit:
+    """One person's stay, built up from their track"""
+
+    def __init__(self, visit_id, face, now):
+        self.visit_id = visit_id
+        self.track_ids = []
+        self.enter = now
+        self.last_seen = now
+        self.exit = None
+        self.frames = 0
+        self.confirmed = False
+        self.box = None
+        self.peak_box = None
+        self.ages = []
+        self.genders = Counter()
+        self.emotions = Counter()
+        self.add(face, now)
+
+    def add(self, face, now):
+        if face['track_id'] not in self.track_ids:
+            self.track_ids.append(face['track_id'])
+        self.last_seen = now
+        self.frames += 1
+        self.box = (face['x'], face['y'], face['width'], face['height'])
+        if self.peak_box is None or face['width'] * face['height'] > self.peak_box[2] * self.peak_box[3]:
+            self.peak_box = self.box
+
+        if face.get('age') is not None:
+            self.ages.append(face['age'])
+        if face.get('gender'):
+            self.genders[face['gender']] += 1
+        if face.get('emotion'):
+            self.emotions[face['emotion']] += 1
+
+    @property
+    def dwell(self):
+        return (self.exit or self.last_seen) - self.enter
+
+    def near(self, face):
+        """Whether face is centred within one face width of where this visit was last seen"""
+        x, y, w, h = self.box
+        dx = (face['x'] + face['width'] / 2) - (x + w / 2)
+        dy = (face['y'] + face['height'] / 2) - (y + h / 2)
+        return dx * dx + dy * dy <= max(w, face['width']) ** 2
+
+    def to_dict(self):
+        _, _, width, height = self.peak_box
+        return {
+            'visit_id': self.visit_id,
+            'track_ids': list(self.track_ids),
+            'enter': int(self.enter * 1000),
+            'exit': int(self.exit * 1000) if self.exit else None,
+            'dwell_s': round(self.dwell, 2),
+            'frames': self.frames,
+            'peak_face': {'width': width, 'height': height, 'area': width * height},
+            'age': round(sum(self.ages) / len(self.ages), 1) if self.ages else None,
+            'gender': self.genders.most_common(1)[0][0] if self.genders else None,
+            'emotion': self.emotions.most_common(1)[0][0] if self.emotions else None,
+            'emotions': dict(self.emotions)
+        }
+
+
+class VisitTracker:
+    """Visit records, enter / exit events and rolling counters from face tracks"""
+
+    def __init__(self, min_seconds=VISIT_MIN_SECONDS, exit_seconds=VISIT_EXIT_SECONDS,
+                 history=VISIT_HISTORY, windows=VISIT_WINDOWS):
+        """
+        Initialize the tracker
+
+        Args:
+            min_seconds: Time a track must be seen before it counts as a visit
+            exit_seconds: Time after the last sighting at which a visit ends
+            history: Closed visits listed by recent()
+            windows: Rolling counter windows {name: seconds}
+        """
+        self.min_seconds = min_seconds
+        self.exit_seconds = exit_seconds
+        self.windows = windows
+
+        self._open = {}  # track_id -> Visit
+        self._recent = deque(maxlen=history)
+        # (enter, dwell) of closed visits within the longest window
+        self._closed = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._listeners = []
+
+        self.visits = 0
+        self.discarded = 0
+        self.resumed = 0
+
+    def add_listener(self, func):
+        """Call func(event, visit_dict) for every 'enter' and 'exit'"""
+        self._listeners.append(func)
+
+    def _emit(self, events):
+        for event, visit in events:
+            for listener in self._listeners:
+                try:
+                    listener(event, visit)
+                except Exception as e:
+                    logger.error(f"❌ Visit listener error: {e}")
+
+    def observe(self, faces, timestamp=None):
+        """
+        Add the faces of one processed frame (frames without faces too)
+
+        Args:
+            faces: Face dicts with 'track_id' and box; 'age', 'gender' and
+                'emotion' are aggregated when present. Faces without a
+                track id are ignored.
+            timestamp: Unix time of the frame (default now)
+        """
+        now = time.time() if timestamp is None else timestamp
+        events = []
+        with self._lock:
+            # Every track in this frame, so a new one cannot take over the
+            # visit of a face that appears later in the same frame
+            seen = {face['track_id'] for face in faces if face.get('track_id') is not None}
+            for face in faces:
+                track_id = face.get('track_id')
+                if track_id is None:
+                    continue
+                visit = self._open.get(track_id)
+                if visit is None:
+                    visit = self._adopt(face, seen, now)
+                if visit is None:
+                    visit = Visit(None, face, now)
+                else:
+                    visit.add(face, now)
+                self._open[track_id] = visit
+
+                if not visit.confirmed and visit.dwell >= self.min_seconds:
+                    visit.confirmed = True
+                    visit.visit_id = next(self._ids)
+                    self.visits += 1
+                    events.append(('enter', visit.to_dict()))
+
+            events.extend(self._expire(now))
+        self._emit(events)
+
+    def _adopt(self, face, seen, now):
+        """An unfinished visit this new track continues, or None"""
+        for track_id, visit in self._open.items():
+            if track_id not in seen and visit.last_seen < now and visit.near(face):
+                del self._open[track_id]
+                self.resumed += 1
+                return visit
+        return None
+
+    def _expire(self, now):
+        events = []
+        for track_id, visit in list(self._open.items()):
+            if now - visit.last_seen < self.exit_seconds:
+                continue
+            del self._open[track_id]
+            if not visit.confirmed:
+                self.discarded += 1
+                continue
+            visit.exit = visit.last_seen
+            record = visit.to_dict()
+            self._recent.append(record)
+            self._closed.append((visit.enter, visit.dwell))
+            events.append(('exit', record))
+
+        horizon = now - max(self.windows.values())
+        while self._closed and self._closed[0][0] < horizon:
+            self._closed.popleft()
+        return events
+
+    def expire(self, now=None):
+        """End visits whose track has not been seen for exit_seconds"""
+        now = time.time() if now is None else now
+        with self._lock:
+            events = self._expire(now)
+        self._emit(events)
+
+    def current(self):
+        """Confirmed visits still in progress"""
+        with self._lock:
+            return [visit.to_dict() for visit in self._open.values() if visit.confirmed]
+
+    def recent(self, limit=None):
+        """Closed visits, newest first"""
+        with self._lock:
+            visits = list(self._recent)[::-1]
+        return visits[:limit] if limit else visits
+
+    def counters(self, now=None):
+        """Visits entered and mean dwell of the closed ones, per rolling window"""
+        now = time.time() if now is None else now
+        with self._lock:
+            closed = list(self._closed)
+            present = [visit for visit in self._open.values() if visit.confirmed]
+        counters = {'present': len(present), 'total': self.visits}
+        for name, seconds in self.windows.items():
+            since = now - seconds
+            dwells = [dwell for enter, dwell in closed if enter >= since]
+            counters[name] = {
+                'visits': len(dwells) + sum(1 for visit in present if visit.enter >= since),
+                'avg_dwell_s': round(sum(dwells) / len(dwells), 1) if dwells else None
+            }
+        return counters
+
+    def stats(self):
+        return {
+            'visits': self.visits,
+            'open': len(self._open),
+            'discarded': self.discarded,
+            'resumed': self.resumed
+        }
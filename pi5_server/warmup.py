@@ -0,0 +1,135 @@
+"""
+Startup Warm-up
+Heavy subsystems (camera, TensorFlow / DeepFace models, face detector) are
+brought up in background threads when the server boots, so Flask accepts
+requests within a second and no user request pays for a cold start.
+Every subsystem reports its state for the /api/ready endpoint, together
+with how long the imports and each warm-up step took.
+
+States: pending -> warming -> ready | failed
+"""
+
+import importlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Close enough to process start: the servers import this module first
+PROCESS_START = time.monotonic()
+
+
+class Subsystem:
+    """Warm-up state of one subsystem"""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.state = 'pending'
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        duration = None
+        if self.started is not None:
+            duration = round((self.finished or time.monotonic()) - self.started, 3)
+        return {
+            'state': self.state,
+            'duration_s': duration,
+            'ready_after_s': round(self.finished - PROCESS_START, 3)
+            if self.state == 'ready' else None,
+            'error': self.error
+        }
+
+
+class Warmup:
+    """Runs registered warm-up steps in background threads"""
+
+    def __init__(self):
+        self._subsystems = OrderedDict()
+        self._imports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name, func):
+        """
+        Register a warm-up step
+
+        Args:
+            name: Subsystem name shown by /api/ready
+            func: Callable doing the work; a False return or an exception
+                marks the subsystem failed
+        """
+        with self._lock:
+            self._subsystems[name] = Subsystem(name, func)
+
+    def start(self):
+        """Start every pending step in its own daemon thread"""
+        with self._lock:
+            pending = [s for s in self._subsystems.values() if s.state == 'pending']
+            for subsystem in pending:
+                subsystem.state = 'warming'
+                subsystem.started = time.monotonic()
+        for subsystem in pending:
+            threading.Thread(target=self._run, args=(subsystem,),
+                             name=f"warmup-{subsystem.name}", daemon=True).start()
+
+    def _run(self, subsystem):
+        try:
+            ok = subsystem.func()
+            subsystem.state = 'failed' if ok is False else 'ready'
+        except Exception as e:
+            subsystem.error = str(e)
+            subsystem.state = 'failed'
+            logger.error(f"❌ Warm-up of {subsystem.name} failed: {e}")
+        subsystem.finished = time.monotonic()
+        subsystem.done.set()
+        if subsystem.state == 'ready':
+            logger.info(f"✅ {subsystem.name} ready in "
+                        f"{subsystem.finished - subsystem.started:.1f}s")
+
+    def state(self, name):
+        """State of one subsystem (None if it was never registered)"""
+        subsystem = self._subsystems.get(name)
+        return subsystem.state if subsystem else None
+
+    def is_ready(self, name=None):
+        """True once one subsystem (or every subsystem) is ready"""
+        subsystems = [self._subsystems[name]] if name else list(self._subsystems.values())
+        return all(s.state == 'ready' for s in subsystems)
+
+    def wait(self, name, timeout=None):
+        """Block until a subsystem finished warming; True if it is ready"""
+        subsystem = self._subsystems.get(name)
+        if subsystem is None:
+            return False
+        if subsystem.state != 'pending':
+            subsystem.done.wait(timeout)
+        return subsystem.state == 'ready'
+
+    def record_import(self, name, seconds):
+        """Add an import duration measured elsewhere to the report"""
+        self._imports[name] = round(seconds, 3)
+
+    def timed_import(self, module_name):
+        """Import a module and record how long it took"""
+        started = time.monotonic()
+        module = importlib.import_module(module_name)
+        self._imports.setdefault(module_name, round(time.monotonic() - started, 3))
+        return module
+
+    def report(self):
+        """Readiness and timing report for /api/ready"""
+        subsystems = {name: s.to_dict() for name, s in self._subsystems.items()}
+        finished = [s.finished for s in self._subsystems.values() if s.state == 'ready']
+        ready = self.is_ready()
+        return {
+            'ready': ready,
+            'subsystems': subsystems,
+            'imports_s': dict(self._imports),
+            'uptime_s': round(time.monotonic() - PROCESS_START, 3),
+            'startup_s': round(max(finished) - PROCESS_START, 3) if ready and finished else None
+        }